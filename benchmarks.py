@@ -0,0 +1,585 @@
+"""
+Benchmarks for the model generation and post processing hot paths.
+
+Run with `python benchmarks.py`. None of the benchmarks need Marc or Mentat:
+the post processing runs on fake_py_post files and the designs are random.
+The script times every stage and measures its peak memory. `--save-baseline`
+keeps the results and `--compare` flags the stages that got slower, or use
+more memory, than the baseline by more than `--threshold`.
+
+The fake workloads below are shared with the tests in tests/, which check
+that the fast implementations give the same results as the ones they
+replace (`python -m pytest`).
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import fake_py_post
+from create_model import (
+    create_rectangle,
+    create_rectangles,
+    write_proc_shards,
+)
+from create_rectangle_proc_dat import (
+    create_rectangle_proc_dat,
+    create_rectangle_proc_dat_old,
+    write_rectangle_procs,
+)
+from quad_mesher import mesh_unit_cell
+from results_store import ResultsStore
+
+
+def random_designs(n_designs: int, seed: int = 0) -> np.ndarray:
+    """
+    Create random (mostly valid) rectangle designs.
+
+    Args:
+        n_designs: (int) The number of designs.
+        seed: (int) The random seed.
+
+    Returns:
+        designs: (array) (n_designs, 5) array of
+            (center_x, center_y, aspect_ratio, rotation, area).
+    """
+    rng = np.random.default_rng(seed)
+    return np.column_stack(
+        [
+            rng.uniform(8, 17, n_designs),
+            rng.uniform(8, 17, n_designs),
+            rng.uniform(1, 4, n_designs),
+            rng.uniform(-90, 90, n_designs),
+            rng.uniform(5, 40, n_designs),
+        ]
+    )
+
+
+def import_post_process():
+    """
+    Import py_post_process, with fake_py_post standing in for py_post if
+        Marc is not installed.
+
+    Returns:
+        py_post_process: The module.
+    """
+    try:
+        import py_post
+    except ImportError:
+        sys.modules["py_post"] = fake_py_post
+    import py_post_process
+
+    return py_post_process
+
+
+def fake_mesh(n_nodes: int, seed: int = 0, unit_size: float = 25.0) -> np.ndarray:
+    """
+    Create the node coordinates of a fake unit cell mesh: a regular grid with
+        the interior nodes jittered, in a shuffled order.
+
+    Args:
+        n_nodes: (int) The approximate number of nodes.
+        seed: (int) The random seed.
+        unit_size: (float) The size of the unit cell.
+
+    Returns:
+        coordinates: (np.ndarray) The (N, 3) node coordinates.
+    """
+    rng = np.random.default_rng(seed)
+    n_side = max(2, int(round(np.sqrt(n_nodes))))
+    x, y = np.meshgrid(*2 * [np.linspace(0, unit_size, n_side)])
+    coordinates = np.column_stack([x.ravel(), y.ravel(), np.zeros(x.size)])
+    interior = np.all(
+        (coordinates[:, :2] > 0) & (coordinates[:, :2] < unit_size), axis=1
+    )
+    step = unit_size / (n_side - 1)
+    coordinates[interior, :2] += rng.uniform(-0.3, 0.3, (interior.sum(), 2)) * step
+    return coordinates[rng.permutation(len(coordinates))]
+
+
+def fake_post_file(n_nodes: int = 2000, n_incs: int = 90, seed: int = 0):
+    """
+    Create a fake post file with random displacements and uneven times.
+
+    Args:
+        n_nodes: (int) The approximate number of nodes.
+        n_incs: (int) The number of increments after increment 0.
+        seed: (int) The random seed.
+
+    Returns:
+        t_16_file: (fake_py_post.PostFile) The fake post file.
+    """
+    rng = np.random.default_rng(seed)
+    coordinates = fake_mesh(n_nodes, seed)
+    displacements = rng.normal(size=(n_incs, len(coordinates), 3))
+    times = np.cumsum(rng.uniform(0.1, 1.0, n_incs))
+    return fake_py_post.PostFile(coordinates, displacements, times / times[-1])
+
+
+def write_fake_results(
+    directory: str, n_sims: int, n_nodes: int = 2000, n_incs: int = 5
+):
+    """
+    Write fake .t16 and .sts files of `n_sims` simulations. Simulation 1 is
+        missing, simulation 2 failed and the .t16 file of simulation 3 is
+        corrupt.
+
+    Args:
+        directory: (str) Where to write the files.
+        n_sims: (int) The number of simulations, at least 4.
+        n_nodes: (int) The approximate number of nodes per simulation.
+        n_incs: (int) The number of increments per simulation.
+    """
+    for iteration in range(n_sims):
+        base_name = os.path.join(directory, f"example_model_{iteration}")
+        if iteration == 1:
+            continue
+        t_16_file = fake_post_file(n_nodes, n_incs, seed=iteration)
+        fake_py_post.write_fake_t16(
+            f"{base_name}.t16",
+            t_16_file._coordinates,
+            t_16_file._displacements[1:],
+        )
+        exit_number = 13 if iteration == 2 else 3004
+        with open(f"{base_name}.sts", "w") as file:
+            file.write(f" Job ends with exit number :    {exit_number}\n")
+        if iteration == 3:
+            with open(f"{base_name}.t16", "wb") as file:
+                file.write(b"not a post file")
+
+
+def fake_outputs(designs: np.ndarray, n_targets: int = 100) -> np.ndarray:
+    """
+    Rows of a results store that depend smoothly on the designs, a stand-in
+        for the final positions of the boundary node targets.
+
+    Args:
+        designs: (np.ndarray) The (N, 5) designs.
+        n_targets: (int) The number of node targets.
+
+    Returns:
+        outputs: (np.ndarray) The (N, 2 * n_targets) rows.
+    """
+    s = np.linspace(0, 2 * np.pi, n_targets, endpoint=False)
+    base = np.concatenate([12.5 + 12.5 * np.cos(s), 12.5 + 12.5 * np.sin(s)])
+    area = designs[:, 4:5] / 625
+    shape = np.log(designs[:, 2:3]) * np.cos(np.radians(2 * designs[:, 3:4]))
+    offset = (designs[:, 0:1] - 12.5) / 25
+    bulge = np.concatenate([np.cos(s), np.sin(s)])
+    squash = np.concatenate([np.cos(s) * np.cos(2 * s), np.sin(s) * np.cos(2 * s)])
+    shift = np.concatenate([np.ones(n_targets), np.zeros(n_targets)])
+    return (
+        base
+        + 2 * area * bulge
+        + 0.5 * area * shape * squash
+        + 0.3 * offset * area * shift
+    )
+
+
+STRAIN_DESIGN = (12.5, 12.5, 1.5, 20.0, 60.0)
+
+
+def fake_strain_post_file(design=STRAIN_DESIGN, n_incs: int = 3, seed: int = 0):
+    """
+    A fake post file of a meshed unit with a log strain field that peaks at
+        the cavity corners, and most at corner 0.
+
+    Args:
+        design: The design, center_x, center_y, aspect_ratio, rotation, area.
+        n_incs: (int) The number of increments (after increment 0).
+        seed: (int) The seed of the noise on the strains.
+
+    Returns:
+        t_16_file: (PostFile) The fake post file.
+        corners: (np.ndarray) The (4, 2) cavity corners.
+    """
+    rng = np.random.default_rng(seed)
+    corners = create_rectangles([design])[0][0]
+    coordinates, connectivity, _ = mesh_unit_cell(corners[:, 0], corners[:, 1], 0.5)
+    coordinates = np.column_stack([coordinates, np.zeros(len(coordinates))])
+    connectivity = connectivity - 1
+    centroids = coordinates[connectivity].mean(axis=1)
+
+    distance = np.hypot(*(centroids[:, None, :2] - corners[None]).transpose(2, 0, 1))
+    peak = (np.exp(-(distance**2)) * [2.0, 1.0, 1.0, 1.0]).sum(axis=1)
+    scale = np.linspace(0, 0.1, n_incs + 1)[1:, None, None]
+    n_points = 4
+    shape = (n_incs, len(connectivity), n_points)
+    xx = scale * (peak[None, :, None] + 0.01 * rng.random(shape))
+    yy = -0.3 * xx + 0.01 * scale * rng.standard_normal(shape)
+    xy = 0.2 * xx + 0.01 * scale * rng.standard_normal(shape)
+    zeros = np.zeros(shape)
+    tensors = np.stack([xx, yy, -(xx + yy), xy, zeros, zeros], axis=-1)
+
+    displacements = np.zeros((n_incs, len(coordinates), 3))
+    t_16_file = fake_py_post.PostFile(
+        coordinates,
+        displacements,
+        connectivity=connectivity,
+        element_tensors={"Stress": 2 * tensors, "Total Strain": tensors},
+    )
+    return t_16_file, corners
+
+
+def write_design_csv(file_name: str, n_designs: int, seed: int = 0):
+    """
+    Write a design csv file like Rectangle_inputs.csv with random designs.
+
+    Args:
+        file_name: (str) The csv file name.
+        n_designs: (int) The number of designs (rows).
+        seed: (int) The random seed.
+    """
+    np.savetxt(file_name, random_designs(n_designs, seed), fmt="%.6f", delimiter=",")
+
+
+# Every stage takes the problem sizes and a scratch directory, and returns a
+# function that runs the stage once and the number of items it processes.
+# A stage returns None if it is too slow for the sizes.
+
+
+def _sampler_stage(method: str):
+    def stage(sizes: dict, directory: str):
+        import design_sampler
+
+        run = lambda: design_sampler.sample_designs(
+            sizes["designs"], method, min_ligament=0.5
+        )
+        return run, sizes["designs"]
+
+    return stage
+
+
+def _stage_create_rectangle(sizes: dict, directory: str):
+    designs = random_designs(sizes["designs"]).tolist()
+
+    def run():
+        for design in designs:
+            create_rectangle(*design[:2], *design[2:])
+
+    return run, len(designs)
+
+
+def _stage_create_rectangles(sizes: dict, directory: str):
+    designs = random_designs(sizes["designs"])
+    return lambda: create_rectangles(designs), len(designs)
+
+
+def _proc_stage(function):
+    def stage(sizes: dict, directory: str):
+        vertices, _ = create_rectangles(random_designs(sizes["designs"]))
+        x_vals = vertices[:, :, 0].tolist()
+        y_vals = vertices[:, :, 1].tolist()
+        names = [f"example_model_{i}" for i in range(len(x_vals))]
+        proc_file_name = os.path.join(directory, function.__name__)
+
+        def run():
+            if os.path.isfile(f"{proc_file_name}.proc"):
+                os.remove(f"{proc_file_name}.proc")
+            for i in range(len(x_vals)):
+                function(
+                    x_vals[i],
+                    y_vals[i],
+                    0.5,
+                    0.025,
+                    0.001,
+                    10.0,
+                    proc_file_name,
+                    names[i],
+                )
+
+        return run, len(names)
+
+    return stage
+
+
+def _stage_write_rectangle_procs(sizes: dict, directory: str):
+    vertices, _ = create_rectangles(random_designs(sizes["designs"]))
+    names = [f"example_model_{i}" for i in range(len(vertices))]
+
+    def run():
+        with open(os.path.join(directory, "batch.proc"), "w") as file:
+            write_rectangle_procs(
+                file, vertices[:, :, 0], vertices[:, :, 1], 0.5, 0.025, 0.001, names
+            )
+
+    return run, len(names)
+
+
+def _stage_csv_to_proc_shards(sizes: dict, directory: str):
+    design_file = os.path.join(directory, "designs.csv")
+    write_design_csv(design_file, sizes["designs"])
+    proc_dir = os.path.join(directory, "shards")
+    os.makedirs(proc_dir, exist_ok=True)
+
+    def run():
+        write_proc_shards(design_file, 4, "config.ini", proc_dir, processes=1)
+
+    return run, sizes["designs"]
+
+
+def _closest_node_stage(name: str, max_work: float = None):
+    def stage(sizes: dict, directory: str):
+        if max_work is not None and sizes["nodes"] * sizes["targets"] > max_work:
+            return None
+        post = import_post_process()
+        coordinates = fake_mesh(sizes["nodes"])
+        t_16_file = fake_py_post.PostFile(
+            coordinates, np.zeros((1, *coordinates.shape))
+        )
+        node_targets = post.set_up_node_targets(intervals=max(2, sizes["targets"] // 4))
+        function = getattr(post, name)
+        return lambda: function(t_16_file, node_targets), len(node_targets)
+
+    return stage
+
+
+def _node_position_stage(increments):
+    def stage(sizes: dict, directory: str):
+        post = import_post_process()
+        t_16_file = fake_post_file(sizes["nodes"], sizes["increments"])
+        node_targets = post.set_up_node_targets(intervals=max(2, sizes["targets"] // 4))
+        nodes = [int(i[-1]) for i in post.find_closest_node(t_16_file, node_targets)]
+        run = lambda: post.get_node_position(t_16_file, nodes, increments)
+        return run, len(post.select_increments(t_16_file, increments))
+
+    return stage
+
+
+def _stage_write_node_history(sizes: dict, directory: str):
+    post = import_post_process()
+    t_16_file = fake_post_file(sizes["nodes"], sizes["increments"])
+    file_name = os.path.join(directory, "history.npy")
+    return lambda: post.write_node_history(t_16_file, file_name), sizes["increments"]
+
+
+def _stage_write_positions_text(sizes: dict, directory: str):
+    post = import_post_process()
+    positions = np.random.default_rng(0).uniform(0, 25, (sizes["targets"], 3))
+    text_file = os.path.join(directory, "positions.txt")
+
+    def run():
+        if os.path.isfile(text_file):
+            os.remove(text_file)
+        for _ in range(sizes["sims"]):
+            post._write_positions_to_file(positions, text_file)
+
+    return run, sizes["sims"]
+
+
+def _stage_results_store(sizes: dict, directory: str):
+    positions = np.random.default_rng(0).uniform(0, 25, (sizes["targets"], 3))
+    store_file = os.path.join(directory, "store.npy")
+
+    def run():
+        for file_name in (store_file, store_file.replace(".npy", "_status.npy")):
+            if os.path.isfile(file_name):
+                os.remove(file_name)
+        store = ResultsStore(store_file, sizes["sims"], 2 * sizes["targets"])
+        for iteration in range(sizes["sims"]):
+            store.write(iteration, positions)
+        store.flush()
+
+    return run, sizes["sims"]
+
+
+def _stage_element_strains(sizes: dict, directory: str):
+    import strain_reductions
+
+    post = import_post_process()
+    t_16_file, corners = fake_strain_post_file(n_incs=5)
+
+    def run():
+        tensors = post.get_element_tensors(t_16_file, "log_strain", increments=None)
+        centroids, element_ids = post.get_element_centroids(t_16_file)
+        for increment in tensors:
+            strain_reductions.summarise_strains(
+                increment, centroids, element_ids, corners
+            )
+
+    return run, 5 * t_16_file.elements()
+
+
+def _stage_post_process_parallel(sizes: dict, directory: str):
+    post = import_post_process()
+    results_dir = os.path.join(directory, "results")
+    os.makedirs(results_dir, exist_ok=True)
+    write_fake_results(results_dir, max(4, sizes["sims"]), sizes["nodes"], n_incs=5)
+    output_file = os.path.join(results_dir, "Example_ouput_file.txt")
+
+    def run():
+        if os.path.isfile(output_file):
+            os.remove(output_file)
+        post.post_process_parallel(range(max(4, sizes["sims"])), results_dir)
+
+    return run, max(4, sizes["sims"])
+
+
+STAGES = {
+    "sample_sobol": _sampler_stage("sobol"),
+    "sample_lhs": _sampler_stage("lhs"),
+    "create_rectangle": _stage_create_rectangle,
+    "create_rectangles": _stage_create_rectangles,
+    "create_rectangle_proc_dat_old": _proc_stage(create_rectangle_proc_dat_old),
+    "create_rectangle_proc_dat": _proc_stage(create_rectangle_proc_dat),
+    "write_rectangle_procs": _stage_write_rectangle_procs,
+    "csv_to_proc_shards": _stage_csv_to_proc_shards,
+    "find_closest_node": _closest_node_stage("find_closest_node"),
+    "find_closest_node_vectorised": _closest_node_stage(
+        "find_closest_node_vectorised", 10**9
+    ),
+    "find_closest_node_old": _closest_node_stage("find_closest_node_old", 2 * 10**6),
+    "get_node_position_all": _node_position_stage(None),
+    "get_node_position_last": _node_position_stage("last"),
+    "write_node_history": _stage_write_node_history,
+    "write_positions_text": _stage_write_positions_text,
+    "results_store": _stage_results_store,
+    "element_strains": _stage_element_strains,
+    "post_process_parallel": _stage_post_process_parallel,
+}
+
+
+def run_benchmarks(
+    sizes: dict, stages: list = None, memory: bool = True, repeat: int = 3
+) -> dict:
+    """
+    Time the stages and measure their peak memory.
+        Each stage is timed `repeat` times, keeping the fastest run, and with
+        `memory` run once more under tracemalloc for the peak memory, as
+        tracing slows it down.
+
+    Args:
+        sizes: (dict) The problem sizes: designs, nodes, increments, targets
+            and sims.
+        stages: (list) The names of the stages to run, all by default.
+        memory: (bool) Measure the peak memory (of this process only, not
+            of pool workers).
+        repeat: (int) The number of timed runs of each stage.
+
+    Returns:
+        results: (dict) For each stage that was run the items it processed,
+            seconds, throughput (items/s) and peak_mb (None without memory).
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in stages or STAGES:
+            stage = STAGES[name](sizes, directory)
+            if stage is None:
+                continue
+            run, n_items = stage
+
+            start = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - start
+
+            for _ in range(repeat - 1):
+                start = time.perf_counter()
+                run()
+                seconds = min(seconds, time.perf_counter() - start)
+
+            peak_mb = None
+            if memory:
+                tracemalloc.start()
+                run()
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+
+            results[name] = {
+                "items": n_items,
+                "seconds": seconds,
+                "throughput": n_items / seconds,
+                "peak_mb": peak_mb,
+            }
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float = 0.2) -> list:
+    """
+    Find the stages that got worse than the baseline.
+
+    Args:
+        results: (dict) The results of `run_benchmarks`.
+        baseline: (dict) The baseline results.
+        threshold: (float) The allowed relative loss of throughput, or gain
+            of peak memory, e.g. 0.2 for 20 %.
+
+    Returns:
+        regressions: (list) A message for every regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if result["throughput"] < old["throughput"] / (1 + threshold):
+            regressions.append(
+                f"{name}: {result['throughput']:.4g} items/s, "
+                f"baseline {old['throughput']:.4g} items/s"
+            )
+        # small allocations are noise
+        if (
+            result["peak_mb"] is not None
+            and old["peak_mb"] is not None
+            and result["peak_mb"] > old["peak_mb"] * (1 + threshold) + 1
+        ):
+            regressions.append(
+                f"{name}: {result['peak_mb']:.1f} MB peak, baseline {old['peak_mb']:.1f} MB"
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--designs", type=int, default=10000)
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--increments", type=int, default=90)
+    parser.add_argument("--targets", type=int, default=200)
+    parser.add_argument("--sims", type=int, default=100)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    sizes = {
+        "designs": args.designs,
+        "nodes": args.nodes,
+        "increments": args.increments,
+        "targets": args.targets,
+        "sims": args.sims,
+    }
+    results = run_benchmarks(sizes, args.stages, not args.no_memory, args.repeat)
+
+    print(
+        f"{'stage':32s} {'items':>9s} {'seconds':>9s} {'items/s':>12s} {'peak MB':>9s}"
+    )
+    for name, result in results.items():
+        peak = "" if result["peak_mb"] is None else f"{result['peak_mb']:9.1f}"
+        print(
+            f"{name:32s} {result['items']:9d} {result['seconds']:9.3f} "
+            f"{result['throughput']:12.1f} {peak:>9s}"
+        )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump({"sizes": sizes, "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline["sizes"] != sizes:
+            print(f"warning: the baseline was run with {baseline['sizes']}")
+        regressions = compare_to_baseline(results, baseline["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {100 * args.threshold:.0f} %")
@@ -0,0 +1,297 @@
+"""
+Keep track of where every design of a campaign is in the pipeline.
+
+The index is a SQLite file with one row per design: whether its .proc, .dat
+and .t16 files have been written, the exit number and wall/cpu time of its
+Marc job and whether it has been post processed. `refresh_index` brings it up
+to date with one scan of the results directory, and only reads the tail of the
+.sts files that changed since the last refresh. Each stage of the pipeline can
+then ask for the designs it still has to do with `pending`. A design is post
+processed from the time it is marked (post_processed holds that time.time(),
+0 if it is not) until its .sts file changes after that, i.e. it is solved
+again.
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import numpy as np
+from marc_sts import SUCCESS_EXIT_NUMBER, read_sts_footer
+
+_FILE_NAME = re.compile(r"example_model_(\d+)\.(proc|dat|sts|t16)$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS designs (
+    design INTEGER PRIMARY KEY,
+    proc_written INTEGER NOT NULL DEFAULT 0,
+    dat_written INTEGER NOT NULL DEFAULT 0,
+    t16_written INTEGER NOT NULL DEFAULT 0,
+    exit_number INTEGER,
+    wall_time REAL,
+    cpu_time REAL,
+    sts_size INTEGER,
+    sts_mtime REAL,
+    post_processed INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# The designs each stage still has to do.
+_PENDING = {
+    "mentat": "proc_written AND NOT dat_written",
+    "marc": "(proc_written OR dat_written) AND exit_number IS NULL",
+    "post_process": f"exit_number = {SUCCESS_EXIT_NUMBER} AND t16_written "
+    "AND NOT post_processed",
+}
+
+
+def open_index(index_file: str = "campaign.sqlite") -> sqlite3.Connection:
+    """
+    Open (or create) a campaign index.
+
+    Args:
+        index_file: (str) The SQLite file name.
+
+    Returns:
+        connection: (sqlite3.Connection) The open index.
+    """
+    connection = sqlite3.connect(index_file)
+    connection.execute(_SCHEMA)
+    return connection
+
+
+def refresh_index(
+    connection: sqlite3.Connection,
+    directory: str = "marcmentat_files",
+    store_file: str = None,
+) -> int:
+    """
+    Bring the index up to date with the files in a directory.
+        The directory is scanned once. The .sts footer is only read for
+        files whose size or modification time changed. Designs in a
+        shards_manifest.json count as having their .proc written, as do
+        designs marked with `mark_proc_written`. With a results store, the
+        designs it holds count as post processed, otherwise post processed
+        designs are kept as they were marked, unless their .sts file was
+        written after they were marked.
+
+    Args:
+        connection: (sqlite3.Connection) The index.
+        directory: (str) The directory with the .proc, .dat, .sts and .t16
+            files.
+        store_file: (str) Optional results store (see results_store.py).
+
+    Returns:
+        n_read: (int) The number of .sts files that were read.
+    """
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = _FILE_NAME.match(entry.name)
+            if match:
+                design = int(match.group(1))
+                files.setdefault(design, {})[match.group(2)] = entry
+
+    sharded = set()
+    manifest_file = os.path.join(directory, "shards_manifest.json")
+    if os.path.isfile(manifest_file):
+        with open(manifest_file) as file:
+            for shard in json.load(file)["shards"]:
+                if os.path.isfile(os.path.join(directory, shard["proc_file"])):
+                    sharded.update(shard["designs"])
+
+    post_processed = None
+    if store_file is not None:
+        from results_store import STATUS_DONE
+
+        status = np.load(os.path.splitext(store_file)[0] + "_status.npy")
+        post_processed = set(np.flatnonzero(status == STATUS_DONE).tolist())
+
+    known = {
+        row[0]: row[1:]
+        for row in connection.execute(
+            "SELECT design, exit_number, wall_time, cpu_time, sts_size, sts_mtime, "
+            "post_processed, proc_written FROM designs"
+        )
+    }
+
+    rows = []
+    n_read = 0
+    for design in sorted(set(files) | sharded | set(known) | (post_processed or set())):
+        found = files.get(design, {})
+        exit_number = wall_time = cpu_time = sts_size = sts_mtime = None
+        old = known.get(design, (None,) * 5 + (0, 0))
+        if "sts" in found:
+            stat = found["sts"].stat()
+            sts_size, sts_mtime = stat.st_size, stat.st_mtime
+            if (sts_size, sts_mtime) == old[3:5]:
+                exit_number, wall_time, cpu_time = old[:3]
+            else:
+                if old[5] and sts_mtime > old[5]:
+                    # solved again, the post processing is out of date
+                    old = old[:5] + (0,) + old[6:]
+                footer = read_sts_footer(found["sts"].path)
+                exit_number = footer["exit_number"]
+                wall_time, cpu_time = footer["wall_time"], footer["cpu_time"]
+                n_read += 1
+        if post_processed is None:
+            done = old[5]
+        else:
+            done = time.time() if design in post_processed else 0
+        rows.append(
+            (
+                design,
+                int("proc" in found or design in sharded or old[6]),
+                int("dat" in found),
+                int("t16" in found),
+                exit_number,
+                wall_time,
+                cpu_time,
+                sts_size,
+                sts_mtime,
+                done,
+            )
+        )
+
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO designs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    return n_read
+
+
+def _mark(connection: sqlite3.Connection, column: str, designs, value=1):
+    """Set a flag of designs, adding the designs that are not indexed yet."""
+    with connection:
+        connection.executemany(
+            f"INSERT INTO designs (design, {column}) VALUES (?, ?) "
+            f"ON CONFLICT (design) DO UPDATE SET {column} = excluded.{column}",
+            [(int(design), value) for design in designs],
+        )
+
+
+def mark_proc_written(connection: sqlite3.Connection, designs):
+    """
+    Record that the .proc files of designs have been written, e.g. by
+        create_model.py, without waiting for the next refresh.
+
+    Args:
+        connection: (sqlite3.Connection) The index.
+        designs: The design indices.
+    """
+    _mark(connection, "proc_written", designs)
+
+
+def mark_post_processed(connection: sqlite3.Connection, designs):
+    """
+    Record that designs have been post processed, now. If the .sts file
+        of a design changes after this, `refresh_index` clears it again.
+
+    Args:
+        connection: (sqlite3.Connection) The index.
+        designs: The design indices.
+    """
+    _mark(connection, "post_processed", designs, time.time())
+
+
+def pending(connection: sqlite3.Connection, stage: str) -> list:
+    """
+    List the designs a stage still has to do.
+
+    Args:
+        connection: (sqlite3.Connection) The index.
+        stage: (str) "mentat" (.proc written, no .dat), "marc" (no exit
+            number yet) or "post_process" (solved, not post processed).
+
+    Returns:
+        designs: (list) The design indices, in order.
+    """
+    if stage not in _PENDING:
+        raise ValueError(f"stage must be one of {tuple(_PENDING)}, not {stage!r}")
+    query = f"SELECT design FROM designs WHERE {_PENDING[stage]} ORDER BY design"
+    return [row[0] for row in connection.execute(query)]
+
+
+def completed_runs(connection: sqlite3.Connection) -> dict:
+    """
+    The wall and cpu times of the jobs that finished successfully.
+
+    Args:
+        connection: (sqlite3.Connection) The index.
+
+    Returns:
+        runs: (dict) design, wall_time and cpu_time arrays, in design order.
+            The cpu time stands in for a missing wall time.
+    """
+    rows = connection.execute(f"""
+        SELECT design, COALESCE(wall_time, cpu_time), cpu_time
+        FROM designs
+        WHERE exit_number = {SUCCESS_EXIT_NUMBER}
+            AND COALESCE(wall_time, cpu_time) > 0
+        ORDER BY design
+        """).fetchall()
+    columns = list(zip(*rows)) or [(), (), ()]
+    return {
+        "design": np.array(columns[0], dtype=np.int64),
+        "wall_time": np.array(columns[1], dtype=float),
+        "cpu_time": np.array(columns[2], dtype=float),
+    }
+
+
+def progress(connection: sqlite3.Connection) -> dict:
+    """
+    Count the designs at each stage of the campaign.
+
+    Args:
+        connection: (sqlite3.Connection) The index.
+
+    Returns:
+        counts: (dict) designs, proc_written, dat_written, solved, succeeded,
+            failed, post_processed, and the total wall_time and cpu_time (s)
+            of the finished jobs.
+    """
+    row = connection.execute(f"""
+        SELECT
+            COUNT(*),
+            TOTAL(proc_written),
+            TOTAL(dat_written),
+            COUNT(exit_number),
+            TOTAL(exit_number = {SUCCESS_EXIT_NUMBER}),
+            TOTAL(exit_number != {SUCCESS_EXIT_NUMBER}),
+            TOTAL(post_processed > 0),
+            TOTAL(wall_time),
+            TOTAL(cpu_time)
+        FROM designs
+        """).fetchone()
+    keys = (
+        "designs",
+        "proc_written",
+        "dat_written",
+        "solved",
+        "succeeded",
+        "failed",
+        "post_processed",
+    )
+    counts = {key: int(value) for key, value in zip(keys, row)}
+    counts["wall_time"], counts["cpu_time"] = row[-2], row[-1]
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh and report a campaign.")
+    parser.add_argument("--index", default="campaign.sqlite")
+    parser.add_argument("--directory", default="marcmentat_files")
+    parser.add_argument("--store", default=None, help="The results store .npy file.")
+    args = parser.parse_args()
+
+    connection = open_index(args.index)
+    n_read = refresh_index(connection, args.directory, args.store)
+    counts = progress(connection)
+    print(f"read {n_read} new .sts files")
+    for key, value in counts.items():
+        print(f"{key:16s} {value:12.0f}")
+    for stage in _PENDING:
+        print(f"pending {stage:12s} {len(pending(connection, stage)):8d}")
+    connection.close()
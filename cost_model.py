@@ -0,0 +1,356 @@
+"""
+Predict the solve time of a design from its parameters.
+
+The solve time of designs of the same family varies by more than an order of
+magnitude (example_model_0 took 90 increments and 269 s, example_model_1
+704 increments and 4291 s). `CostModel` is a ridge regression of the log
+wall time on features of the design (area, aspect ratio, rotation, position,
+ligament to the edge, expected element count) and the loadcase parameters,
+fitted on the jobs that have finished (their .sts wall times, via the
+campaign index). With the predicted times the jobs and proc shards can be
+scheduled longest job first, so a batch does not end with a few slow jobs
+while the other cores sit idle. Refit the model as more jobs finish.
+"""
+
+import argparse
+import heapq
+import json
+import numpy as np
+import pandas as pd
+from campaign_index import completed_runs, open_index, pending, refresh_index
+from create_model import (
+    UNIT_SIZE,
+    create_rectangles,
+    estimate_mesh_cost,
+    iter_design_chunks,
+    read_parameters,
+)
+
+FEATURES = (
+    "area",
+    "log_aspect_ratio",
+    "abs_log_aspect_ratio",
+    "cos_4_rotation",
+    "sin_4_rotation",
+    "center_offset",
+    "log_ligament",
+    "log_elements",
+    "log_element_size",
+    "log_pressure",
+    "log_min_fraction",
+)
+
+
+def design_features(designs: pd.DataFrame, params: dict) -> np.ndarray:
+    """
+    Compute the features of the cost model.
+
+    Args:
+        designs: (DataFrame) The designs, with the columns in DESIGN_COLUMNS.
+        params: (dict) The loadcase parameters from `read_parameters`.
+
+    Returns:
+        features: (np.ndarray) The (N, len(FEATURES)) features.
+    """
+    vertices, _ = create_rectangles(designs)
+    # the distance from the cavity to the closest edge of the unit
+    ligament = np.minimum(vertices, UNIT_SIZE - vertices).min(axis=(1, 2))
+    ligament = np.maximum(ligament, 1e-3 * params["element_size"])
+    log_aspect_ratio = np.log(designs["aspect_ratio"].to_numpy(dtype=float))
+    # the unit is square, so rotating by 90 degrees gives the same model
+    rotation = np.radians(4 * designs["rotation"].to_numpy(dtype=float))
+    center = designs[["center_x", "center_y"]].to_numpy(dtype=float)
+    n_designs = len(designs)
+
+    columns = [
+        designs["area"].to_numpy(dtype=float) / UNIT_SIZE**2,
+        log_aspect_ratio,
+        np.abs(log_aspect_ratio),
+        np.cos(rotation),
+        np.sin(rotation),
+        np.hypot(*(center - UNIT_SIZE / 2).T) / UNIT_SIZE,
+        np.log(ligament / params["element_size"]),
+        np.log(np.maximum(estimate_mesh_cost(designs, params["element_size"]), 1)),
+        np.full(n_designs, np.log(params["element_size"])),
+        np.full(n_designs, np.log(params["pressure"])),
+        np.full(n_designs, np.log(params["min_fraction"])),
+    ]
+    return np.column_stack(columns)
+
+
+class CostModel:
+    """
+    A model of the wall time of a job.
+        With fewer than `min_runs` finished jobs the wall time is taken to
+        be proportional to the expected element count (`estimate_mesh_cost`),
+        scaled to the finished jobs if there are any. That is enough to order
+        the jobs, which is all the scheduling needs.
+
+    Args:
+        ridge: (float) The regularisation of the standardised features.
+        min_runs: (int) The number of finished jobs needed to fit the
+            regression.
+    """
+
+    def __init__(self, ridge: float = 1.0, min_runs: int = 10):
+        self.ridge = ridge
+        self.min_runs = min_runs
+        self.n_runs = 0
+        self.scale = 1.0
+        self.mean = None
+        self.std = None
+        self.weights = None
+        self.errors = {}
+
+    def _solve(self, features: np.ndarray, log_times: np.ndarray):
+        """Fit the ridge regression, returns (mean, std, weights)."""
+        mean = features.mean(axis=0)
+        std = features.std(axis=0)
+        # a parameter that is the same for every job carries no information
+        std[std == 0] = 1.0
+        x = np.column_stack([np.ones(len(features)), (features - mean) / std])
+        penalty = self.ridge * np.eye(x.shape[1])
+        penalty[0, 0] = 0.0
+        weights = np.linalg.solve(x.T @ x + penalty, x.T @ log_times)
+        return mean, std, weights
+
+    def fit(self, designs: pd.DataFrame, wall_times, params: dict, folds: int = 5):
+        """
+        Fit the model to finished jobs and estimate its prediction error
+            by cross validation.
+
+        Args:
+            designs: (DataFrame) The designs of the finished jobs.
+            wall_times: (array) Their wall times (s).
+            params: (dict) The loadcase parameters from `read_parameters`.
+            folds: (int) The number of cross validation folds.
+
+        Returns:
+            self: (CostModel) The fitted model.
+        """
+        wall_times = np.asarray(wall_times, dtype=float)
+        self.n_runs = len(wall_times)
+        self.weights = None
+        mesh_cost = estimate_mesh_cost(designs, params["element_size"])
+        if self.n_runs:
+            self.scale = float(np.median(wall_times / mesh_cost))
+        if self.n_runs < self.min_runs:
+            self.errors = prediction_errors(self.predict(designs, params), wall_times)
+            return self
+
+        features = design_features(designs, params)
+        log_times = np.log(wall_times)
+        predicted = np.empty(self.n_runs)
+        fold = np.arange(self.n_runs) % min(folds, self.n_runs)
+        for k in np.unique(fold):
+            mean, std, weights = self._solve(features[fold != k], log_times[fold != k])
+            x = (features[fold == k] - mean) / std
+            predicted[fold == k] = np.exp(weights[0] + x @ weights[1:])
+        self.errors = prediction_errors(predicted, wall_times)
+
+        self.mean, self.std, self.weights = self._solve(features, log_times)
+        return self
+
+    def predict(self, designs: pd.DataFrame, params: dict) -> np.ndarray:
+        """
+        Predict the wall times of designs.
+
+        Args:
+            designs: (DataFrame) The designs.
+            params: (dict) The loadcase parameters from `read_parameters`.
+
+        Returns:
+            wall_times: (np.ndarray) The predicted wall time of each design
+                (s, or relative units if no job has finished yet).
+        """
+        if self.weights is None:
+            return self.scale * estimate_mesh_cost(designs, params["element_size"])
+        x = (design_features(designs, params) - self.mean) / self.std
+        return np.exp(self.weights[0] + x @ self.weights[1:])
+
+    def save(self, file_name: str):
+        """
+        Save the model to a JSON file.
+
+        Args:
+            file_name: (str) The file name.
+        """
+        state = {
+            "features": FEATURES,
+            "ridge": self.ridge,
+            "min_runs": self.min_runs,
+            "n_runs": self.n_runs,
+            "scale": self.scale,
+            "errors": self.errors,
+        }
+        if self.weights is not None:
+            state["mean"] = self.mean.tolist()
+            state["std"] = self.std.tolist()
+            state["weights"] = self.weights.tolist()
+        with open(file_name, "w") as file:
+            json.dump(state, file, indent=2)
+
+    @classmethod
+    def load(cls, file_name: str):
+        """
+        Load a model saved with `save`.
+
+        Args:
+            file_name: (str) The file name.
+
+        Returns:
+            model: (CostModel) The model.
+        """
+        with open(file_name) as file:
+            state = json.load(file)
+        if tuple(state["features"]) != FEATURES:
+            raise ValueError(f"{file_name} was fitted with other features, refit it")
+        model = cls(state["ridge"], state["min_runs"])
+        model.n_runs = state["n_runs"]
+        model.scale = state["scale"]
+        model.errors = state["errors"]
+        if "weights" in state:
+            model.mean = np.array(state["mean"])
+            model.std = np.array(state["std"])
+            model.weights = np.array(state["weights"])
+        return model
+
+
+def prediction_errors(predicted, actual) -> dict:
+    """
+    Summarise how far predicted wall times are from the actual ones.
+
+    Args:
+        predicted: (array) The predicted wall times.
+        actual: (array) The actual wall times.
+
+    Returns:
+        errors: (dict) n, the median and 90th percentile of the absolute
+            relative error, and the rank correlation of predicted and
+            actual (1 means the jobs are ordered perfectly). Empty if there
+            are no jobs.
+    """
+    predicted = np.asarray(predicted, dtype=float)
+    actual = np.asarray(actual, dtype=float)
+    if len(actual) == 0:
+        return {}
+    relative = np.abs(predicted - actual) / actual
+    errors = {
+        "n": int(len(actual)),
+        "median_relative_error": float(np.median(relative)),
+        "p90_relative_error": float(np.percentile(relative, 90)),
+        "rank_correlation": None,
+    }
+    if len(actual) > 1:
+        ranks = [np.argsort(np.argsort(v, kind="stable")) for v in (predicted, actual)]
+        if ranks[0].std() > 0 and ranks[1].std() > 0:
+            errors["rank_correlation"] = float(np.corrcoef(*ranks)[0, 1])
+    return errors
+
+
+def read_designs(design_file, indices=None) -> pd.DataFrame:
+    """
+    Read the designs, keeping only some of them.
+
+    Args:
+        design_file: The designs, see `iter_design_chunks` for the options.
+        indices: (array) The design numbers to keep, all by default.
+
+    Returns:
+        designs: (DataFrame) The designs, indexed by design number.
+    """
+    chunks = iter_design_chunks(design_file)
+    if indices is None:
+        return pd.concat(list(chunks))
+    indices = pd.Index(indices)
+    designs = pd.concat([chunk[chunk.index.isin(indices)] for chunk in chunks])
+    return designs.loc[indices.intersection(designs.index, sort=False)]
+
+
+def fit_from_index(
+    connection,
+    design_file="Rectangle_inputs.csv",
+    config_file: str = "config.ini",
+    model: CostModel = None,
+) -> CostModel:
+    """
+    Fit a cost model to the finished jobs of a campaign.
+
+    Args:
+        connection: (sqlite3.Connection) The campaign index, refreshed.
+        design_file: The designs, see `iter_design_chunks` for the options.
+        config_file: (str) The config file with the loadcase parameters.
+        model: (CostModel) The model to fit, a new one by default.
+
+    Returns:
+        model: (CostModel) The fitted model.
+    """
+    model = model or CostModel()
+    runs = completed_runs(connection)
+    designs = read_designs(design_file, runs["design"])
+    wall_times = pd.Series(runs["wall_time"], index=runs["design"])[designs.index]
+    return model.fit(designs, wall_times.to_numpy(), read_parameters(config_file))
+
+
+def longest_first(costs) -> np.ndarray:
+    """
+    Order jobs longest processing time first.
+
+    Args:
+        costs: (array) The predicted cost of each job.
+
+    Returns:
+        order: (np.ndarray) The job positions, most expensive first.
+    """
+    return np.argsort(-np.asarray(costs, dtype=float), kind="stable")
+
+
+def simulate_makespan(costs, n_workers: int, order=None) -> float:
+    """
+    The time a queue of jobs takes on `n_workers` workers that each take the
+        next job in the queue when they become free.
+
+    Args:
+        costs: (array) The cost of each job.
+        n_workers: (int) The number of workers.
+        order: (array) The order of the queue, the given order by default.
+
+    Returns:
+        makespan: (float) When the last job ends.
+    """
+    costs = np.asarray(costs, dtype=float)
+    if order is not None:
+        costs = costs[order]
+    loads = [0.0] * max(1, n_workers)
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the job cost model.")
+    parser.add_argument("--index", default="campaign.sqlite")
+    parser.add_argument("--directory", default="marcmentat_files")
+    parser.add_argument("--designs", default="Rectangle_inputs.csv")
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--output", default="cost_model.json")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    connection = open_index(args.index)
+    refresh_index(connection, args.directory)
+    model = fit_from_index(connection, args.designs, args.config)
+    model.save(args.output)
+    print(f"fitted on {model.n_runs} jobs, cross validated errors: {model.errors}")
+
+    remaining = pending(connection, "marc")
+    connection.close()
+    if remaining:
+        designs = read_designs(args.designs, remaining)
+        costs = model.predict(designs, read_parameters(args.config))
+        in_order = simulate_makespan(costs, args.workers)
+        lpt = simulate_makespan(costs, args.workers, longest_first(costs))
+        print(
+            f"{len(costs)} jobs left, predicted makespan on {args.workers} workers: "
+            f"{in_order:.4g} in design order, {lpt:.4g} longest first"
+        )
@@ -5,10 +5,28 @@ Date: April 2022
 Create the dat files for a Monte-Carlo simulation
 """
 
+import argparse
+import heapq
+import itertools
+import json
 import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import configparser
-from create_rectangle_proc_dat import create_rectangle_proc_dat
+from campaign_index import mark_proc_written, open_index
+from create_rectangle_proc_dat import (
+    create_rectangle_proc_dat,
+    write_parametric_procs,
+    write_rectangle_procs,
+)
+import pipeline_timing
+from pipeline_timing import stage_timer, timed_iter
+
+UNIT_SIZE = 25.0
+DESIGN_COLUMNS = ["center_x", "center_y", "aspect_ratio", "rotation", "area"]
 
 
 def create_rectangle(center_x: float , center_y: float, aspect_ratio: float, rotation_angle: float, area: float) -> list:
@@ -79,62 +97,598 @@ def create_rectangle(center_x: float , center_y: float, aspect_ratio: float, rot
     return vertices
 
 
-def setup_proc_file_main():
+def create_rectangles(designs, unit_size: float = UNIT_SIZE, min_ligament: float = 0.0):
     """
-    Setup the proc file from the input .csv file.
-        The loadcase parameters are read from the config.ini file.
-        The rectangle designs are read from the Rectangle_inputs.csv file.
- 
+    Create the cavity vertices for a whole table of designs at once.
+        This is the vectorised version of `create_rectangle` and gives the same
+        vertices, in the same order, for every row.
+
     Args:
-        None
+        designs: (DataFrame or array) Either a dataframe with the columns
+            center_x, center_y, aspect_ratio, rotation and area, or an (N, 5)
+            array with the columns in that order.
+        unit_size: (float) The side length of the square unit.
+        min_ligament: (float) The minimum allowed distance between a cavity
+            vertex and the edge of the unit.
 
     Returns:
-        None
+        vertices: (array) The (N, 4, 2) cavity corners, i.e.,
+            vertices[i, j] = (x, y) of corner j of design i.
+        valid: (array) (N,) boolean mask, True where the cavity lies inside
+            the unit and the vertices are ordered counterclockwise.
+    """
+    if isinstance(designs, pd.DataFrame):
+        designs = designs[DESIGN_COLUMNS].to_numpy(dtype=float)
+    designs = np.atleast_2d(np.asarray(designs, dtype=float))
+
+    center_x = designs[:, 0:1]
+    center_y = designs[:, 1:2]
+    aspect_ratio = designs[:, 2:3]
+    alpha_rad = np.radians(designs[:, 3:4])
+    area = designs[:, 4:5]
+
+    # Calculate the half side lengths of the rectangles
+    length = np.sqrt(area * aspect_ratio)
+    width = length / aspect_ratio
+    half_length = length / 2.0
+    half_width = width / 2.0
+
+    # Unrotated vertices, in the same order as `create_rectangle`. The offsets
+    # are taken relative to the shifted vertex so that the rounding matches
+    # the scalar function exactly.
+    x = np.hstack(
+        [
+            center_x + half_length,
+            center_x - half_length,
+            center_x - half_length,
+            center_x + half_length,
+        ]
+    )
+    y = np.hstack(
+        [
+            center_y + half_width,
+            center_y + half_width,
+            center_y - half_width,
+            center_y - half_width,
+        ]
+    )
+    x = x - center_x
+    y = y - center_y
+
+    # Apply the rotation to all the vertices simultaneously
+    cos_a = np.cos(alpha_rad)
+    sin_a = np.sin(alpha_rad)
+    vertices = np.empty((designs.shape[0], 4, 2))
+    vertices[:, :, 0] = center_x + x * cos_a - y * sin_a
+    vertices[:, :, 1] = center_y + x * sin_a + y * cos_a
+
+    valid = check_rectangles(vertices, unit_size, min_ligament)
+
+    return vertices, valid
+
+
+def shoelace_area(vertices: np.ndarray) -> np.ndarray:
+    """
+    Signed polygon area using the shoelace formula.
+        A positive area means the vertices are ordered counterclockwise.
+
+    Args:
+        vertices: (array) (N, n_vertices, 2) polygon vertices.
+
+    Returns:
+        area: (array) (N,) signed areas.
+    """
+    x = vertices[..., 0]
+    y = vertices[..., 1]
+    x_next = np.roll(x, -1, axis=-1)
+    y_next = np.roll(y, -1, axis=-1)
+    return 0.5 * np.sum(x * y_next - x_next * y, axis=-1)
+
+
+def check_rectangles(
+    vertices: np.ndarray, unit_size: float = UNIT_SIZE, min_ligament: float = 0.0
+) -> np.ndarray:
+    """
+    Check that each cavity can be passed to mentat.
+        Every vertex has to lie inside the unit (at least `min_ligament` away
+        from its edges) and the vertices must have a counterclockwise winding
+        order (see Tips and Tricks in the README).
+
+    Args:
+        vertices: (array) (N, 4, 2) cavity vertices.
+        unit_size: (float) The side length of the square unit.
+        min_ligament: (float) The minimum allowed vertex to edge distance.
+
+    Returns:
+        valid: (array) (N,) boolean mask of the valid designs.
+    """
+    inside = np.all(
+        (vertices > min_ligament) & (vertices < unit_size - min_ligament),
+        axis=(1, 2),
+    )
+    counterclockwise = shoelace_area(vertices) > 0
+
+    return inside & counterclockwise
+
+
+def read_parameters(config_file: str = "config.ini") -> dict:
+    """
+    Read the loadcase parameters from the config file.
+
+    Args:
+        config_file: (str) The path to the config file.
+
+    Returns:
+        params: (dict) pressure, element_size and min_fraction as floats.
     """
-    # read the parameters from the config file
     config_obj = configparser.ConfigParser()
-    config_obj.read("config.ini")
+    config_obj.read(config_file)
     Params = config_obj["Parameters"]
 
-    pressure = float(Params["pressure"]) 
-    element_size = float(Params["element_size"])
-    min_fraction = float(Params["min_fraction"]) 
-    
-    # read the csv file with the rectangle designs into a pandas dataframe
-    df = pd.read_csv(f"Rectangle_inputs.csv", header=None)
-    col_headings = ["center_x", "center_y", "aspect_ratio", "rotation", "area"]
-    df.columns = col_headings
-
-    # loop over every sample in the the df
-    for index, row in df.iterrows():
-        proc_file_name = f".\marcmentat_files\example_model_{index}"
+    return {
+        "pressure": float(Params["pressure"]),
+        "element_size": float(Params["element_size"]),
+        "min_fraction": float(Params["min_time_fraction"]),
+    }
+
+
+def iter_design_chunks(
+    source="Rectangle_inputs.csv", chunk_size: int = 10000, start_index: int = 0
+):
+    """
+    Read the rectangle designs a chunk at a time.
+        Only one chunk is held in memory, so the design table can be far larger
+        than the available RAM. The dataframe index of each chunk is the row
+        number of the design in the source, which is also the number used in
+        the `example_model_{index}` file names.
+
+    Args:
+        source: The designs. Either a .csv file name, "-" for stdin, an open
+            file object, or an iterable of
+            (center_x, center_y, aspect_ratio, rotation, area) samples.
+        chunk_size: (int) The number of designs per chunk.
+        start_index: (int) The row number to start from. The rows before it
+            are skipped, so a restarted run keeps its numbering.
+
+    Yields:
+        chunk: (DataFrame) The designs with the columns in DESIGN_COLUMNS.
+    """
+    if source == "-":
+        source = sys.stdin
+
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+        reader = pd.read_csv(
+            source,
+            header=None,
+            names=DESIGN_COLUMNS,
+            skiprows=start_index,
+            chunksize=chunk_size,
+        )
+        for chunk in reader:
+            chunk.index = chunk.index + start_index
+            yield chunk
+        return
+
+    # an iterable of samples, e.g. a generator
+    samples = itertools.islice(iter(source), start_index, None)
+    index = start_index
+    while True:
+        rows = list(itertools.islice(samples, chunk_size))
+        if not rows:
+            return
+        yield pd.DataFrame(
+            rows,
+            columns=DESIGN_COLUMNS,
+            index=pd.RangeIndex(index, index + len(rows)),
+            dtype=float,
+        )
+        index += len(rows)
+
+
+def write_proc_files(
+    designs: pd.DataFrame,
+    params: dict,
+    proc_dir: str = "marcmentat_files",
+    cache=None,
+    node_targets=(),
+):
+    """
+    Create the proc files for a table of designs.
+
+    Args:
+        designs: (DataFrame) The designs, indexed by design number.
+        params: (dict) The loadcase parameters from `read_parameters`.
+        proc_dir: (str) The directory the proc files are written to.
+        cache: (ResultCache) Optional, designs with a cached result are
+            skipped.
+        node_targets: (tuple) The node targets the post processing uses,
+            only a cached result for these targets skips a design.
+
+    Returns:
+        written: (list) The design numbers for which a proc file was written.
+    """
+    # create all the rectangles at once
+    with stage_timer("geometry", n_designs=len(designs)):
+        vertices, valid = create_rectangles(designs)
+    areas = designs["area"].to_numpy()
+
+    written = []
+    for i, index in enumerate(designs.index):
+        if not valid[i]:
+            print(f"Design {index} is not a valid cavity, skipping.")
+            continue
+        if (
+            cache is not None
+            and cache.get(designs.loc[index], params, node_targets) is not None
+        ):
+            continue
+
+        proc_file_name = os.path.join(proc_dir, f"example_model_{index}")
         dat_file_name = f"example_model_{index}"
-        
-        # get the values from the dataframe row
-        center_x = row["center_x"]
-        center_y = row["center_y"]
-        angle = row["rotation"]
-        aspect_ratio = row["aspect_ratio"]
-        area = row["area"]
-
-        # create the rectangle
-        nodes = create_rectangle(center_x, center_y, aspect_ratio, angle, area)
-        x_vals = [nodes[0], nodes[3], nodes[6], nodes[9]]
-        y_vals = [nodes[1], nodes[4], nodes[7], nodes[10]]
-        
+
         # create the proc file
         create_rectangle_proc_dat(
-                x_vals,
-                y_vals,
-                element_size,
-                pressure,
-                min_fraction,
-                area,
-                proc_file_name,
-                dat_file_name,
+            vertices[i, :, 0].tolist(),
+            vertices[i, :, 1].tolist(),
+            params["element_size"],
+            params["pressure"],
+            params["min_fraction"],
+            areas[i],
+            proc_file_name,
+            dat_file_name,
+        )
+        written.append(index)
+
+    return written
+
+
+def partition_designs(indices, n_shards: int, costs=None) -> list:
+    """
+    Split the designs into shards.
+        Without costs the designs are split into contiguous blocks of (nearly)
+        equal size. With costs the designs are bin-packed longest job first,
+        i.e., each design, from the most to the least expensive, is placed in
+        the shard with the lowest total cost so far.
+
+    Args:
+        indices: (array) The design numbers.
+        n_shards: (int) The number of shards.
+        costs: (array) Optional, the expected cost (e.g. solve time) of each
+            design.
+
+    Returns:
+        shards: (list) A list with an array of design numbers for each shard.
+            The design numbers in each shard are sorted.
+    """
+    indices = np.asarray(indices)
+    n_shards = max(1, min(n_shards, len(indices)))
+
+    if costs is None:
+        return np.array_split(indices, n_shards)
+
+    costs = np.asarray(costs, dtype=float)
+    loads = [(0.0, shard) for shard in range(n_shards)]
+    members = [[] for _ in range(n_shards)]
+    for k in np.argsort(-costs, kind="stable"):
+        load, shard = heapq.heappop(loads)
+        members[shard].append(indices[k])
+        heapq.heappush(loads, (load + costs[k], shard))
+
+    return [np.sort(np.array(m, dtype=indices.dtype)) for m in members]
+
+
+def estimate_mesh_cost(designs: pd.DataFrame, element_size: float) -> np.ndarray:
+    """
+    A rough cost for each design: the expected number of elements.
+
+    Args:
+        designs: (DataFrame) The designs.
+        element_size: (float) The mesh size.
+
+    Returns:
+        costs: (array) The estimated element count of each design.
+    """
+    return (UNIT_SIZE**2 - designs["area"].to_numpy()) / element_size**2
+
+
+def _write_shard(
+    shard_file_name: str, designs: pd.DataFrame, params: dict, parametric: bool = False
+):
+    """
+    Write all the designs of one shard into a single proc file.
+        The proc commands of every design follow each other in the same file
+        (see tip 6 in the README). Any old shard file is overwritten.
+
+    Args:
+        shard_file_name: (str) The shard file name without extension.
+        designs: (DataFrame) The designs in this shard.
+        params: (dict) The loadcase parameters from `read_parameters`.
+        parametric: (bool) Experimental, write the shard as a parametric
+            driver that runs a shared procedure body (shard_file_name +
+            "_body.proc"). See `write_parametric_procs`.
+
+    Returns:
+        dat_files: (list) The names of the .dat files the shard will create.
+    """
+    with stage_timer("geometry", n_designs=len(designs)):
+        vertices, _ = create_rectangles(designs)
+    dat_file_names = [f"example_model_{index}" for index in designs.index]
+
+    if parametric:
+        write_parametric_procs(
+            f"{shard_file_name}_body",
+            shard_file_name,
+            vertices[:, :, 0],
+            vertices[:, :, 1],
+            params["element_size"],
+            params["pressure"],
+            params["min_fraction"],
+            dat_file_names,
+        )
+        return [f"{name}.dat" for name in dat_file_names]
+
+    with open(f"{shard_file_name}.proc", "w") as file:
+        write_rectangle_procs(
+            file,
+            vertices[:, :, 0],
+            vertices[:, :, 1],
+            params["element_size"],
+            params["pressure"],
+            params["min_fraction"],
+            dat_file_names,
+        )
+
+    return [f"{name}.dat" for name in dat_file_names]
+
+
+def write_proc_shards(
+    design_file="Rectangle_inputs.csv",
+    n_shards: int = os.cpu_count(),
+    config_file: str = "config.ini",
+    proc_dir: str = "marcmentat_files",
+    balance: str = "contiguous",
+    costs=None,
+    processes: int = None,
+    parametric: bool = False,
+    cost_model=None,
+    only=None,
+):
+    """
+    Write the designs into `n_shards` combined proc files, one per mentat
+        session, so that `mentat -bg shard_{k}.proc` can be run on every core.
+        The shards are written in parallel and a manifest
+        (shards_manifest.json) maps each shard to its designs and .dat files.
+
+    Args:
+        design_file: The designs, see `iter_design_chunks` for the options.
+        n_shards: (int) The number of shard files.
+        config_file: (str) The config file with the loadcase parameters.
+        proc_dir: (str) The directory the shard files are written to.
+        balance: (str) "contiguous" for blocks of consecutive designs or
+            "cost" to balance the estimated cost of the shards.
+        costs: (array) Optional cost of each design, used with
+            balance="cost". Defaults to the predictions of `cost_model`,
+            or to `estimate_mesh_cost`.
+        processes: (int) The number of worker processes. Defaults to the
+            number of shards.
+        parametric: (bool) Experimental, write each shard as a parametric
+            driver plus a procedure body instead of the full commands of
+            every design. See `write_parametric_procs`.
+        cost_model: (CostModel) Optional model of the solve time of each
+            design (see cost_model.py), used with balance="cost".
+        only: (array) Optional, write only these design numbers (e.g. the
+            designs a screening stage sends to the solver).
+
+    Returns:
+        manifest: (dict) The contents of the manifest file.
+    """
+    params = read_parameters(config_file)
+    chunks = timed_iter("read_designs", iter_design_chunks(design_file))
+    designs = pd.concat(list(chunks))
+    if only is not None:
+        selected = designs.index.isin(only)
+        designs = designs[selected]
+        if costs is not None:
+            costs = np.asarray(costs, dtype=float)[selected]
+
+    _, valid = create_rectangles(designs)
+    for index in designs.index[~valid]:
+        print(f"Design {index} is not a valid cavity, skipping.")
+    if costs is not None:
+        costs = np.asarray(costs, dtype=float)[valid]
+    designs = designs[valid]
+
+    if balance == "cost" and costs is None and cost_model is not None:
+        costs = cost_model.predict(designs, params)
+    elif balance == "cost" and costs is None:
+        costs = estimate_mesh_cost(designs, params["element_size"])
+    elif balance == "contiguous":
+        costs = None
+    elif balance != "cost":
+        raise ValueError(f"Unknown balance option: {balance}")
+
+    shards = partition_designs(designs.index, n_shards, costs)
+    shard_names = [os.path.join(proc_dir, f"shard_{k}") for k in range(len(shards))]
+
+    with ProcessPoolExecutor(max_workers=processes or len(shards)) as executor:
+        futures = [
+            executor.submit(
+                _write_shard, name, designs.loc[shard], params, parametric
             )
+            for name, shard in zip(shard_names, shards)
+        ]
+        dat_files = [future.result() for future in futures]
+
+    manifest = {
+        "shards": [
+            {
+                "proc_file": f"{os.path.basename(name)}.proc",
+                "designs": [int(i) for i in shard],
+                "dat_files": dats,
+            }
+            for name, shard, dats in zip(shard_names, shards, dat_files)
+        ]
+    }
+    with open(os.path.join(proc_dir, "shards_manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
+
+
+def setup_proc_file_main(
+    design_file="Rectangle_inputs.csv",
+    config_file: str = "config.ini",
+    chunk_size: int = 10000,
+    start_index: int = 0,
+    proc_dir: str = "marcmentat_files",
+    cache=None,
+    only=None,
+    node_targets=(),
+    index=None,
+):
+    """
+    Setup the proc file from the input .csv file.
+        The loadcase parameters are read from the config.ini file.
+        The rectangle designs are read from the Rectangle_inputs.csv file.
+        The designs are streamed in chunks, each chunk is written to proc
+        files before the next one is read.
+
+    Args:
+        design_file: The designs, see `iter_design_chunks` for the options.
+        config_file: (str) The config file with the loadcase parameters.
+        chunk_size: (int) The number of designs read at a time.
+        start_index: (int) The design number to start (or restart) from.
+        proc_dir: (str) The directory the proc files are written to.
+        cache: (ResultCache) Optional, designs with a cached result are
+            skipped.
+        only: (array) Optional, write only these design numbers (e.g. the
+            designs a screening stage sends to the solver).
+        node_targets: (tuple) The node targets of the cached results.
+        index: (sqlite3.Connection) Optional campaign index
+            (campaign_index.py), the written proc files are recorded in it.
+
+    Returns:
+        None
+    """
+    # read the parameters from the config file
+    params = read_parameters(config_file)
+
+    chunks = iter_design_chunks(design_file, chunk_size, start_index)
+    for chunk in timed_iter("read_designs", chunks):
+        if only is not None:
+            chunk = chunk[chunk.index.isin(only)]
+        written = write_proc_files(chunk, params, proc_dir, cache, node_targets)
+        if index is not None:
+            mark_proc_written(index, written)
+
+    if cache is not None:
+        print(cache.report())
 
 
 if __name__ == "__main__":
-    setup_proc_file_main()
-    print("create_model - completed")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "design_file",
+        nargs="?",
+        default="Rectangle_inputs.csv",
+        help="The design .csv file, or - to read from stdin.",
+    )
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--start-index", type=int, default=0)
+    parser.add_argument("--proc-dir", default="marcmentat_files")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Write this many combined proc files instead of one per design.",
+    )
+    parser.add_argument(
+        "--balance", choices=["contiguous", "cost"], default="contiguous"
+    )
+    parser.add_argument(
+        "--cache",
+        help="Skip the designs with a result in this cache directory, the post "
+        "processing with the same cache writes their positions.",
+    )
+    parser.add_argument(
+        "--parametric",
+        action="store_true",
+        help="Experimental: write the shards as parametric drivers of one "
+        "procedure body. Mentat has not been run on these drivers, check a "
+        "shard before using it for a campaign.",
+    )
+    parser.add_argument(
+        "--cost-model",
+        help="Balance the shards with this fitted cost model (cost_model.py).",
+    )
+    parser.add_argument(
+        "--screen",
+        help="Only write the designs to simulate in this screening file "
+        "(surrogate.py).",
+    )
+    parser.add_argument(
+        "--index", help="Record the written proc files in this campaign index."
+    )
+    parser.add_argument(
+        "--timings", help="Append the time of every stage to this JSON lines file."
+    )
+    args = parser.parse_args()
+
+    if args.parametric and args.shards <= 0:
+        parser.error("--parametric needs --shards")
+    if args.timings:
+        pipeline_timing.enable(args.timings)
+    only = None
+    if args.screen:
+        with np.load(args.screen) as screening:
+            only = screening["design"][screening["simulate"]]
+    index = None
+    if args.index:
+        index = open_index(args.index)
+
+    if args.shards > 0:
+        cost_model = None
+        if args.cost_model:
+            from cost_model import CostModel
+
+            cost_model = CostModel.load(args.cost_model)
+        if args.parametric:
+            print("warning: --parametric is experimental, check a shard in mentat")
+        manifest = write_proc_shards(
+            args.design_file,
+            args.shards,
+            args.config,
+            args.proc_dir,
+            args.balance,
+            parametric=args.parametric,
+            cost_model=cost_model,
+            only=only,
+        )
+        if index is not None:
+            for shard in manifest["shards"]:
+                mark_proc_written(index, shard["designs"])
+    else:
+        cache = None
+        node_targets = ()
+        if args.cache:
+            from py_post_process import set_up_node_targets
+            from result_cache import ResultCache
+
+            cache = ResultCache(args.cache)
+            # the targets do_the_post_processing caches the positions of
+            node_targets = set_up_node_targets()
+        setup_proc_file_main(
+            args.design_file,
+            args.config,
+            args.chunk_size,
+            args.start_index,
+            args.proc_dir,
+            cache,
+            only,
+            node_targets,
+            index,
+        )
+    if index is not None:
+        index.close()
+    print("create_model - completed")
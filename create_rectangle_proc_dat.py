@@ -1,140 +1,446 @@
-def create_rectangle_proc_dat(
-    x_vals,
-    y_vals,
-    element_size,
-    pressure_val,
-    min_fraction,
-    area,
-    proc_file_name,
-    dat_file_name,
-):
-    """
-    Create a proc file using parameters passed to the function.
-
-    Args:
-        x_vals: (list) The four cavity corner node x values.
-        y_vals: (list) The four cavity corner node y values.
-        element_size: (float) The mesh size.
-        pressure_val: (float) The pressure to be applied to the cavity (MPa)
-        min_fraction: (float) The minimum allowed fraction of load case time.
-        proc_file_name: (str) The name of the proc file to be created.
-        dat_file_name: (str) The name of the dat file that the .proc file will 
-            generate when run using the command `mentat -bg proc_file_name.proc`
-
-    Returns:
-        None: It just produces a .proc file.
-    """
-
-    commands = [
-        "*new_model yes",
-        "*set_model_analysis_dimension planar",
-        "*set_solid_type sheet_rect",
-        "*add_solids 0 0 0 25 25",
-        "*set_solid_type sheet_arb_poly",
-        "*add_solids {x1} {y1} 0 {x2} {y2} 0 {x3} {y3} 0 {x4} {y4} 0",
-        "#",
-        "*solids_subtract 1 ",
-        "2",
-        "#",
-        "*add_nodes 0 0 0 25 0 0 25 25 0 0 25 0",
-        "*add_nodes {x1} {y1} 0",
-        "*add_nodes {x2} {y2} 0",
-        "*add_nodes {x3} {y3} 0",
-        "*add_nodes {x4} {y4} 0",
-        "@set($automesh_surface_desc,sheet)",
-        "@set($automesh_surface_family,quad)",
-        "@set($automesh_surface_order,linear)",
-        "*pt_set_target_element_size_method manual",
-        "*pt_set_global_element_size_sheet {element_size}",
-        "*pt_mesh_sheet linear quad",
-        "solid1 #",
-        "*sweep_nodes all_existing #",
-        "*new_apply *apply_type fixed_displacement",
-        "*apply_dof x *apply_dof_value x 0.0",
-        "*apply_dof y *apply_dof_value y 0.0",
-        "*add_apply_nodes 1 #",
-        "*new_apply *apply_type fixed_displacement",
-        "*apply_dof x *apply_dof_value x 0.0",
-        "*add_apply_nodes 4 #",
-        "*new_mater standard *mater_option general:state:solid",
-        "*mater_option general:skip_structural:off",
-        "*mater_option structural:type:ogden",
-        "*mater_param structural:ogden_nterm 3",
-        "*mater_param structural:ogden_modulus_1 0.024361",
-        "*mater_param structural:ogden_modulus_2 6.6703e-5",
-        "*mater_param structural:ogden_modulus_3 4.5381e-4",
-        "*mater_param structural:ogden_exp_1 1.7138",
-        "*mater_param structural:ogden_exp_2 7.0697",
-        "*mater_param structural:ogden_exp_3 -3.3659",
-        "*mater_option structural:volum_behav:series",
-        "*mater_param structural:vol_strn_nrg_coef_d_1 3.2587",
-        "*add_mater_elements all_existing",
-        "*new_geometry *geometry_type mech_planar_pstrain ",
-        "*geometry_param norm_to_plane_thick 0.002",
-        "*add_geometry_elements all_existing",
-        "*new_pre_defined_table linear_ramp_time",
-        "*select_method_path",
-        "*select_clear_nodes",
-        "*select_clear_edges",
-        "*select_edges 5 6 #",
-        "*select_edges 6 7 #",
-        "*select_edges 7 8 #",
-        "*select_edges 8 5 #",
-        "*new_apply *apply_type edge_load",
-        "*apply_option edge_load_mode:area",
-        "*apply_dof p *apply_dof_value p",
-        "*apply_dof_value p {pressure_val}",
-        "*apply_dof_table p linear_ramp_time1",
-        "*add_apply_edges all_selected #",
-        "*new_cbody mesh *contact_option state:solid",
-        "*contact_option skip_structural:off",
-        "*add_contact_body_elements all_existing",
-        "*new_contact_table",
-        "*ctable_set_default_touch",
-        "*new_loadcase *loadcase_type struc:static",
-        "*loadcase_value time 1",
-        "*loadcase_option stepping:multicriteria",
-        "*loadcase_value desired 30",
-        "*loadcase_value maxrec 100",
-        "*loadcase_value minfraction {min_fraction}",
-        "*loadcase_option procedure:modifiednr",
-        "*loadcase_option converge:resid_and_disp",
-        "*loadcase_value force 0.001",
-        "*loadcase_value displacement 0.001",
-        "*loadcase_ctable ctable1",
-        "*new_job structural",
-        "*add_job_loadcases lcase1",
-        "*job_option nod_quantities:manual",
-        "*job_option follow:on",
-        "*add_post_nodal_quantity Displacement",
-        "*add_post_tensor log_strain",
-        "*job_option strain:large",
-        "*job_contact_table ctable1",
-        "*element_type 118 all_existing",
-        "*write_marc '{dat_file_name}.dat' yes",
-    ]
-
-    # Open the file in write mode
-    with open(f"{proc_file_name}.proc", "a") as file:
-        # Write each command to a new line, replacing the placeholders with the actual values
-        for command in commands:
-            file.write(
-                command.format(
-                    x1=x_vals[0],
-                    x2=x_vals[1],
-                    x3=x_vals[2],
-                    x4=x_vals[3],
-                    y1=y_vals[0],
-                    y2=y_vals[1],
-                    y3=y_vals[2],
-                    y4=y_vals[3],
-                    element_size=element_size,
-                    pressure_val=pressure_val,
-                    min_fraction=min_fraction,
-                    area=area,
-                    dat_file_name=dat_file_name,
-                )
-                + "\n"
-            )
-
-    return None
+"""
+Create the mentat .proc files for the rectangular void unit.
+
+The proc commands are compiled into a template once at import. Only the
+design-specific values are filled in for each design, and each design is
+rendered into a single string that is written with one call.
+
+Experimental: for very large campaigns the commands can instead be written
+once as a parametric procedure body, driven by a short block of procedure
+variables per design (see `write_parametric_procs`). This form has not been
+run in Mentat yet.
+"""
+
+import hashlib
+import re
+from operator import itemgetter
+from string import Formatter
+from pipeline_timing import stage_timer
+
+PROC_COMMANDS = [
+    "*new_model yes",
+    "*set_model_analysis_dimension planar",
+    "*set_solid_type sheet_rect",
+    "*add_solids 0 0 0 25 25",
+    "*set_solid_type sheet_arb_poly",
+    "*add_solids {x1} {y1} 0 {x2} {y2} 0 {x3} {y3} 0 {x4} {y4} 0",
+    "#",
+    "*solids_subtract 1 ",
+    "2",
+    "#",
+    "*add_nodes 0 0 0 25 0 0 25 25 0 0 25 0",
+    "*add_nodes {x1} {y1} 0",
+    "*add_nodes {x2} {y2} 0",
+    "*add_nodes {x3} {y3} 0",
+    "*add_nodes {x4} {y4} 0",
+    "@set($automesh_surface_desc,sheet)",
+    "@set($automesh_surface_family,quad)",
+    "@set($automesh_surface_order,linear)",
+    "*pt_set_target_element_size_method manual",
+    "*pt_set_global_element_size_sheet {element_size}",
+    "*pt_mesh_sheet linear quad",
+    "solid1 #",
+    "*sweep_nodes all_existing #",
+    "*new_apply *apply_type fixed_displacement",
+    "*apply_dof x *apply_dof_value x 0.0",
+    "*apply_dof y *apply_dof_value y 0.0",
+    "*add_apply_nodes 1 #",
+    "*new_apply *apply_type fixed_displacement",
+    "*apply_dof x *apply_dof_value x 0.0",
+    "*add_apply_nodes 4 #",
+    "*new_mater standard *mater_option general:state:solid",
+    "*mater_option general:skip_structural:off",
+    "*mater_option structural:type:ogden",
+    "*mater_param structural:ogden_nterm 3",
+    "*mater_param structural:ogden_modulus_1 0.024361",
+    "*mater_param structural:ogden_modulus_2 6.6703e-5",
+    "*mater_param structural:ogden_modulus_3 4.5381e-4",
+    "*mater_param structural:ogden_exp_1 1.7138",
+    "*mater_param structural:ogden_exp_2 7.0697",
+    "*mater_param structural:ogden_exp_3 -3.3659",
+    "*mater_option structural:volum_behav:series",
+    "*mater_param structural:vol_strn_nrg_coef_d_1 3.2587",
+    "*add_mater_elements all_existing",
+    "*new_geometry *geometry_type mech_planar_pstrain ",
+    "*geometry_param norm_to_plane_thick 0.002",
+    "*add_geometry_elements all_existing",
+    "*new_pre_defined_table linear_ramp_time",
+    "*select_method_path",
+    "*select_clear_nodes",
+    "*select_clear_edges",
+    "*select_edges 5 6 #",
+    "*select_edges 6 7 #",
+    "*select_edges 7 8 #",
+    "*select_edges 8 5 #",
+    "*new_apply *apply_type edge_load",
+    "*apply_option edge_load_mode:area",
+    "*apply_dof p *apply_dof_value p",
+    "*apply_dof_value p {pressure_val}",
+    "*apply_dof_table p linear_ramp_time1",
+    "*add_apply_edges all_selected #",
+    "*new_cbody mesh *contact_option state:solid",
+    "*contact_option skip_structural:off",
+    "*add_contact_body_elements all_existing",
+    "*new_contact_table",
+    "*ctable_set_default_touch",
+    "*new_loadcase *loadcase_type struc:static",
+    "*loadcase_value time 1",
+    "*loadcase_option stepping:multicriteria",
+    "*loadcase_value desired 30",
+    "*loadcase_value maxrec 100",
+    "*loadcase_value minfraction {min_fraction}",
+    "*loadcase_option procedure:modifiednr",
+    "*loadcase_option converge:resid_and_disp",
+    "*loadcase_value force 0.001",
+    "*loadcase_value displacement 0.001",
+    "*loadcase_ctable ctable1",
+    "*new_job structural",
+    "*add_job_loadcases lcase1",
+    "*job_option nod_quantities:manual",
+    "*job_option follow:on",
+    "*add_post_nodal_quantity Displacement",
+    "*add_post_tensor log_strain",
+    "*job_option strain:large",
+    "*job_contact_table ctable1",
+    "*element_type 118 all_existing",
+    "*write_marc '{dat_file_name}.dat' yes",
+]
+
+
+def _compile_template(commands: list) -> tuple:
+    """
+    Compile the proc commands into a single %-style template string.
+
+    Args:
+        commands: (list) The proc commands with {placeholder} fields.
+
+    Returns:
+        template: (str) All the commands, one per line, with %s slots.
+        fields: (tuple) The placeholder name of each %s slot, in order.
+    """
+    template = []
+    fields = []
+    for command in commands:
+        for literal, field, _, _ in Formatter().parse(command):
+            template.append(literal.replace("%", "%%"))
+            if field is not None:
+                template.append("%s")
+                fields.append(field)
+        template.append("\n")
+    return "".join(template), tuple(fields)
+
+
+_PROC_TEMPLATE, _PROC_FIELDS = _compile_template(PROC_COMMANDS)
+# changes whenever the proc commands change, used to key cached results
+PROC_TEMPLATE_VERSION = hashlib.sha1(_PROC_TEMPLATE.encode()).hexdigest()[:12]
+_PROC_SLOTS = (
+    "x1", "x2", "x3", "x4",
+    "y1", "y2", "y3", "y4",
+    "element_size", "pressure_val", "min_fraction", "dat_file_name",
+)
+_get_proc_values = itemgetter(*[_PROC_SLOTS.index(field) for field in _PROC_FIELDS])
+
+
+def render_rectangle_proc(
+    x_vals, y_vals, element_size, pressure_val, min_fraction, dat_file_name
+) -> str:
+    """
+    Render the proc commands of one design.
+
+    Args:
+        x_vals: (list) The four cavity corner node x values.
+        y_vals: (list) The four cavity corner node y values.
+        element_size: (float) The mesh size.
+        pressure_val: (float) The pressure to be applied to the cavity (MPa)
+        min_fraction: (float) The minimum allowed fraction of load case time.
+        dat_file_name: (str) The name of the dat file, without extension.
+
+    Returns:
+        proc: (str) The proc commands, identical to what
+            `create_rectangle_proc_dat_old` writes.
+    """
+    values = (
+        *map(str, x_vals[:4]),
+        *map(str, y_vals[:4]),
+        str(element_size),
+        str(pressure_val),
+        str(min_fraction),
+        str(dat_file_name),
+    )
+    return _PROC_TEMPLATE % _get_proc_values(values)
+
+
+def create_rectangle_proc_dat(
+    x_vals,
+    y_vals,
+    element_size,
+    pressure_val,
+    min_fraction,
+    area,
+    proc_file_name,
+    dat_file_name,
+):
+    """
+    Create a proc file using parameters passed to the function.
+        The commands are appended to the file, so calling this function with
+        the same proc_file_name combines several designs in one file.
+
+    Args:
+        x_vals: (list) The four cavity corner node x values.
+        y_vals: (list) The four cavity corner node y values.
+        element_size: (float) The mesh size.
+        pressure_val: (float) The pressure to be applied to the cavity (MPa)
+        min_fraction: (float) The minimum allowed fraction of load case time.
+        proc_file_name: (str) The name of the proc file to be created.
+        dat_file_name: (str) The name of the dat file that the .proc file will 
+            generate when run using the command `mentat -bg proc_file_name.proc`
+
+    Returns:
+        None: It just produces a .proc file.
+    """
+    with stage_timer("write_proc", dat_file_name):
+        proc = render_rectangle_proc(
+            x_vals, y_vals, element_size, pressure_val, min_fraction, dat_file_name
+        )
+        with open(f"{proc_file_name}.proc", "a") as file:
+            file.write(proc)
+
+    return None
+
+
+def _as_lists(values) -> list:
+    """The rows of an (N, 4) array or nested list as lists of python values."""
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    return [list(row) for row in values]
+
+
+def write_rectangle_procs(
+    file,
+    x_vals,
+    y_vals,
+    element_size,
+    pressure_val,
+    min_fraction,
+    dat_file_names,
+    block_size: int = 1000,
+):
+    """
+    Render many designs into one open file.
+        The designs are rendered in blocks of `block_size` and each block is
+        written with a single call.
+
+    Args:
+        file: An open, writable text file.
+        x_vals: (array) (N, 4) cavity corner x values.
+        y_vals: (array) (N, 4) cavity corner y values.
+        element_size: (float) The mesh size.
+        pressure_val: (float) The pressure to be applied to the cavity (MPa)
+        min_fraction: (float) The minimum allowed fraction of load case time.
+        dat_file_names: (list) The dat file name (no extension) of each design.
+        block_size: (int) The number of designs per write.
+
+    Returns:
+        None
+    """
+    # plain python values render like the old writer (ints stay ints)
+    x_vals = _as_lists(x_vals)
+    y_vals = _as_lists(y_vals)
+
+    for start in range(0, len(dat_file_names), block_size):
+        stop = start + block_size
+        block = dat_file_names[start:stop]
+        with stage_timer("write_proc", n_designs=len(block)):
+            file.write(
+                "".join(
+                    render_rectangle_proc(
+                        x, y, element_size, pressure_val, min_fraction, dat_file_name
+                    )
+                    for x, y, dat_file_name in zip(
+                        x_vals[start:stop], y_vals[start:stop], block
+                    )
+                )
+            )
+
+    return None
+
+
+PARAMETRIC_PREFIX = "rect_"
+_PARAMETRIC_SET = re.compile(r"^@set\(\$" + PARAMETRIC_PREFIX + r"(\w+),(.*)\)$")
+_PARAMETRIC_VAR = re.compile(r"\$" + PARAMETRIC_PREFIX + r"(\w+)")
+
+
+def render_parametric_body() -> str:
+    """
+    Render the proc commands as a reusable procedure body.
+        Every design value is replaced by a mentat procedure variable
+        ($rect_x1, $rect_element_size, ...). The final *write_marc command is
+        left out, it is issued by the driver after the body has run.
+
+    Returns:
+        body: (str) The procedure body.
+    """
+    body = PROC_COMMANDS[:-1]
+    variables = {
+        field: f"${PARAMETRIC_PREFIX}{field}"
+        for field in _PROC_SLOTS
+        if field != "dat_file_name"
+    }
+    return "".join(command.format(**variables) + "\n" for command in body)
+
+
+def write_parametric_procs(
+    body_file_name,
+    driver_file_name,
+    x_vals,
+    y_vals,
+    element_size,
+    pressure_val,
+    min_fraction,
+    dat_file_names,
+):
+    """
+    Experimental: write the parametric form of many designs, one procedure
+        body and one driver procedure. For every design the driver sets the
+        procedure variables that changed, runs the body and writes the .dat
+        file, e.g.
+
+            @set($rect_x1,11.25)
+            ...
+            *exec_procedure rectangle_body.proc
+            *write_marc 'example_model_0.dat' yes
+
+        The @set/*exec_procedure syntax and the substitution of procedure
+        variables in the body have not been checked in Mentat, only with
+        `expand_parametric_proc`, which implements the same assumptions.
+
+    Args:
+        body_file_name: (str) The body file name without extension.
+        driver_file_name: (str) The driver file name without extension.
+        x_vals: (array) (N, 4) cavity corner x values.
+        y_vals: (array) (N, 4) cavity corner y values.
+        element_size: (float) The mesh size.
+        pressure_val: (float) The pressure to be applied to the cavity (MPa)
+        min_fraction: (float) The minimum allowed fraction of load case time.
+        dat_file_names: (list) The dat file name (no extension) of each design.
+
+    Returns:
+        None
+    """
+    with stage_timer("write_proc", n_designs=len(dat_file_names)):
+        with open(f"{body_file_name}.proc", "w") as file:
+            file.write(render_parametric_body())
+
+        # mentat runs the driver from its own directory, so refer to the body
+        # by its base name
+        body_name = re.split(r"[\\/]", body_file_name)[-1]
+        constants = {
+            "element_size": str(element_size),
+            "pressure_val": str(pressure_val),
+            "min_fraction": str(min_fraction),
+        }
+
+        with open(f"{driver_file_name}.proc", "w") as file:
+            current = {}
+            for x, y, dat_file_name in zip(
+                _as_lists(x_vals), _as_lists(y_vals), dat_file_names
+            ):
+                values = {f"x{k + 1}": str(x[k]) for k in range(4)}
+                values.update({f"y{k + 1}": str(y[k]) for k in range(4)})
+                values.update(constants)
+                lines = [
+                    f"@set(${PARAMETRIC_PREFIX}{name},{value})\n"
+                    for name, value in values.items()
+                    if current.get(name) != value
+                ]
+                lines.append(f"*exec_procedure {body_name}.proc\n")
+                lines.append(f"*write_marc '{dat_file_name}.dat' yes\n")
+                file.write("".join(lines))
+                current = values
+
+    return None
+
+
+def expand_parametric_proc(driver: str, body: str) -> str:
+    """
+    Expand a parametric driver into the per design proc commands.
+        Used to check that the driver and body are consistent with each
+        other and with `render_rectangle_proc`, assuming Mentat substitutes
+        the variables like this. It is no evidence that Mentat does.
+
+    Args:
+        driver: (str) The contents of the driver procedure.
+        body: (str) The contents of the procedure body.
+
+    Returns:
+        commands: (str) The expanded commands.
+    """
+    values = {}
+    expanded = []
+    for line in driver.splitlines(keepends=True):
+        match = _PARAMETRIC_SET.match(line.rstrip("\n"))
+        if match:
+            values[match.group(1)] = match.group(2)
+        elif line.startswith("*exec_procedure"):
+            expanded.append(
+                _PARAMETRIC_VAR.sub(lambda m: values[m.group(1)], body)
+            )
+        else:
+            expanded.append(line)
+    return "".join(expanded)
+
+
+def create_rectangle_proc_dat_old(
+    x_vals,
+    y_vals,
+    element_size,
+    pressure_val,
+    min_fraction,
+    area,
+    proc_file_name,
+    dat_file_name,
+):
+    """
+    Create a proc file using parameters passed to the function.
+        The original line by line implementation, kept as a reference for
+        `create_rectangle_proc_dat`.
+
+    Args:
+        x_vals: (list) The four cavity corner node x values.
+        y_vals: (list) The four cavity corner node y values.
+        element_size: (float) The mesh size.
+        pressure_val: (float) The pressure to be applied to the cavity (MPa)
+        min_fraction: (float) The minimum allowed fraction of load case time.
+        proc_file_name: (str) The name of the proc file to be created.
+        dat_file_name: (str) The name of the dat file that the .proc file will 
+            generate when run using the command `mentat -bg proc_file_name.proc`
+
+    Returns:
+        None: It just produces a .proc file.
+    """
+
+
+    # Open the file in write mode
+    with open(f"{proc_file_name}.proc", "a") as file:
+        # Write each command to a new line, replacing the placeholders with the actual values
+        for command in PROC_COMMANDS:
+            file.write(
+                command.format(
+                    x1=x_vals[0],
+                    x2=x_vals[1],
+                    x3=x_vals[2],
+                    x4=x_vals[3],
+                    y1=y_vals[0],
+                    y2=y_vals[1],
+                    y3=y_vals[2],
+                    y4=y_vals[3],
+                    element_size=element_size,
+                    pressure_val=pressure_val,
+                    min_fraction=min_fraction,
+                    area=area,
+                    dat_file_name=dat_file_name,
+                )
+                + "\n"
+            )
+
+    return None
@@ -0,0 +1,439 @@
+"""
+Sample rectangle designs that fill the design space evenly.
+
+Random designs clump together and leave gaps, so more Marc runs are needed
+for the same accuracy of the Monte-Carlo statistics. This module samples
+(center_x, center_y, aspect_ratio, rotation, area) with a Sobol or Halton
+low discrepancy sequence, or a Latin hypercube, and drops the designs whose
+cavity does not fit inside the unit with the minimum ligament (using the
+same geometry as `create_rectangle`). Everything is vectorised, a million
+candidates take a few seconds.
+
+A sample is deterministic for a given seed, and can be extended: the state
+of the sampler is kept in a small JSON file next to the design file, so that
+
+    python design_sampler.py --n-designs 1000
+    python design_sampler.py --n-designs 1000 --extend
+
+gives the same 2000 designs as one run of 2000 (for Sobol and Halton). The
+design file has no header, like Rectangle_inputs.csv. The bounds and
+defaults are read from the [Sampler] section of config.ini.
+"""
+
+import argparse
+import configparser
+import json
+import numpy as np
+import pandas as pd
+from create_model import DESIGN_COLUMNS, UNIT_SIZE, create_rectangles
+
+METHODS = ("sobol", "halton", "lhs", "random")
+
+# The bounds of each design parameter if config.ini has none.
+DEFAULT_BOUNDS = {
+    "center_x": (5.0, 20.0),
+    "center_y": (5.0, 20.0),
+    "aspect_ratio": (1.0, 4.0),
+    "rotation": (-90.0, 90.0),
+    "area": (5.0, 60.0),
+}
+
+# Sobol direction numbers (Joe and Kuo) of dimensions 2 to 5: the degree of
+# the primitive polynomial, its coefficients and the initial direction
+# numbers. Dimension 1 is the van der Corput sequence in base 2.
+_SOBOL_POLYNOMIALS = (
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+)
+_SOBOL_BITS = 32
+_HALTON_BASES = (2, 3, 5, 7, 11)
+
+
+def read_sampler_settings(config_file: str = "config.ini") -> dict:
+    """
+    Read the sampler settings from the config file.
+
+    Args:
+        config_file: (str) The path to the config file.
+
+    Returns:
+        settings: (dict) method, seed, min_ligament and bounds (a dict of
+            (low, high) for every column in DESIGN_COLUMNS).
+    """
+    config_obj = configparser.ConfigParser()
+    config_obj.read(config_file)
+    section = config_obj["Sampler"] if "Sampler" in config_obj else {}
+
+    bounds = {}
+    for column in DESIGN_COLUMNS:
+        if column in section:
+            low, high = (float(value) for value in section[column].split(","))
+            bounds[column] = (low, high)
+        else:
+            bounds[column] = DEFAULT_BOUNDS[column]
+    return {
+        "method": section.get("method", "sobol"),
+        "seed": int(section.get("seed", 0)),
+        "min_ligament": float(section.get("min_ligament", 0.0)),
+        "bounds": bounds,
+    }
+
+
+def _sobol_directions() -> np.ndarray:
+    """The (5, _SOBOL_BITS) direction numbers, scaled to integers."""
+    directions = np.zeros((5, _SOBOL_BITS), dtype=np.uint64)
+    directions[0] = 1 << np.arange(_SOBOL_BITS - 1, -1, -1, dtype=np.uint64)
+    for d, (degree, coefficients, initial) in enumerate(_SOBOL_POLYNOMIALS, 1):
+        m = list(initial)
+        for k in range(degree, _SOBOL_BITS):
+            value = m[k - degree] ^ (m[k - degree] << degree)
+            for j in range(1, degree):
+                if (coefficients >> (degree - 1 - j)) & 1:
+                    value ^= m[k - j] << j
+            m.append(value)
+        for k in range(_SOBOL_BITS):
+            directions[d, k] = m[k] << (_SOBOL_BITS - 1 - k)
+    return directions
+
+
+def sobol_points(n_points: int, start_index: int = 0, seed: int = None) -> np.ndarray:
+    """
+    Points `start_index` to `start_index + n_points` of the 5 dimensional
+        Sobol sequence.
+
+    Args:
+        n_points: (int) The number of points.
+        start_index: (int) The index of the first point.
+        seed: (int) Optional, scramble the sequence with a random digital
+            shift, which keeps its stratification.
+
+    Returns:
+        points: (np.ndarray) The (n_points, 5) points in [0, 1).
+    """
+    stop = start_index + n_points
+    if stop > 2**_SOBOL_BITS:
+        raise ValueError(f"the Sobol sequence has only {2**_SOBOL_BITS} points")
+    index = np.arange(start_index, stop, dtype=np.uint64)
+    directions = _sobol_directions()
+    points = np.zeros((n_points, 5), dtype=np.uint64)
+    # every bit up to the highest of the last index, a bit can be unset in
+    # the whole batch and set again in a higher one
+    for k in range(max(stop - 1, 0).bit_length()):
+        bit = ((index >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        points[bit] ^= directions[:, k]
+    if seed is not None:
+        rng = np.random.default_rng(seed)
+        points ^= rng.integers(0, 2**_SOBOL_BITS, 5, dtype=np.uint64)
+    return points / float(2**_SOBOL_BITS)
+
+
+def halton_points(n_points: int, start_index: int = 0, seed: int = None) -> np.ndarray:
+    """
+    Points `start_index` to `start_index + n_points` of the 5 dimensional
+        Halton sequence (bases 2, 3, 5, 7 and 11).
+
+    Args:
+        n_points: (int) The number of points.
+        start_index: (int) The index of the first point.
+        seed: (int) Optional, shift the sequence by a random vector modulo 1.
+
+    Returns:
+        points: (np.ndarray) The (n_points, 5) points in [0, 1).
+    """
+    # point 0 of the sequence is the origin, start at 1 like the usual form
+    index = np.arange(start_index + 1, start_index + n_points + 1, dtype=np.int64)
+    points = np.zeros((n_points, 5))
+    for d, base in enumerate(_HALTON_BASES):
+        remaining = index.copy()
+        scale = 1.0 / base
+        while remaining.any():
+            points[:, d] += (remaining % base) * scale
+            remaining //= base
+            scale /= base
+    if seed is not None:
+        points = (points + np.random.default_rng(seed).random(5)) % 1.0
+    return points
+
+
+def latin_hypercube_points(n_points: int, rng) -> np.ndarray:
+    """
+    A Latin hypercube: every parameter has exactly one point in each of
+        `n_points` equal intervals.
+
+    Args:
+        n_points: (int) The number of points.
+        rng: (np.random.Generator) The random generator.
+
+    Returns:
+        points: (np.ndarray) The (n_points, 5) points in [0, 1).
+    """
+    strata = np.argsort(rng.random((5, n_points)), axis=1).T
+    return (strata + rng.random((n_points, 5))) / n_points
+
+
+def unit_points(
+    method: str, n_points: int, start_index: int = 0, seed: int = 0
+) -> np.ndarray:
+    """
+    Points of a sampling method in the unit hypercube.
+
+    Args:
+        method: (str) "sobol", "halton", "lhs" or "random".
+        n_points: (int) The number of points.
+        start_index: (int) The number of points sampled before. Sobol and
+            Halton continue their sequence. A Latin hypercube or random
+            sample is drawn with a generator seeded by (seed, start_index),
+            so only the new points form a Latin hypercube.
+        seed: (int) The seed.
+
+    Returns:
+        points: (np.ndarray) The (n_points, 5) points in [0, 1).
+    """
+    if method == "sobol":
+        return sobol_points(n_points, start_index, seed)
+    if method == "halton":
+        return halton_points(n_points, start_index, seed)
+    rng = np.random.default_rng([seed, start_index])
+    if method == "lhs":
+        return latin_hypercube_points(n_points, rng)
+    if method == "random":
+        return rng.random((n_points, 5))
+    raise ValueError(f"method must be one of {METHODS}, not {method!r}")
+
+
+def scale_points(points: np.ndarray, bounds: dict) -> np.ndarray:
+    """
+    Scale unit points to the design bounds.
+
+    Args:
+        points: (np.ndarray) The (N, 5) points in [0, 1).
+        bounds: (dict) The (low, high) of every column in DESIGN_COLUMNS.
+
+    Returns:
+        designs: (np.ndarray) The (N, 5) designs.
+    """
+    low = np.array([bounds[column][0] for column in DESIGN_COLUMNS])
+    high = np.array([bounds[column][1] for column in DESIGN_COLUMNS])
+    return low + points * (high - low)
+
+
+def sample_designs(
+    n_designs: int,
+    method: str = "sobol",
+    seed: int = 0,
+    bounds: dict = None,
+    min_ligament: float = 0.0,
+    start_index: int = 0,
+    batch_size: int = 2**16,
+) -> tuple:
+    """
+    Sample feasible designs.
+        Candidates are drawn in batches and the ones whose cavity does not
+        fit in the unit (see `check_rectangles`) are dropped, until there
+        are `n_designs`.
+
+    Args:
+        n_designs: (int) The number of feasible designs.
+        method: (str) See `unit_points`.
+        seed: (int) The seed.
+        bounds: (dict) The (low, high) of every column, DEFAULT_BOUNDS by
+            default.
+        min_ligament: (float) The minimum distance between a cavity vertex
+            and the edge of the unit.
+        start_index: (int) The number of candidates drawn before, to extend
+            a sample.
+        batch_size: (int) The smallest number of candidates drawn at a time.
+
+    Returns:
+        designs: (np.ndarray) The (n_designs, 5) designs.
+        next_index: (int) The number of candidates drawn, the start_index to
+            extend the sample with.
+    """
+    bounds = bounds or DEFAULT_BOUNDS
+    accepted = []
+    n_accepted = 0
+    index = start_index
+    acceptance = 1.0
+    while n_accepted < n_designs:
+        # draw about enough candidates for the designs still needed
+        n_candidates = int((n_designs - n_accepted) / max(acceptance, 0.01) * 1.1)
+        if method == "lhs":
+            # a Latin hypercube is only one if all its points are drawn at once
+            n_candidates = max(n_candidates, n_designs - n_accepted)
+        else:
+            n_candidates = max(n_candidates, batch_size)
+        candidates = scale_points(
+            unit_points(method, n_candidates, index, seed), bounds
+        )
+        _, valid = create_rectangles(candidates, UNIT_SIZE, min_ligament)
+        acceptance = max(valid.mean(), 1e-3)
+
+        if method == "lhs":
+            batch = candidates[valid][: n_designs - n_accepted]
+            index += n_candidates
+        else:
+            # keep exactly the candidates up to the last design needed, so
+            # the sample does not depend on the batch size
+            positions = np.flatnonzero(valid)[: n_designs - n_accepted]
+            batch = candidates[positions]
+            if len(positions) == n_designs - n_accepted:
+                index += int(positions[-1]) + 1
+            else:
+                index += n_candidates
+        accepted.append(batch)
+        n_accepted += len(batch)
+
+    designs = np.concatenate(accepted) if accepted else np.empty((0, 5))
+    return designs, index
+
+
+def _state_file(design_file: str) -> str:
+    """The file next to a design file that holds the state of the sampler."""
+    return f"{design_file}.sampler.json"
+
+
+def write_designs(
+    design_file: str,
+    n_designs: int,
+    method: str = "sobol",
+    seed: int = 0,
+    bounds: dict = None,
+    min_ligament: float = 0.0,
+    extend: bool = False,
+) -> int:
+    """
+    Write (or extend) a design file in the format of Rectangle_inputs.csv.
+
+    Args:
+        design_file: (str) The .csv file name.
+        n_designs: (int) The number of designs to write.
+        method: (str) See `unit_points`.
+        seed: (int) The seed.
+        bounds: (dict) The (low, high) of every column.
+        min_ligament: (float) See `sample_designs`.
+        extend: (bool) Append to the file, continuing the sample it holds.
+            The method, seed, bounds and ligament are taken from the state
+            file written with it.
+
+    Returns:
+        start_row: (int) The design number of the first design written.
+    """
+    start_index = 0
+    start_row = 0
+    if extend:
+        with open(_state_file(design_file)) as file:
+            state = json.load(file)
+        method, seed = state["method"], state["seed"]
+        bounds = {column: tuple(b) for column, b in state["bounds"].items()}
+        min_ligament = state["min_ligament"]
+        start_index, start_row = state["next_index"], state["n_designs"]
+
+    bounds = bounds or DEFAULT_BOUNDS
+    designs, next_index = sample_designs(
+        n_designs, method, seed, bounds, min_ligament, start_index
+    )
+    with open(design_file, "a" if extend else "w") as file:
+        np.savetxt(file, designs, fmt="%.12g", delimiter=",")
+
+    state = {
+        "method": method,
+        "seed": seed,
+        "bounds": bounds,
+        "min_ligament": min_ligament,
+        "next_index": next_index,
+        "n_designs": start_row + len(designs),
+    }
+    with open(_state_file(design_file), "w") as file:
+        json.dump(state, file, indent=2)
+    return start_row
+
+
+def iter_samples(n_designs: int, chunk_size: int = 10000, **options):
+    """
+    Sample feasible designs one at a time, to pass straight to
+        `setup_proc_file_main` (or `iter_design_chunks`) without a file.
+
+    Args:
+        n_designs: (int) The number of designs.
+        chunk_size: (int) The designs sampled at a time.
+        options: method, seed, bounds and min_ligament, see `sample_designs`.
+
+    Yields:
+        design: (tuple) (center_x, center_y, aspect_ratio, rotation, area).
+    """
+    index = 0
+    n_left = n_designs
+    while n_left > 0:
+        designs, index = sample_designs(
+            min(chunk_size, n_left), start_index=index, **options
+        )
+        n_left -= len(designs)
+        yield from map(tuple, designs.tolist())
+
+
+def discrepancy(designs, bounds: dict = None) -> float:
+    """
+    The centred L2 discrepancy of designs scaled to the unit hypercube, a
+        measure of how evenly they fill it (lower is better). The cost grows
+        with the square of the number of designs.
+
+    Args:
+        designs: (DataFrame or array) The designs.
+        bounds: (dict) The (low, high) of every column.
+
+    Returns:
+        discrepancy: (float) The centred L2 discrepancy.
+    """
+    bounds = bounds or DEFAULT_BOUNDS
+    if isinstance(designs, pd.DataFrame):
+        designs = designs[DESIGN_COLUMNS].to_numpy(dtype=float)
+    low = np.array([bounds[column][0] for column in DESIGN_COLUMNS])
+    high = np.array([bounds[column][1] for column in DESIGN_COLUMNS])
+    x = (np.asarray(designs, dtype=float) - low) / (high - low)
+    n, dims = x.shape
+
+    d = np.abs(x - 0.5)
+    term_1 = (13 / 12) ** dims
+    term_2 = np.prod(1 + 0.5 * d - 0.5 * d**2, axis=1).sum() * 2 / n
+    term_3 = 0.0
+    for i in range(n):
+        term_3 += np.prod(
+            1 + 0.5 * d[i] + 0.5 * d - 0.5 * np.abs(x[i] - x), axis=1
+        ).sum()
+    return float(np.sqrt(term_1 - term_2 + term_3 / n**2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("design_file", nargs="?", default="Rectangle_inputs.csv")
+    parser.add_argument("--n-designs", type=int, required=True)
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--method", choices=METHODS, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--min-ligament", type=float, default=None)
+    parser.add_argument(
+        "--extend", action="store_true", help="Append to the sample in the file."
+    )
+    args = parser.parse_args()
+
+    settings = read_sampler_settings(args.config)
+    for key in ("method", "seed", "min_ligament"):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+    start_row = write_designs(
+        args.design_file,
+        args.n_designs,
+        settings["method"],
+        settings["seed"],
+        settings["bounds"],
+        settings["min_ligament"],
+        args.extend,
+    )
+    print(
+        f"wrote designs {start_row} to {start_row + args.n_designs - 1} "
+        f"to {args.design_file}"
+    )
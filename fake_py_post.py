@@ -0,0 +1,204 @@
+"""
+A stand-in for the parts of the py_post module that the post processing uses.
+
+py_post ships with Marc and is not available everywhere. This module mimics
+its post file object with results held in numpy arrays, so that the post
+processing can be benchmarked and checked without Marc:
+
+    import sys
+    import fake_py_post
+
+    sys.modules["py_post"] = fake_py_post
+    import py_post_process
+
+A fake .t16 file is an .npz file written by `write_fake_t16`. Opening a file
+that starts with CRASH kills the process, as py_post does on some corrupt
+files.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+
+CRASH = b"crash"
+
+Node = namedtuple("Node", ["id", "x", "y", "z"])
+Element = namedtuple("Element", ["id", "type", "len", "items"])
+Tensor = namedtuple("Tensor", ["t11", "t12", "t13", "t22", "t23", "t33", "intensity"])
+
+
+class PostFile:
+    """
+    A fake post file.
+
+    Args:
+        coordinates: (np.ndarray) The (N, 3) node coordinates.
+        displacements: (np.ndarray) The (n_incs, N, 3) node displacements of
+            every increment after increment 0, which has no displacements.
+        times: (np.ndarray) The time of every increment after increment 0,
+            defaults to evenly spaced times ending at 1.
+        connectivity: (np.ndarray) Optional (n_elements, n_corners) node
+            indices (0-based) of the elements, all of element type 118.
+        element_tensors: (dict) Optional (n_incs, n_elements, n_points, 6)
+            element tensors of every increment after increment 0, keyed by
+            label, with the components in the order xx, yy, zz, xy, yz, zx.
+    """
+
+    def __init__(
+        self,
+        coordinates,
+        displacements,
+        times=None,
+        connectivity=None,
+        element_tensors=None,
+    ):
+        self._coordinates = np.asarray(coordinates, dtype=float)
+        displacements = np.asarray(displacements, dtype=float)
+        self._displacements = np.concatenate(
+            [np.zeros((1, *self._coordinates.shape)), displacements]
+        )
+        if times is None:
+            times = np.linspace(0, 1, len(self._displacements))[1:]
+        self._times = np.concatenate([[0.0], times])
+        if connectivity is None:
+            connectivity = np.empty((0, 4), dtype=np.int64)
+        self._connectivity = np.asarray(connectivity, dtype=np.int64)
+        self._tensor_labels = list(element_tensors or {})
+        self._tensors = [
+            np.concatenate([np.zeros((1, *t.shape[1:])), np.asarray(t, dtype=float)])
+            for t in (element_tensors or {}).values()
+        ]
+        self._increment = 0
+        self.calls = 0
+
+    def increments(self) -> int:
+        return len(self._displacements)
+
+    def moveto(self, increment: int):
+        if not 0 <= increment < len(self._displacements):
+            raise IndexError(f"increment {increment} does not exist")
+        self._increment = increment
+
+    @property
+    def time(self) -> float:
+        return float(self._times[self._increment])
+
+    def nodes(self) -> int:
+        return len(self._coordinates)
+
+    def node(self, index: int) -> Node:
+        self.calls += 1
+        x, y, z = self._coordinates[index]
+        return Node(index + 1, float(x), float(y), float(z))
+
+    def node_id(self, index: int) -> int:
+        return index + 1
+
+    def node_sequence(self, node_id: int) -> int:
+        return node_id - 1
+
+    def node_displacement(self, index: int) -> tuple:
+        self.calls += 1
+        dx, dy, dz = self._displacements[self._increment, index]
+        return float(dx), float(dy), float(dz)
+
+    def elements(self) -> int:
+        return len(self._connectivity)
+
+    def element(self, index: int) -> Element:
+        self.calls += 1
+        items = [int(node) + 1 for node in self._connectivity[index]]
+        return Element(index + 1, 118, len(items), items)
+
+    def element_id(self, index: int) -> int:
+        return index + 1
+
+    def element_sequence(self, element_id: int) -> int:
+        return element_id - 1
+
+    def element_tensors(self) -> int:
+        return len(self._tensors)
+
+    def element_tensor_label(self, index: int) -> str:
+        return self._tensor_labels[index]
+
+    def element_tensor(self, index: int, tensor_index: int) -> list:
+        self.calls += 1
+        values = self._tensors[tensor_index][self._increment, index]
+        return [
+            Tensor(
+                float(xx),
+                float(xy),
+                float(zx),
+                float(yy),
+                float(yz),
+                float(zz),
+                float(np.sqrt(xx**2 + yy**2 + zz**2 + 2 * (xy**2 + yz**2 + zx**2))),
+            )
+            for xx, yy, zz, xy, yz, zx in values
+        ]
+
+    def close(self):
+        pass
+
+
+def write_fake_t16(
+    file_name: str,
+    coordinates,
+    displacements,
+    times=None,
+    connectivity=None,
+    element_tensors=None,
+):
+    """
+    Write a fake .t16 file that `post_open` can read.
+
+    Args:
+        file_name: (str) The file name, e.g. example_model_0.t16.
+        coordinates: (np.ndarray) See `PostFile`.
+        displacements: (np.ndarray) See `PostFile`.
+        times: (np.ndarray) See `PostFile`.
+        connectivity: (np.ndarray) See `PostFile`.
+        element_tensors: (dict) See `PostFile`.
+    """
+    arrays = {"coordinates": coordinates, "displacements": displacements}
+    if times is not None:
+        arrays["times"] = times
+    if connectivity is not None:
+        arrays["connectivity"] = connectivity
+    if element_tensors:
+        arrays["tensor_labels"] = np.array(list(element_tensors), dtype=str)
+        for k, tensors in enumerate(element_tensors.values()):
+            arrays[f"tensor_{k}"] = tensors
+    with open(file_name, "wb") as file:
+        np.savez(file, **arrays)
+
+
+def post_open(file_name: str) -> PostFile:
+    """
+    Open a fake .t16 file written by `write_fake_t16`.
+
+    Args:
+        file_name: (str) The file name.
+
+    Returns:
+        post_file: (PostFile) The fake post file.
+    """
+    with open(file_name, "rb") as file:
+        if file.read(len(CRASH)) == CRASH:
+            os._exit(1)
+    with np.load(file_name) as data:
+        element_tensors = None
+        if "tensor_labels" in data:
+            element_tensors = {
+                str(label): data[f"tensor_{k}"]
+                for k, label in enumerate(data["tensor_labels"])
+            }
+        return PostFile(
+            data["coordinates"],
+            data["displacements"],
+            data["times"] if "times" in data else None,
+            data["connectivity"] if "connectivity" in data else None,
+            element_tensors,
+        )
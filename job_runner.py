@@ -0,0 +1,496 @@
+"""
+Run mentat and Marc for many designs on the local machine.
+
+This replaces the bash loop of running `mentat -bg <file>.proc` and then
+`run_marc -j <file>.dat` for one file at a time. Jobs run in a bounded pool,
+each in its own working directory so that the files Marc dumps do not
+collide. The settings are read from the [Runner] section of config.ini.
+"""
+
+import argparse
+import configparser
+import glob
+import os
+import re
+import shlex
+import shutil
+import signal
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from campaign_index import open_index, pending, refresh_index
+from cost_model import (
+    CostModel,
+    fit_from_index,
+    longest_first,
+    prediction_errors,
+    read_designs,
+)
+from create_model import read_parameters
+from marc_sts import SUCCESS_EXIT_NUMBER, StsMonitor, read_exit_number, read_sts_footer
+from pipeline_timing import enable, enabled, stage_timer
+
+
+def read_runner_settings(config_file: str = "config.ini") -> dict:
+    """
+    Read the job runner settings from the config file.
+
+    Args:
+        config_file: (str) The path to the config file.
+
+    Returns:
+        settings: (dict) max_jobs (the smaller of cores and license_tokens),
+            timeout (s, per stage), retries, work_dir, mentat_command,
+            marc_command and the stall checks of the Marc stage
+            (min_fraction, stall_increments, max_cycles, poll_interval).
+    """
+    config_obj = configparser.ConfigParser()
+    config_obj.read(config_file)
+    Runner = config_obj["Runner"]
+
+    return {
+        "max_jobs": min(int(Runner["cores"]), int(Runner["license_tokens"])),
+        "timeout": float(Runner["timeout"]),
+        "retries": int(Runner["retries"]),
+        "work_dir": Runner["work_dir"],
+        "mentat_command": Runner["mentat_command"],
+        "marc_command": Runner["marc_command"],
+        "min_fraction": float(config_obj["Parameters"]["min_time_fraction"]),
+        "stall_increments": int(Runner.get("stall_increments", 0)),
+        "max_cycles": float(Runner.get("max_cycles", 0)),
+        "poll_interval": float(Runner.get("poll_interval", 10)),
+    }
+
+
+def run_command(
+    command: str,
+    cwd: str,
+    timeout: float,
+    monitor: StsMonitor = None,
+    poll_interval: float = 10,
+) -> int:
+    """
+    Run a command, killing it (and everything it started) after `timeout`.
+        If a monitor is given its .sts file is polled every `poll_interval`
+        seconds and the command is killed as soon as the job stalls.
+
+    Args:
+        command: (str) The command line.
+        cwd: (str) The working directory.
+        timeout: (float) The time limit in seconds.
+        monitor: (StsMonitor) Optional monitor of the job's .sts file.
+        poll_interval: (float) Seconds between polls of the monitor.
+
+    Returns:
+        return_code: (int) The return code of the command, None if it was
+            killed because the monitor reported a stall.
+    """
+    posix = os.name == "posix"
+    process = subprocess.Popen(
+        shlex.split(command, posix=posix),
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=posix,
+    )
+    deadline = time.monotonic() + timeout
+    try:
+        while monitor is not None:
+            try:
+                return process.wait(
+                    timeout=min(poll_interval, deadline - time.monotonic())
+                )
+            except subprocess.TimeoutExpired:
+                if time.monotonic() >= deadline:
+                    raise
+                monitor.poll()
+                if monitor.abort_reason() is not None:
+                    _kill(process)
+                    return None
+        return process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill(process)
+        raise
+
+
+def _kill(process: subprocess.Popen):
+    """
+    Kill a process started by `run_command` and everything it started.
+
+    Args:
+        process: (subprocess.Popen) The process.
+    """
+    if os.name == "posix":
+        os.killpg(process.pid, signal.SIGKILL)
+    else:
+        process.kill()
+    process.wait()
+
+
+def run_mentat(
+    name: str, proc_dir: str, job_dir: str, settings: dict, attempt: int = 1
+) -> str:
+    """
+    Build the .dat file of one design with mentat, in a fresh job directory.
+        If there is no `name.proc` but there is a `name.dat` (e.g. from
+        quad_mesher.py), the .dat file is copied instead.
+
+    Args:
+        name: (str) The file name without extension, e.g. example_model_0.
+        proc_dir: (str) The directory with the .proc (or .dat) file.
+        job_dir: (str) The job directory, emptied first.
+        settings: (dict) The settings from `read_runner_settings`.
+        attempt: (int) The attempt number, for the timings.
+
+    Returns:
+        error: (str) None if the .dat file is in the job directory, else
+            why it is not.
+    """
+    shutil.rmtree(job_dir, ignore_errors=True)
+    os.makedirs(job_dir)
+    try:
+        if os.path.isfile(os.path.join(proc_dir, f"{name}.proc")):
+            shutil.copy(os.path.join(proc_dir, f"{name}.proc"), job_dir)
+            with stage_timer("mentat", name, attempt=attempt):
+                run_command(
+                    settings["mentat_command"].format(proc=f"{name}.proc"),
+                    job_dir,
+                    settings["timeout"],
+                )
+        else:
+            shutil.copy(os.path.join(proc_dir, f"{name}.dat"), job_dir)
+    except subprocess.TimeoutExpired:
+        return f"mentat timed out after {settings['timeout']} s"
+    except OSError as error:
+        return str(error)
+    if not os.path.isfile(os.path.join(job_dir, f"{name}.dat")):
+        return "mentat did not write the .dat file"
+    return None
+
+
+def run_marc(name: str, job_dir: str, settings: dict, attempt: int = 1) -> tuple:
+    """
+    Solve the .dat file in a job directory with Marc.
+        The .sts file is followed while Marc runs and the job is stopped if
+        it stalls, see `StsMonitor`.
+
+    Args:
+        name: (str) The file name without extension, e.g. example_model_0.
+        job_dir: (str) The job directory with the .dat file.
+        settings: (dict) The settings from `read_runner_settings`.
+        attempt: (int) The attempt number, for the timings.
+
+    Returns:
+        exit_number: (int) Marc's exit number, None if it did not finish.
+        error: (str) None if the job succeeded, else why it did not.
+        retry: (bool) False if the job was stopped because it stalled, as
+            it would stall again.
+    """
+    sts_file_name = os.path.join(job_dir, f"{name}.sts")
+    # do not follow the .sts file of a previous attempt
+    if os.path.isfile(sts_file_name):
+        os.remove(sts_file_name)
+    monitor = StsMonitor(
+        sts_file_name,
+        settings["min_fraction"],
+        stall_increments=settings["stall_increments"],
+        max_cycles=settings["max_cycles"],
+    )
+    try:
+        with stage_timer("marc", name, attempt=attempt) as counters:
+            return_code = run_command(
+                settings["marc_command"].format(dat=f"{name}.dat"),
+                job_dir,
+                settings["timeout"],
+                monitor,
+                settings["poll_interval"],
+            )
+            if enabled():
+                monitor.poll()
+                counters.update(monitor.totals())
+                footer = read_sts_footer(sts_file_name)
+                counters["exit_number"] = footer["exit_number"]
+                counters["sts_wall_time"] = footer["wall_time"]
+                counters["sts_cpu_time"] = footer["cpu_time"]
+    except subprocess.TimeoutExpired:
+        return None, f"marc timed out after {settings['timeout']} s", True
+    except OSError as error:
+        return None, str(error), True
+    if return_code is None:
+        return None, f"stopped early: {monitor.abort_reason()}", False
+
+    exit_number = read_exit_number(sts_file_name)
+    if exit_number == SUCCESS_EXIT_NUMBER:
+        return exit_number, None, True
+    return exit_number, f"exit number {exit_number}", True
+
+
+def collect_results(name: str, job_dir: str, results_dir: str, success: bool):
+    """
+    Move the .dat, .sts and .t16 files of a job to `results_dir`. The job
+        directory is removed if the job succeeded and kept for inspection if
+        it failed.
+
+    Args:
+        name: (str) The file name without extension, e.g. example_model_0.
+        job_dir: (str) The job directory.
+        results_dir: (str) Where the results go.
+        success: (bool) Whether the job succeeded.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    for extension in (".dat", ".sts", ".t16"):
+        file_name = os.path.join(job_dir, f"{name}{extension}")
+        if os.path.isfile(file_name):
+            os.replace(file_name, os.path.join(results_dir, f"{name}{extension}"))
+    if success:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def run_job(name: str, proc_dir: str, settings: dict, results_dir: str = None) -> dict:
+    """
+    Create the .dat file of one design with mentat and solve it with Marc.
+        The job runs in `work_dir/name`, see `run_mentat`, `run_marc` and
+        `collect_results`. A failed attempt is retried from mentat on.
+
+    Args:
+        name: (str) The file name without extension, e.g. example_model_0.
+        proc_dir: (str) The directory with the .proc (or .dat) file.
+        settings: (dict) The settings from `read_runner_settings`.
+        results_dir: (str) Where the results go, defaults to proc_dir.
+
+    Returns:
+        result: (dict) name, success, exit_number, attempts, wall_time (s,
+            including mentat and the retries), solver_time (the Marc wall
+            time from the .sts footer, or its cpu time, None if the job
+            failed or the footer has neither) and error (a message, None if
+            the job succeeded). Jobs stopped because they stalled are not
+            retried.
+    """
+    results_dir = results_dir or proc_dir
+    job_dir = os.path.join(settings["work_dir"], name)
+    start = time.perf_counter()
+    result = {"name": name, "success": False, "exit_number": None, "error": None}
+
+    for attempt in range(1, settings["retries"] + 2):
+        result["attempts"] = attempt
+        result["error"] = run_mentat(name, proc_dir, job_dir, settings, attempt)
+        if result["error"] is not None:
+            continue
+        result["exit_number"], result["error"], retry = run_marc(
+            name, job_dir, settings, attempt
+        )
+        result["success"] = result["error"] is None
+        if result["success"] or not retry:
+            break
+
+    collect_results(name, job_dir, results_dir, result["success"])
+    result["wall_time"] = time.perf_counter() - start
+    result["solver_time"] = None
+    if result["success"]:
+        # the time the cost model is fitted to, see `completed_runs`
+        footer = read_sts_footer(os.path.join(results_dir, f"{name}.sts"))
+        result["solver_time"] = footer["wall_time"]
+        if result["solver_time"] is None:
+            result["solver_time"] = footer["cpu_time"]
+    return result
+
+
+def run_jobs(
+    names: list,
+    proc_dir: str = "marcmentat_files",
+    settings: dict = None,
+    results_dir: str = None,
+    on_complete=None,
+) -> list:
+    """
+    Run many jobs, at most settings["max_jobs"] at a time.
+
+    Args:
+        names: (list) The file names without extension.
+        proc_dir: (str) The directory with the .proc (or .dat) files.
+        settings: (dict) The settings, defaults to `read_runner_settings()`.
+        results_dir: (str) Where the results go, defaults to proc_dir.
+        on_complete: Optional function called with the result dict of each
+            job as soon as it finishes (in the calling thread).
+
+    Returns:
+        results: (list) The result dict of every job, in the order of names.
+    """
+    settings = settings or read_runner_settings()
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=settings["max_jobs"]) as executor:
+        futures = {
+            executor.submit(run_job, name, proc_dir, settings, results_dir): name
+            for name in names
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[result["name"]] = result
+            if on_complete is not None:
+                on_complete(result)
+
+    return [results[name] for name in names]
+
+
+def order_jobs(
+    names: list,
+    cost_model: CostModel,
+    design_file="Rectangle_inputs.csv",
+    config_file: str = "config.ini",
+) -> tuple:
+    """
+    Order jobs longest predicted wall time first, so that the slow jobs do
+        not end up at the end of the queue while the other cores are idle.
+
+    Args:
+        names: (list) The file names without extension.
+        cost_model: (CostModel) The model of the wall time of a job.
+        design_file: The designs, see `iter_design_chunks` for the options.
+        config_file: (str) The config file with the loadcase parameters.
+
+    Returns:
+        names: (list) The names, longest job first.
+        predicted: (dict) The predicted wall time of each name.
+    """
+    designs = read_designs(
+        design_file, [int(name.rsplit("_", 1)[-1]) for name in names]
+    )
+    costs = cost_model.predict(designs, read_parameters(config_file))
+    predicted = {f"example_model_{i}": cost for i, cost in zip(designs.index, costs)}
+    # designs that are not in the design file go last
+    known = [name for name in names if name in predicted]
+    order = longest_first([predicted[name] for name in known])
+    ordered = [known[k] for k in order]
+    return ordered + [name for name in names if name not in predicted], predicted
+
+
+def find_jobs(proc_dir: str = "marcmentat_files") -> list:
+    """
+    Find the designs in a directory that have a .proc or .dat file.
+
+    Args:
+        proc_dir: (str) The directory to search.
+
+    Returns:
+        names: (list) The file names without extension, in design order.
+    """
+    names = set()
+    for extension in ("proc", "dat"):
+        for file_name in glob.glob(
+            os.path.join(proc_dir, f"example_model_*.{extension}")
+        ):
+            names.add(os.path.splitext(os.path.basename(file_name))[0])
+    return sorted(names, key=lambda name: int(re.findall(r"\d+", name)[-1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--proc-dir", default="marcmentat_files")
+    parser.add_argument(
+        "--post-process",
+        action="store_true",
+        help="Post process each simulation as soon as it has been solved.",
+    )
+    parser.add_argument(
+        "--strain",
+        action="store_true",
+        help="With --post-process, also append the summary of the final log "
+        "strains to Example_strain_file.txt.",
+    )
+    parser.add_argument(
+        "--cache",
+        help="With --post-process, add the final positions to this result "
+        "cache directory (see result_cache.py).",
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help="A campaign index (campaign_index.py), to only run the designs "
+        "that have not been solved yet and record the post processed ones.",
+    )
+    parser.add_argument(
+        "--cost-model",
+        default=None,
+        help="Run the longest predicted jobs first with this cost model "
+        "(cost_model.py). With --index it is refitted after the run.",
+    )
+    parser.add_argument("--designs", default="Rectangle_inputs.csv")
+    parser.add_argument(
+        "--timings", help="Append the time of every stage to this JSON lines file."
+    )
+    args = parser.parse_args()
+
+    if args.timings:
+        enable(args.timings)
+    settings = read_runner_settings(args.config)
+
+    def report(result):
+        status = "done" if result["success"] else f"failed ({result['error']})"
+        print(f"{result['name']}: {status} in {result['wall_time']:.1f} s")
+        if args.post_process and result["success"]:
+            from py_post_process import do_the_post_processing
+
+            design = int(result["name"].rsplit("_", 1)[-1])
+            do_the_post_processing(
+                design,
+                args.proc_dir,
+                f"{result['name']}.t16",
+                design=post_designs.get(design),
+                params=params,
+                cache=cache,
+                index=connection,
+                strain=args.strain,
+            )
+
+    names = find_jobs(args.proc_dir)
+    connection = None
+    if args.index is not None:
+        connection = open_index(args.index)
+        refresh_index(connection, args.proc_dir)
+        names = [f"example_model_{design}" for design in pending(connection, "marc")]
+
+    post_designs = {}
+    params = cache = None
+    if args.post_process and args.cache:
+        from result_cache import ResultCache
+
+        cache = ResultCache(args.cache)
+        params = read_parameters(args.config)
+    if (
+        args.post_process
+        and (args.strain or args.cache)
+        and os.path.isfile(args.designs)
+    ):
+        # the designs are the cache keys and give the cavity corners of the
+        # strain summary
+        numbers = [int(name.rsplit("_", 1)[-1]) for name in names]
+        post_designs = dict(read_designs(args.designs, numbers).iterrows())
+
+    predicted = {}
+    if args.cost_model:
+        model = CostModel()
+        if os.path.isfile(args.cost_model):
+            model = CostModel.load(args.cost_model)
+        names, predicted = order_jobs(names, model, args.designs, args.config)
+
+    results = run_jobs(names, args.proc_dir, settings, on_complete=report)
+    if predicted and model.n_runs:
+        done = [result for result in results if result["name"] in predicted]
+        done = [result for result in done if result["solver_time"]]
+        errors = prediction_errors(
+            [predicted[result["name"]] for result in done],
+            [result["solver_time"] for result in done],
+        )
+        print(f"cost model errors on this run: {errors}")
+    if args.index is not None:
+        refresh_index(connection, args.proc_dir)
+        if args.cost_model:
+            model = fit_from_index(connection, args.designs, args.config, model)
+            model.save(args.cost_model)
+            print(f"cost model refitted on {model.n_runs} jobs: {model.errors}")
+        connection.close()
+    if cache is not None:
+        print(cache.report())
+    print("job_runner - completed")
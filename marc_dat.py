@@ -0,0 +1,684 @@
+"""
+Work directly with the Marc .dat input files written by mentat.
+
+The .dat files use the extended precision fixed width format, where every
+real number is a 20 character field such as " 2.500000000000000-2".
+"""
+
+import argparse
+import mmap
+import re
+import shutil
+import numpy as np
+from node_search import find_nearest_nodes
+
+MARC_FLOAT_WIDTH = 20
+ELEMENT_TYPE = 118
+
+# The cards before the mesh, as written by Marc Mentat 2021.4.
+_DECK_HEADER = """\
+title               job1
+$....MARC input file produced by Marc Mentat 2021.4 (64bit)
+$...................................
+$....input file using extended precision
+extended
+$...................................
+sizing                                 0{n_elements:10d}{max_node:10d}         0
+alloc                       25
+elements                   118
+version                     15         2         0         0
+table                        0         0         2         1         1         0         0         1
+processor                    1         1         1         0
+$no list
+large stra                   4       213       123       130       230       123         1         0
+follow for                   1         0         0
+all points
+no echo                      1         2         3         4
+end
+$...................
+solver
+        12         0         0         0         0         0         0         0         0         0         0         0         0         0         0         0
+optimize                    11
+"""
+
+# The material, boundary condition, contact, loadcase and job cards that
+# `create_rectangle_proc_dat` sets up, as written by Marc Mentat 2021.4.
+_DECK_OPTIONS = """\
+ogden               structural
+
+         1         3         1         0material1
+-1.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0
+ 3.258700000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0
+ 2.436100000000000-2 1.713800000000000+0
+ 6.670300000000000-5 7.069700000000000+0
+ 4.538100000000000-4-3.365900000000000+0
+
+mat color
+
+         1         1       230         0         0
+table               linear_ramp_time1
+         1         1         0         0         2
+         1         2         1         0         0         2         0         0         2         0         0         2         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0
+ 1.000000000000000+0 1.000000000000000+0
+geometry
+         0         0         2
+         1         2         1       230         0         0
+geom1
+ 2.000000000000000-3 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+
+fixed disp
+
+         1         0         0         0         1         0apply1
+ 0.000000000000000+0 0.000000000000000+0
+         0         0
+         1         2
+         2
+apply1_nodes
+         1         0         0         0         1         0apply2
+ 0.000000000000000+0
+         0
+         1
+         2
+apply2_nodes
+dist loads
+
+         1         0         0         0         0         0apply3
+{pressure}
+         1
+         0         1
+        13
+apply3_edges
+loadcase            job1
+         3
+apply1
+apply2
+apply3
+contact                      5         0         0
+         1         0{boundary_edges:10d}         6         1      9999         3         0         0         0         0         0         0         0         0         0
+         0         0         0         0         0         0         0         1         0         0         0         0         0         0         1         0
+ 0.000000000000000+0 0.000000000000000+0 1.000000000000000+0 0.000000000000000+0 0.000000000000000+0 9.500000000000000-1 0.000000000000000+0 5.000000000000000-2
+ 1.000000000000000+0 0.000000000000000+0
+$....contact body 1: cbody1
+         1         0         0         0         0         0         0        -1cbody1
+         1         1         0         0         1       230         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 1.000000000000000+0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+         0         0         0         0
+
+$....contact interaction 1: interact1
+con intera                   3
+         1         0interact1
+         1         1         0         0
+         1         1         0         0
+         0         0         0         0         0         0         0         0         0         0         0         0         0         0         0         0
+         0         0         0         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 1.00000000000000+20 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 1.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0
+         0
+$....contact table 1: ctable1
+con table                    1
+         1         1         0ctable1
+$.....entry 1:1 (cbody1:cbody1)
+$......uses contact interaction 1 (interact1)
+         1         1         1         0         0
+         0         0         0         0         0         0         0         0
+ 2.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0         0         0         0         0         0
+ 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0
+         0         0         0
+$....allowed contact is defined by contact table 1 (ctable1)
+contact table
+         0         4
+         1
+no print
+post
+         1        16        17         0         0        19        20         0         1         0         0         0         1         0         0         0
+       681         0
+nodal                        1
+parameters
+ 1.000000000000000+0 1.000000000000000+9 1.000000000000000+2 1.000000000000000+6 2.500000000000000-1 5.000000000000000-1 1.500000000000000+0-5.000000000000000-1
+ 8.625000000000000+0 2.000000000000000+1 1.000000000000000-4 1.000000000000000-6 1.000000000000000+0 1.000000000000000-4
+ 8.314000000000000+0 2.731500000000000+2 5.000000000000000-1 0.000000000000000+0 5.670510000000000-8 1.438769000000000-2 2.997900000000000+8 1.00000000000000+30
+ 0.000000000000000+0 0.000000000000000+0 1.000000000000000+2 0.000000000000000+0 1.000000000000000+0-2.000000000000000+0 1.000000000000000+6 3.000000000000000+0
+ 0.000000000000000+0 0.000000000000000+0 1.256637061000000-6 8.85418781700000-12 1.200000000000000+2 1.000000000000000-3 1.600000000000000+2 0.000000000000000+0
+ 3.000000000000000+0 4.000000000000000-1
+end option
+$...................
+$....start of loadcase lcase1
+title               lcase1
+loadcase            lcase1
+         3
+apply1
+apply2
+apply3
+$....allowed contact is defined by contact table 1 (ctable1)
+contact table
+         0         4
+         1
+control             structural
+     99999       100         0         5         0         2         0         0         1         0         1         0         0         0         0
+ 1.000000000000000-3 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0-1.000000000000000+0 0.000000000000000+0
+ 1.000000000000000-3 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0 0.000000000000000+0-1.000000000000000+0 0.000000000000000+0
+parameters
+ 1.000000000000000+0 1.000000000000000+9 1.000000000000000+2 1.000000000000000+6 2.500000000000000-1 5.000000000000000-1 1.500000000000000+0-5.000000000000000-1
+ 8.625000000000000+0 2.000000000000000+1 1.000000000000000-4 1.000000000000000-6 1.000000000000000+0 1.000000000000000-4
+ 8.314000000000000+0 2.731500000000000+2 5.000000000000000-1 0.000000000000000+0 5.670510000000000-8 1.438769000000000-2 2.997900000000000+8 1.00000000000000+30
+ 0.000000000000000+0 0.000000000000000+0 1.000000000000000+2 0.000000000000000+0 1.000000000000000+0-1.000000000000000+0 1.000000000000000+6 3.000000000000000+0
+ 0.000000000000000+0 0.000000000000000+0 1.256637061000000-6 8.85418781700000-12 1.200000000000000+2 1.000000000000000-3 1.600000000000000+2 0.000000000000000+0
+ 3.000000000000000+0 4.000000000000000-1
+auto step
+ 1.000000000000000-2 1.000000000000000+0 1.000000000000000-1 1.000000000000000+1{min_fraction} 5.000000000000000-1     99999        30         1         0
+         0        10         0         0 0.000000000000000+0 1.200000000000000+0         1         0 2.000000000000000-4         0         0         2         1
+continue
+$....end of loadcase lcase1
+$...................
+"""
+
+
+def format_marc_float(value: float) -> str:
+    """
+    Format a number as an extended precision Marc field.
+
+    Args:
+        value: (float) The number.
+
+    Returns:
+        field: (str) The 20 character field, e.g. " 2.500000000000000-2".
+    """
+    digits = 15
+    while True:
+        mantissa, exponent = f"{value:.{digits}e}".split("e")
+        exponent = int(exponent)
+        field = f"{mantissa}{exponent:+d}"
+        if not field.startswith("-"):
+            field = " " + field
+        if len(field) <= MARC_FLOAT_WIDTH:
+            return field.rjust(MARC_FLOAT_WIDTH)
+        digits -= 1
+
+
+def parse_marc_float(field) -> float:
+    """
+    Read an extended precision Marc field.
+
+    Args:
+        field: (str or bytes) The field, e.g. " 2.500000000000000-2".
+
+    Returns:
+        value: (float) The number.
+    """
+    if isinstance(field, bytes):
+        field = field.decode()
+    field = field.strip()
+    for k in range(len(field) - 1, 0, -1):
+        if field[k] in "+-" and field[k - 1] not in "eE":
+            return float(f"{field[:k]}e{field[k:]}")
+    return float(field)
+
+
+def _find_line_after(data, card: bytes, skip_lines: int, start: int = 0) -> int:
+    """
+    Find the start of a line relative to a card header.
+
+    Args:
+        data: (mmap or bytes) The file contents.
+        card: (bytes) The card name, e.g. b"dist loads".
+        skip_lines: (int) The number of lines after the card header.
+        start: (int) Where to start searching.
+
+    Returns:
+        offset: (int) The offset of the start of the line.
+    """
+    offset = data.find(b"\n" + card, start)
+    if offset < 0:
+        raise ValueError(f"No '{card.decode()}' card found in the .dat file.")
+    offset += 1
+    for _ in range(skip_lines):
+        offset = data.find(b"\n", offset) + 1
+        if offset == 0:
+            raise ValueError(f"The '{card.decode()}' card is incomplete.")
+    return offset
+
+
+def _load_parameter_offsets(data) -> dict:
+    """
+    Locate the load parameters that `create_rectangle_proc_dat` sets.
+
+    Args:
+        data: (mmap or bytes) The .dat file contents.
+
+    Returns:
+        offsets: (dict) The byte offset of the 20 character field of each
+            parameter: "pressure" is the magnitude of the cavity edge load
+            (dist loads card) and "min_fraction" is the minimum time step
+            fraction of the loadcase (auto step card).
+    """
+    # dist loads / blank line / load header / magnitude
+    pressure = _find_line_after(data, b"dist loads", 3)
+    # auto step / initial fraction, total time, max fraction, ..., min fraction
+    loadcase = data.find(b"\nloadcase            lcase1")
+    min_fraction = _find_line_after(data, b"auto step", 1, max(loadcase, 0))
+    min_fraction += 4 * MARC_FLOAT_WIDTH
+
+    return {"pressure": pressure, "min_fraction": min_fraction}
+
+
+def read_load_parameters(dat_file_name: str) -> dict:
+    """
+    Read the load parameters of a .dat file without parsing the whole file.
+
+    Args:
+        dat_file_name: (str) The .dat file name with extension.
+
+    Returns:
+        params: (dict) The pressure and min_fraction of the model.
+    """
+    with open(dat_file_name, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offsets = _load_parameter_offsets(data)
+            return {
+                name: parse_marc_float(data[offset : offset + MARC_FLOAT_WIDTH])
+                for name, offset in offsets.items()
+            }
+
+
+def patch_dat_load_parameters(
+    dat_file_name: str,
+    new_dat_file_name: str,
+    pressure: float = None,
+    min_fraction: float = None,
+) -> dict:
+    """
+    Create a copy of a .dat file with new load parameters.
+        Only the geometry independent load values are changed, so this replaces
+        the mentat rebuild when sweeping the pressure or min_time_fraction for
+        a fixed cavity. The file is copied and the fields are overwritten in
+        place through a memory map, nothing else is parsed.
+
+    Args:
+        dat_file_name: (str) The existing .dat file, made by
+            `create_rectangle_proc_dat`.
+        new_dat_file_name: (str) The .dat file to be written.
+        pressure: (float) The new cavity pressure (MPa), None to keep it.
+        min_fraction: (float) The new minimum fraction of the load case time,
+            None to keep it.
+
+    Returns:
+        old_params: (dict) The pressure and min_fraction of the original file.
+    """
+    new_values = {"pressure": pressure, "min_fraction": min_fraction}
+
+    shutil.copyfile(dat_file_name, new_dat_file_name)
+    with open(new_dat_file_name, "r+b") as file:
+        with mmap.mmap(file.fileno(), 0) as data:
+            offsets = _load_parameter_offsets(data)
+            old_params = {}
+            for name, offset in offsets.items():
+                field = slice(offset, offset + MARC_FLOAT_WIDTH)
+                old_params[name] = parse_marc_float(data[field])
+                if new_values[name] is not None:
+                    data[field] = format_marc_float(new_values[name]).encode()
+            data.flush()
+
+    return old_params
+
+
+# A card name starts at the beginning of its line, data lines start with a blank.
+_NEXT_CARD = re.compile(rb"\n[^ \r\n]")
+
+
+def _card_block(data, card: bytes, skip_lines: int = 1) -> tuple:
+    """
+    Find the data lines of a card.
+
+    Args:
+        data: (mmap or bytes) The .dat file contents.
+        card: (bytes) The card name, e.g. b"coordinates".
+        skip_lines: (int) The number of lines between the card name and the
+            data lines.
+
+    Returns:
+        start: (int) The offset of the first data line.
+        end: (int) The offset just after the last data line.
+    """
+    start = _find_line_after(data, card, 1 + skip_lines)
+    match = _NEXT_CARD.search(data, start - 1)
+    return start, (match.start() + 1) if match else len(data)
+
+
+def _fixed_width_rows(block: bytes) -> np.ndarray:
+    """
+    View the lines of a block as a 2D array of characters.
+        If every line has the same length the block is reshaped in place,
+        otherwise the lines are padded to the longest one.
+
+    Args:
+        block: (bytes) Whole lines of the file.
+
+    Returns:
+        rows: (np.ndarray) (n_lines, line_length) uint8 array, without the
+            line endings.
+    """
+    stride = block.find(b"\n") + 1
+    chars = np.frombuffer(block, dtype=np.uint8)
+    if stride > 0 and len(chars) % stride == 0:
+        rows = chars.reshape(-1, stride)
+        if np.all(rows[:, -1] == ord("\n")):
+            ending = 2 if stride > 1 and np.all(rows[:, -2] == ord("\r")) else 1
+            return rows[:, :-ending]
+    lines = np.array(block.splitlines())
+    return lines.view(np.uint8).reshape(len(lines), -1)
+
+
+def _decode_ints(fields: np.ndarray) -> np.ndarray:
+    """
+    Decode fixed width integer fields.
+
+    Args:
+        fields: (np.ndarray) (n, width) uint8 array of characters.
+
+    Returns:
+        values: (np.ndarray) (n,) int64 array.
+    """
+    n, width = fields.shape
+    return np.ascontiguousarray(fields).view(f"S{width}").ravel().astype(np.int64)
+
+
+def _decode_floats(fields: np.ndarray) -> np.ndarray:
+    """
+    Decode fixed width Marc real fields, e.g. " 2.500000000000000-2".
+        The exponent has no "e", so one is inserted before the exponent sign
+        of every field and the fields are then converted by numpy, giving
+        exactly the same numbers as `parse_marc_float`.
+
+    Args:
+        fields: (np.ndarray) (n, width) uint8 array of characters.
+
+    Returns:
+        values: (np.ndarray) (n,) float64 array.
+    """
+    n, width = fields.shape
+    signs = (fields == ord("+")) | (fields == ord("-"))
+    digits = (fields >= ord("0")) & (fields <= ord("9"))
+    # the exponent sign is the last sign in the field and follows a digit
+    position = width - 1 - np.argmax(signs[:, ::-1], axis=1)
+    rows = np.arange(n)
+    has_exponent = signs[rows, position] & digits[rows, np.maximum(position - 1, 0)]
+    has_exponent &= position > 0
+
+    columns = np.arange(width)
+    shift = (columns[None, :] >= position[:, None]) & has_exponent[:, None]
+    text = np.full((n, width + 1), ord(" "), dtype=np.uint8)
+    text[rows[:, None], columns[None, :] + shift] = fields
+    text[rows[has_exponent], position[has_exponent]] = ord("e")
+    return text.view(f"S{width + 1}").ravel().astype(np.float64)
+
+
+def read_dat_mesh(dat_file_name: str) -> dict:
+    """
+    Read the undeformed mesh of a .dat file, without py_post.
+        The file is memory mapped and only the sizing, connectivity and
+        coordinates cards are read. Their fixed width fields are decoded a
+        whole column at a time.
+
+    Args:
+        dat_file_name: (str) The .dat file name with extension.
+
+    Returns:
+        mesh: (dict) n_elements and max_node (from the sizing card),
+            element_ids, element_types, connectivity ((n_elements, k) node
+            ids, for element 118 the 4 corner nodes and the Herrmann node),
+            node_ids and coordinates ((n_nodes, 3)). The Herrmann nodes have
+            no coordinates.
+    """
+    with open(dat_file_name, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            sizing = _find_line_after(data, b"sizing", 0)
+            sizing = data[sizing : data.find(b"\n", sizing)].split()
+            start, end = _card_block(data, b"connectivity")
+            connectivity_block = data[start:end]
+            start, end = _card_block(data, b"coordinates")
+            header = data[_find_line_after(data, b"coordinates", 1) : start].split()
+            coordinates_block = data[start:end]
+
+    rows = _fixed_width_rows(connectivity_block)
+    n_fields = rows.shape[1] // 10
+    fields = [_decode_ints(rows[:, 10 * k : 10 * k + 10]) for k in range(n_fields)]
+
+    n_coordinates = int(header[0])
+    rows = _fixed_width_rows(coordinates_block)
+    node_ids = _decode_ints(rows[:, :10])
+    coordinates = np.column_stack(
+        [
+            _decode_floats(
+                rows[:, 10 + MARC_FLOAT_WIDTH * k : 10 + MARC_FLOAT_WIDTH * (k + 1)]
+            )
+            for k in range(n_coordinates)
+        ]
+    )
+
+    return {
+        "n_elements": int(sizing[2]),
+        "max_node": int(sizing[3]),
+        "element_ids": fields[0],
+        "element_types": fields[1],
+        "connectivity": np.column_stack(fields[2:]),
+        "node_ids": node_ids,
+        "coordinates": coordinates,
+    }
+
+
+def mesh_quality(mesh: dict) -> dict:
+    """
+    Compute the quality of the quadrilateral elements of a mesh.
+
+    Args:
+        mesh: (dict) The mesh from `read_dat_mesh`.
+
+    Returns:
+        quality: (dict) Per element arrays of the signed area (positive for
+            counterclockwise nodes), the aspect ratio (longest over shortest
+            edge) and the smallest interior angle (degrees).
+    """
+    row_of_node = np.full(mesh["node_ids"].max() + 1, -1)
+    row_of_node[mesh["node_ids"]] = np.arange(len(mesh["node_ids"]))
+    corners = mesh["coordinates"][row_of_node[mesh["connectivity"][:, :4]], :2]
+
+    edges = np.roll(corners, -1, axis=1) - corners
+    lengths = np.linalg.norm(edges, axis=2)
+    area = 0.5 * np.sum(
+        corners[:, :, 0] * np.roll(corners[:, :, 1], -1, axis=1)
+        - np.roll(corners[:, :, 0], -1, axis=1) * corners[:, :, 1],
+        axis=1,
+    )
+    previous = -np.roll(edges, 1, axis=1)
+    cosine = np.sum(edges * previous, axis=2) / (lengths * np.roll(lengths, 1, axis=1))
+    angles = np.degrees(np.arccos(np.clip(cosine, -1, 1)))
+
+    return {
+        "area": area,
+        "aspect_ratio": lengths.max(axis=1) / lengths.min(axis=1),
+        "min_angle": angles.min(axis=1),
+    }
+
+
+def find_target_nodes(mesh: dict, node_targets) -> tuple:
+    """
+    Find the node closest to each target in the undeformed mesh.
+
+    Args:
+        mesh: (dict) The mesh from `read_dat_mesh`.
+        node_targets: The (T, 3) target positions, e.g. from
+            `set_up_node_targets`.
+
+    Returns:
+        node_ids: (np.ndarray) The Marc node id closest to each target.
+        distances: (np.ndarray) The distance from each target to its node.
+    """
+    rows, distances = find_nearest_nodes(mesh["coordinates"], node_targets)
+    return mesh["node_ids"][rows], distances
+
+
+def _format_set(items: list, width: int, per_line: int = 8) -> str:
+    """
+    Format the members of a set, `per_line` per line with continuation marks.
+
+    Args:
+        items: (list) The set members as strings.
+        width: (int) The field width of each member.
+        per_line: (int) The number of members per line.
+
+    Returns:
+        lines: (str) The formatted set.
+    """
+    lines = []
+    for start in range(0, len(items), per_line):
+        line = "".join(item.rjust(width) for item in items[start : start + per_line])
+        if start + per_line < len(items):
+            line += "   c"
+        lines.append(line + "\n")
+    return "".join(lines)
+
+
+def write_marc_dat(
+    dat_file_name: str,
+    coordinates,
+    connectivity,
+    cavity_elements,
+    pressure: float,
+    min_fraction: float,
+    fixed_xy_node: int = 1,
+    fixed_x_node: int = 4,
+):
+    """
+    Write a Marc input deck for the rectangular void unit.
+        The deck has the same options as the ones mentat writes from the
+        proc files of `create_rectangle_proc_dat`: plane strain element 118,
+        the Ogden material, fixed displacements on two corner nodes, the
+        ramped cavity edge load, self contact and the multicriteria loadcase.
+        The CAD body and edge/face attachment cards are not written.
+
+    Args:
+        dat_file_name: (str) The .dat file name with extension.
+        coordinates: (array) (n_nodes, 2) node coordinates, node i + 1 is
+            coordinates[i].
+        connectivity: (array) (n_elements, 4) counterclockwise corner node
+            numbers (1-based) of each element.
+        cavity_elements: (array) The element numbers (1-based) whose first
+            edge lies on the cavity.
+        pressure: (float) The pressure to be applied to the cavity (MPa)
+        min_fraction: (float) The minimum allowed fraction of load case time.
+        fixed_xy_node: (int) The node fixed in x and y.
+        fixed_x_node: (int) The node fixed in x.
+
+    Returns:
+        None
+    """
+    n_nodes = len(coordinates)
+    n_elements = len(connectivity)
+    # element 118 has an extra pressure node per element, these are numbered
+    # after the corner nodes and have no coordinates
+    herrmann_nodes = n_nodes + 1 + np.arange(n_elements)
+
+    lines = [_DECK_HEADER.format(n_elements=n_elements, max_node=n_nodes + n_elements)]
+
+    lines.append("connectivity\n")
+    lines.append(
+        "         0         0         1         0         1         1         0         1         1\n"
+    )
+    for e, (nodes, herrmann) in enumerate(zip(connectivity.tolist(), herrmann_nodes)):
+        lines.append(
+            f"{e + 1:10d}{ELEMENT_TYPE:10d}"
+            + "".join(f"{n:10d}" for n in nodes)
+            + f"{herrmann:10d}\n"
+        )
+
+    lines.append("coordinates\n")
+    lines.append(f"{3:10d}{n_nodes:10d}{0:10d}{1:10d}\n")
+    zero = format_marc_float(0.0)
+    for n, (x, y) in enumerate(coordinates.tolist()):
+        lines.append(f"{n + 1:10d}{format_marc_float(x)}{format_marc_float(y)}{zero}\n")
+
+    lines.append(
+        f"define              node                set                 apply1_nodes\n"
+    )
+    lines.append(_format_set([str(fixed_xy_node)], 12))
+    lines.append(
+        f"define              node                set                 apply2_nodes\n"
+    )
+    lines.append(_format_set([str(fixed_x_node)], 12))
+    lines.append(
+        f"define              edgemt              set                 apply3_edges\n"
+    )
+    lines.append(_format_set([f"{e}:0" for e in cavity_elements], 18))
+
+    # every element edge that is used once lies on the free boundary
+    edges = np.sort(
+        np.stack([connectivity, np.roll(connectivity, -1, axis=1)], axis=-1).reshape(
+            -1, 2
+        ),
+        axis=1,
+    )
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+
+    lines.append(
+        _DECK_OPTIONS.format(
+            pressure=format_marc_float(pressure),
+            min_fraction=format_marc_float(min_fraction),
+            boundary_edges=int(np.sum(counts == 1)),
+        )
+    )
+
+    with open(dat_file_name, "w") as file:
+        file.write("".join(lines))
+
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a copy of a .dat file with new load parameters."
+    )
+    parser.add_argument("dat_file")
+    parser.add_argument("new_dat_file")
+    parser.add_argument("--pressure", type=float)
+    parser.add_argument("--min-fraction", type=float)
+    parser.add_argument(
+        "--config", help="Take the pressure and min_time_fraction from this file."
+    )
+    args = parser.parse_args()
+
+    if args.config:
+        from create_model import read_parameters
+
+        params = read_parameters(args.config)
+        args.pressure = params["pressure"]
+        args.min_fraction = params["min_fraction"]
+
+    old = patch_dat_load_parameters(
+        args.dat_file, args.new_dat_file, args.pressure, args.min_fraction
+    )
+    print(
+        f"{args.dat_file}: pressure {old['pressure']}, min_fraction {old['min_fraction']}"
+    )
+    print(f"{args.new_dat_file}: {read_load_parameters(args.new_dat_file)}")
@@ -0,0 +1,291 @@
+"""
+Read the Marc .sts status files.
+
+Marc writes one line per increment to the .sts file while the job runs, and
+the exit number and total wall/cpu time at the end of the job. `StsMonitor`
+follows the file of a running job to report its progress and to spot jobs
+that are stalling.
+"""
+
+import argparse
+import os
+import re
+import time
+
+SUCCESS_EXIT_NUMBER = 3004
+_EXIT_NUMBER = re.compile(rb"Job ends with exit number :\s*(\d+)")
+_WALL_TIME = re.compile(rb"total wall time:\s*([0-9.]+)")
+_CPU_TIME = re.compile(rb"total cpu  time:\s*([0-9.]+)")
+
+
+def read_sts_footer(sts_file_name: str, tail_bytes: int = 4096) -> dict:
+    """
+    Read the exit number and the total wall and cpu time of a job from the
+        end of its .sts file. Only the last `tail_bytes` of the file are read.
+
+    Args:
+        sts_file_name: (str) The .sts file name with extension.
+        tail_bytes: (int) How much of the end of the file to read.
+
+    Returns:
+        footer: (dict) exit_number (int), wall_time and cpu_time (float, s),
+            each None if the job has not ended (or the file does not exist).
+    """
+    footer = {"exit_number": None, "wall_time": None, "cpu_time": None}
+    try:
+        with open(sts_file_name, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            file.seek(max(0, file.tell() - tail_bytes))
+            tail = file.read()
+    except FileNotFoundError:
+        return footer
+
+    match = _EXIT_NUMBER.search(tail)
+    if match:
+        footer["exit_number"] = int(match.group(1))
+    for key, pattern in (("wall_time", _WALL_TIME), ("cpu_time", _CPU_TIME)):
+        match = pattern.search(tail)
+        if match:
+            footer[key] = float(match.group(1))
+    return footer
+
+
+def read_exit_number(sts_file_name: str, tail_bytes: int = 4096):
+    """
+    Read the exit number of a job from the end of its .sts file.
+        Only the last `tail_bytes` of the file are read.
+
+    Args:
+        sts_file_name: (str) The .sts file name with extension.
+        tail_bytes: (int) How much of the end of the file to read.
+
+    Returns:
+        exit_number: (int) The exit number, None if the job has not ended
+            (or the file does not exist).
+    """
+    return read_sts_footer(sts_file_name, tail_bytes)["exit_number"]
+
+
+# The columns of the increment table, in the order Marc writes them.
+INCREMENT_COLUMNS = (
+    "case",
+    "increment",
+    "cycles",
+    "separations",
+    "cutbacks",
+    "total_cycles",
+    "total_separations",
+    "total_cutbacks",
+    "remeshes",
+    "time_step",
+    "total_time",
+    "displacement_min",
+    "displacement_max",
+)
+
+
+def parse_increment_line(line: bytes):
+    """
+    Parse one row of the increment table.
+
+    Args:
+        line: (bytes) One line of the .sts file.
+
+    Returns:
+        row: (dict) The values keyed by INCREMENT_COLUMNS, None if the line
+            is not an increment row (header, blank line, footer).
+    """
+    fields = line.split()
+    if len(fields) != len(INCREMENT_COLUMNS):
+        return None
+    try:
+        values = [int(field) for field in fields[:9]]
+        values += [float(field) for field in fields[9:]]
+    except ValueError:
+        return None
+    return dict(zip(INCREMENT_COLUMNS, values))
+
+
+class StsMonitor:
+    """
+    Follow the .sts file of a running job.
+        Every call to `poll` reads only what Marc has appended since the
+        previous call, so a job can be polled every few seconds for its whole
+        run at almost no cost. The wall time of an increment is the time at
+        which the monitor first saw it.
+
+    Args:
+        sts_file_name: (str) The .sts file name with extension. It does not
+            have to exist yet.
+        min_fraction: (float) The minimum time step fraction of the job, as
+            in config.ini. None disables the step collapse check.
+        stall_increments: (int) Abort if this many increments in a row ran
+            at a time step within `stall_factor` of `min_fraction`, 0 (the
+            default) never aborts. Jobs can run hundreds of increments at
+            the minimum step and still succeed (example_model_1 does 664).
+        stall_factor: (float) How close to `min_fraction` counts as
+            collapsed.
+        max_cycles: (float) Abort if the mean number of cycles per increment
+            over the last `window` increments exceeds this, 0 (the default)
+            never aborts. example_model_1 reaches 102 and succeeds.
+        window: (int) The number of increments used for the cycle check and
+            the completion estimate.
+    """
+
+    def __init__(
+        self,
+        sts_file_name: str,
+        min_fraction: float = None,
+        stall_increments: int = 0,
+        stall_factor: float = 1.5,
+        max_cycles: float = 0,
+        window: int = 10,
+    ):
+        self.sts_file_name = sts_file_name
+        self.min_fraction = min_fraction
+        self.stall_increments = stall_increments
+        self.stall_factor = stall_factor
+        self.max_cycles = max_cycles
+        self.window = window
+
+        self.increments = []
+        self.wall_times = []
+        self.exit_number = None
+        self.stalled_increments = 0
+        self._offset = 0
+        self._partial = b""
+        self._start = time.monotonic()
+
+    def poll(self) -> int:
+        """
+        Read the lines appended to the .sts file since the last poll.
+
+        Returns:
+            n_new: (int) The number of new increments.
+        """
+        try:
+            with open(self.sts_file_name, "rb") as file:
+                file.seek(self._offset)
+                data = file.read()
+        except FileNotFoundError:
+            return 0
+        self._offset += len(data)
+
+        lines = (self._partial + data).split(b"\n")
+        # the last line is incomplete until Marc writes its newline
+        self._partial = lines.pop()
+
+        now = time.monotonic() - self._start
+        n_new = 0
+        for line in lines:
+            row = parse_increment_line(line)
+            if row is None:
+                match = _EXIT_NUMBER.search(line)
+                if match:
+                    self.exit_number = int(match.group(1))
+                continue
+            self.increments.append(row)
+            self.wall_times.append(now)
+            n_new += 1
+            if (
+                self.min_fraction is not None
+                and row["increment"] > 0
+                and (row["time_step"] <= self.stall_factor * self.min_fraction)
+            ):
+                self.stalled_increments += 1
+            else:
+                self.stalled_increments = 0
+        return n_new
+
+    @property
+    def finished(self) -> bool:
+        """(bool) True once Marc has written the exit number."""
+        return self.exit_number is not None
+
+    @property
+    def progress(self) -> float:
+        """(float) The fraction of the total time reached, 0 to 1."""
+        return self.increments[-1]["total_time"] if self.increments else 0.0
+
+    def eta(self):
+        """
+        Estimate the wall time until the job completes.
+            The rate at which the total time increases over the last `window`
+            increments is extrapolated to a total time of 1.
+
+        Returns:
+            eta: (float) The estimated remaining wall time in seconds, None
+                if there is not enough history yet.
+        """
+        if len(self.increments) < 2:
+            return None
+        first = max(0, len(self.increments) - 1 - self.window)
+        d_fraction = self.progress - self.increments[first]["total_time"]
+        d_wall = self.wall_times[-1] - self.wall_times[first]
+        if d_fraction <= 0 or d_wall <= 0:
+            return None
+        return (1.0 - self.progress) * d_wall / d_fraction
+
+    def abort_reason(self):
+        """
+        Check whether the job is stalling.
+
+        Returns:
+            reason: (str) Why the job should be stopped, None if it should
+                keep running.
+        """
+        if self.finished:
+            return None
+        if self.stall_increments and self.stalled_increments >= self.stall_increments:
+            return (
+                f"time step at {self.increments[-1]['time_step']:.3g} for "
+                f"{self.stalled_increments} increments"
+            )
+        recent = self.increments[-self.window :]
+        if self.max_cycles and len(recent) == self.window:
+            mean_cycles = sum(row["cycles"] for row in recent) / self.window
+            if mean_cycles > self.max_cycles:
+                return f"{mean_cycles:.0f} cycles per increment"
+        return None
+
+    def totals(self) -> dict:
+        """
+        Returns:
+            totals: (dict) increments (the number of rows seen), and the
+                total cycles, separations and cutbacks of the job so far.
+        """
+        last = self.increments[-1] if self.increments else {}
+        return {
+            "increments": len(self.increments),
+            "cycles": last.get("total_cycles", 0),
+            "separations": last.get("total_separations", 0),
+            "cutbacks": last.get("total_cutbacks", 0),
+        }
+
+    def status(self) -> str:
+        """(str) A one line summary of the job."""
+        eta = self.eta()
+        increment = self.increments[-1]["increment"] if self.increments else 0
+        return (
+            f"{os.path.basename(self.sts_file_name)}: increment {increment}, "
+            f"{100 * self.progress:.1f} %, "
+            + (f"ETA {eta:.0f} s" if eta is not None else "ETA unknown")
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow running Marc jobs.")
+    parser.add_argument("sts_files", nargs="+")
+    parser.add_argument("--min-fraction", type=float, default=None)
+    parser.add_argument("--interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    monitors = [StsMonitor(name, args.min_fraction) for name in args.sts_files]
+    while True:
+        for monitor in monitors:
+            monitor.poll()
+            reason = monitor.abort_reason()
+            print(monitor.status() + (f" - stalling: {reason}" if reason else ""))
+        if all(monitor.finished for monitor in monitors):
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,168 @@
+"""
+Find the nodes of a mesh that are closest to a set of target points.
+
+The nodes are binned in a uniform grid over x and y (the models are planar),
+so all the targets are answered together by only looking at the nodes in the
+grid cells around each target, instead of computing the distance from every
+target to every node.
+"""
+
+import numpy as np
+
+TIE_BREAKS = ("lowest", "highest")
+
+
+def build_node_grid(coordinates: np.ndarray, cell_size: float = None) -> dict:
+    """
+    Bin the nodes in a uniform grid.
+
+    Args:
+        coordinates: (np.ndarray) The (N, 3) node coordinates.
+        cell_size: (float) The size of the grid cells, by default chosen so
+            that there are about two nodes per cell.
+
+    Returns:
+        grid: (dict) The grid, to be passed to `query_node_grid`.
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    xy = coordinates[:, :2]
+    lower = xy.min(axis=0)
+    extent = xy.max(axis=0) - lower
+    if cell_size is None:
+        area = max(extent[0], 1e-12) * max(extent[1], 1e-12)
+        cell_size = np.sqrt(2 * area / len(coordinates))
+        cell_size = max(cell_size, 1e-12, extent.max() / 4096)
+
+    shape = (extent // cell_size).astype(np.int64) + 1
+    cells = ((xy - lower) // cell_size).astype(np.int64)
+    cell_ids = cells[:, 0] * shape[1] + cells[:, 1]
+    order = np.argsort(cell_ids, kind="stable")
+    starts = np.searchsorted(cell_ids[order], np.arange(shape[0] * shape[1] + 1))
+
+    return {
+        "coordinates": coordinates,
+        "lower": lower,
+        "cell_size": float(cell_size),
+        "shape": shape,
+        "order": order,
+        "starts": starts,
+    }
+
+
+def _candidates(grid: dict, cells: np.ndarray, radius: int):
+    """
+    List the nodes in the block of cells within `radius` of each target cell.
+
+    Args:
+        grid: (dict) The grid from `build_node_grid`.
+        cells: (np.ndarray) The (T, 2) grid cell of each target.
+        radius: (int) The half width of the block, in cells.
+
+    Returns:
+        target_index: (np.ndarray) The target of each candidate.
+        node_ids: (np.ndarray) The node id of each candidate.
+    """
+    shape, starts = grid["shape"], grid["starts"]
+    offsets = np.arange(-radius, radius + 1)
+    block_x = cells[:, 0, None, None] + offsets[None, :, None]
+    block_y = cells[:, 1, None, None] + offsets[None, None, :]
+    block_x, block_y = np.broadcast_arrays(block_x, block_y)
+    inside = (
+        (block_x >= 0) & (block_x < shape[0]) & (block_y >= 0) & (block_y < shape[1])
+    )
+
+    target_index = np.arange(len(cells))[:, None, None]
+    target_index = np.broadcast_to(target_index, block_x.shape)[inside]
+    cell_ids = block_x[inside] * shape[1] + block_y[inside]
+    first = starts[cell_ids]
+    counts = starts[cell_ids + 1] - first
+
+    # expand every cell into the range of sorted node positions it holds
+    total = counts.sum()
+    target_index = np.repeat(target_index, counts)
+    positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts - first, counts)
+    return target_index, grid["order"][positions]
+
+
+def query_node_grid(
+    grid: dict, targets, tolerance: float = 0.0, tie_break: str = "lowest"
+) -> tuple:
+    """
+    Find the closest node to each target.
+        The distances are computed exactly as in a brute force search, so the
+        result is the same as taking the argmin over all the nodes.
+
+    Args:
+        grid: (dict) The grid from `build_node_grid`.
+        targets: The (T, 3) target positions.
+        tolerance: (float) Nodes within this distance of the closest node are
+            treated as equally close.
+        tie_break: (str) Which of equally close nodes to pick: "lowest" or
+            "highest" node id.
+
+    Returns:
+        node_ids: (np.ndarray) The closest node id of each target.
+        distances: (np.ndarray) The distance from each target to its node.
+    """
+    if tie_break not in TIE_BREAKS:
+        raise ValueError(f"tie_break must be one of {TIE_BREAKS}, not {tie_break!r}")
+
+    targets = np.asarray(targets, dtype=float).reshape(-1, 3)
+    coordinates, cell_size = grid["coordinates"], grid["cell_size"]
+    cells = ((targets[:, :2] - grid["lower"]) // cell_size).astype(np.int64)
+    cells = np.clip(cells, 0, grid["shape"] - 1)
+
+    node_ids = np.full(len(targets), -1, dtype=np.int64)
+    distances = np.full(len(targets), np.inf)
+    pending = np.arange(len(targets))
+    radius = 1
+    while len(pending):
+        target_index, candidates = _candidates(grid, cells[pending], radius)
+        distance = np.sqrt(
+            np.sum(
+                (coordinates[candidates] - targets[pending][target_index]) ** 2, axis=1
+            )
+        )
+
+        best = np.full(len(pending), np.inf)
+        np.minimum.at(best, target_index, distance)
+        tied = distance <= best[target_index] + tolerance
+        target_index, candidates = target_index[tied], candidates[tied]
+        sign = 1 if tie_break == "lowest" else -1
+        order = np.lexsort((sign * candidates, target_index))
+        first = np.unique(target_index[order], return_index=True)
+
+        # nodes outside the block are further than radius cells from the target
+        found = np.zeros(len(pending), dtype=bool)
+        found[first[0]] = best[first[0]] + tolerance <= radius * cell_size
+        if radius >= grid["shape"].max():
+            found[first[0]] = True
+        chosen = candidates[order][first[1]]
+        done = found[first[0]]
+        node_ids[pending[first[0][done]]] = chosen[done]
+        distances[pending[first[0][done]]] = best[first[0][done]]
+
+        pending = pending[~found]
+        radius *= 2
+
+    return node_ids, distances
+
+
+def find_nearest_nodes(
+    coordinates, targets, tolerance: float = 0.0, tie_break: str = "lowest"
+):
+    """
+    Find the closest node to each target, building the grid on the way.
+
+    Args:
+        coordinates: The (N, 3) node coordinates.
+        targets: The (T, 3) target positions.
+        tolerance: (float) See `query_node_grid`.
+        tie_break: (str) See `query_node_grid`.
+
+    Returns:
+        node_ids: (np.ndarray) The closest node id of each target.
+        distances: (np.ndarray) The distance from each target to its node.
+    """
+    grid = build_node_grid(coordinates)
+    return query_node_grid(grid, targets, tolerance, tie_break)
@@ -0,0 +1,494 @@
+"""
+Run every stage of a campaign for a stream of designs, with the stages
+overlapped.
+
+Run one after the other, create_model.py writes every proc file before the
+first job starts, and py_post_process.py waits for the last Marc job. Here
+each design moves on as soon as its previous stage is done:
+
+    proc file written -> .dat built by mentat -> solved by Marc (its .sts
+    shows the exit number) -> final positions extracted into the store
+
+The stages are connected by bounded asyncio queues and each stage has its own
+number of workers. The proc, mentat and Marc workers run in a thread pool
+with a thread for each of them, the post processing in a process pool. A stage whose queue is full waits, so e.g. the proc files
+are only written a few designs ahead of mentat rather than all at once. The
+mentat and Marc commands are the ones in the [Runner] section of config.ini
+(the other limits are in [Pipeline]), so any executables can stand in for
+them, e.g. stub scripts for testing.
+"""
+
+import argparse
+import asyncio
+import configparser
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from create_model import create_rectangles, iter_design_chunks, read_parameters
+from create_rectangle_proc_dat import render_rectangle_proc
+from job_runner import collect_results, read_runner_settings, run_marc, run_mentat
+from pipeline_timing import enable, stage_timer
+from results_store import STATUS_DONE, STATUS_FAILED, ResultsStore
+
+
+def read_pipeline_settings(config_file: str = "config.ini") -> dict:
+    """
+    Read the pipeline settings from the config file.
+
+    Args:
+        config_file: (str) The path to the config file.
+
+    Returns:
+        settings: (dict) The settings from `read_runner_settings` (max_jobs
+            is the number of Marc workers), and proc_jobs, mentat_jobs and
+            post_jobs (the workers of the other stages) and queue_size (the
+            designs that can wait between two stages).
+    """
+    settings = read_runner_settings(config_file)
+    config_obj = configparser.ConfigParser()
+    config_obj.read(config_file)
+    section = config_obj["Pipeline"] if "Pipeline" in config_obj else {}
+
+    settings.update(
+        {
+            "proc_jobs": int(section.get("proc_jobs", 1)),
+            "mentat_jobs": int(section.get("mentat_jobs", settings["max_jobs"])),
+            "post_jobs": int(section.get("post_jobs", 1)),
+            "queue_size": int(section.get("queue_size", 8)),
+        }
+    )
+    return settings
+
+
+def write_proc_file(proc_file_name: str, vertices, params: dict, dat_file_name: str):
+    """
+    Write the proc file of one design, replacing any earlier one.
+        `create_rectangle_proc_dat` appends to the file, which would give
+        mentat a second model when a design is run again.
+
+    Args:
+        proc_file_name: (str) The proc file name without extension.
+        vertices: (np.ndarray) The (4, 2) cavity corners.
+        params: (dict) The loadcase parameters from `read_parameters`.
+        dat_file_name: (str) The name of the .dat file mentat writes.
+    """
+    with stage_timer("write_proc", dat_file_name):
+        proc = render_rectangle_proc(
+            vertices[:, 0].tolist(),
+            vertices[:, 1].tolist(),
+            params["element_size"],
+            params["pressure"],
+            params["min_fraction"],
+            dat_file_name,
+        )
+        with open(f"{proc_file_name}.proc", "w") as file:
+            file.write(proc)
+
+
+class Pipeline:
+    """
+    The stages of a campaign, connected by bounded queues.
+        Without a results store the designs are only solved. The jobs run in
+        `work_dir/name` as with job_runner.py, and the .dat, .sts and .t16
+        files are moved to `results_dir` once Marc is done.
+
+    Args:
+        settings: (dict) The settings from `read_pipeline_settings`.
+        params: (dict) The loadcase parameters from `read_parameters`.
+        proc_dir: (str) Where the proc files are written.
+        results_dir: (str) Where the results go, defaults to proc_dir.
+        store: (ResultsStore) Optional results store with a row for every
+            design. Designs it already holds are skipped.
+        intervals: (int) The number of node targets per side of the unit.
+        cache: (ResultCache) Optional result cache, only used with a store.
+            A design with a cached result goes straight to the store, and
+            the new results are added to the cache.
+    """
+
+    def __init__(
+        self,
+        settings: dict,
+        params: dict,
+        proc_dir: str = "marcmentat_files",
+        results_dir: str = None,
+        store: ResultsStore = None,
+        intervals: int = 50,
+        cache=None,
+    ):
+        self.settings = settings
+        self.params = params
+        self.proc_dir = proc_dir
+        self.results_dir = results_dir or proc_dir
+        self.store = store
+        self.intervals = intervals
+        self.cache = cache if store is not None else None
+        self.node_targets = None
+        self.jobs = []
+        self._pool = None
+        self._threads = None
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        """
+        A pool of post processing workers, py_post is only needed here.
+            The workers are spawned, not forked: a worker forked while
+            another thread starts mentat or Marc would inherit the pipe that
+            subprocess waits on, and the start would hang until the worker
+            exits.
+        """
+        from py_post_process import init_worker
+
+        return ProcessPoolExecutor(
+            self.settings["post_jobs"],
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(self.node_targets,),
+        )
+
+    async def _in_thread(self, function, *args):
+        """Run a blocking function in the thread pool of the stages."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._threads, function, *args)
+
+    async def _feed(self, designs, outbox: asyncio.Queue, n_next: int):
+        """Put the designs in the first queue, as they are read."""
+        if isinstance(designs, pd.DataFrame):
+            chunks = iter([designs])
+        else:
+            chunks = iter_design_chunks(designs)
+
+        while True:
+            chunk = await self._in_thread(next, chunks, None)
+            if chunk is None:
+                break
+            vertices, valid = create_rectangles(chunk)
+            for i, index in enumerate(chunk.index):
+                job = {
+                    "design": int(index),
+                    "name": f"example_model_{index}",
+                    "stage": "design",
+                    "success": False,
+                    "exit_number": None,
+                    "error": None,
+                    "times": {},
+                }
+                self.jobs.append(job)
+                if self.store is not None:
+                    if index >= len(self.store.values):
+                        job["error"] = "the store has no row for this design"
+                        continue
+                    if self.store.status[index] == STATUS_DONE:
+                        job["stage"] = "stored"
+                        job["success"] = True
+                        continue
+                if self.cache is not None:
+                    positions = await self._in_thread(
+                        self.cache.get, chunk.loc[index], self.params, self.node_targets
+                    )
+                    if positions is not None:
+                        self.store.write(index, positions)
+                        job["stage"] = "cached"
+                        job["success"] = True
+                        continue
+                    # the design values the result is cached under
+                    job["values"] = chunk.loc[index]
+                if not valid[i]:
+                    job["error"] = "not a valid cavity"
+                    self._fail(job)
+                    continue
+                job["vertices"] = vertices[i]
+                await outbox.put(job)
+
+        for _ in range(n_next):
+            await outbox.put(None)
+
+    def _fail(self, job: dict):
+        """Record in the store that a design has no result."""
+        if self.store is not None:
+            self.store.mark(job["design"], STATUS_FAILED)
+
+    async def _run_stage(
+        self,
+        stage: str,
+        function,
+        n_workers: int,
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue,
+        n_next: int,
+    ):
+        """
+        Run the workers of one stage until the previous stage is done.
+            A design goes to the next stage if the stage function returns
+            True, otherwise its error is recorded.
+        """
+
+        async def worker():
+            while True:
+                job = await inbox.get()
+                if job is None:
+                    return
+                job["stage"] = stage
+                start = time.time()
+                try:
+                    success = await function(job)
+                except Exception as error:
+                    job["error"] = f"{type(error).__name__}: {error}"
+                    success = False
+                job["times"][stage] = (start, time.time())
+                if not success:
+                    self._fail(job)
+                elif outbox is not None:
+                    await outbox.put(job)
+                else:
+                    job["success"] = True
+
+        await asyncio.gather(*(worker() for _ in range(n_workers)))
+        for _ in range(n_next):
+            await outbox.put(None)
+
+    async def _write_proc(self, job: dict) -> bool:
+        """Write the proc file of a design."""
+        await self._in_thread(
+            write_proc_file,
+            os.path.join(self.proc_dir, job["name"]),
+            job.pop("vertices"),
+            self.params,
+            job["name"],
+        )
+        return True
+
+    async def _run_mentat(self, job: dict) -> bool:
+        """Build the .dat file of a design with mentat, see `run_mentat`."""
+        name = job["name"]
+        job_dir = os.path.join(self.settings["work_dir"], name)
+        for attempt in range(1, self.settings["retries"] + 2):
+            job["error"] = await self._in_thread(
+                run_mentat, name, self.proc_dir, job_dir, self.settings, attempt
+            )
+            if job["error"] is None:
+                return True
+        return False
+
+    async def _run_marc(self, job: dict) -> bool:
+        """
+        Solve a design with Marc, see `run_marc`, and move its results to
+            results_dir. A stalled job is not retried.
+        """
+        name = job["name"]
+        job_dir = os.path.join(self.settings["work_dir"], name)
+        for attempt in range(1, self.settings["retries"] + 2):
+            job["exit_number"], job["error"], retry = await self._in_thread(
+                run_marc, name, job_dir, self.settings, attempt
+            )
+            if job["error"] is None or not retry:
+                break
+        success = job["error"] is None
+        await self._in_thread(collect_results, name, job_dir, self.results_dir, success)
+        return success
+
+    async def _post_process(self, job: dict) -> bool:
+        """Extract the final positions of a design into the store."""
+        from py_post_process import post_process_worker
+
+        file_name = os.path.join(self.results_dir, f"{job['name']}.t16")
+        pool = self._pool
+        try:
+            positions = await asyncio.get_running_loop().run_in_executor(
+                pool, post_process_worker, file_name
+            )
+        except BrokenProcessPool:
+            # the file that crashed its worker is lost, the others go on in
+            # a new pool
+            if self._pool is pool:
+                self._pool = self._new_pool()
+                pool.shutdown(wait=False)
+            job["error"] = "the post processing process crashed"
+            return False
+        self.store.write(job["design"], positions)
+        if self.cache is not None:
+            await self._in_thread(
+                self.cache.put,
+                job.pop("values"),
+                self.params,
+                positions,
+                self.node_targets,
+            )
+        return True
+
+    async def run(self, designs) -> list:
+        """
+        Run all the stages until every design has been through them.
+
+        Args:
+            designs: The designs, a DataFrame indexed by design number or
+                anything `iter_design_chunks` reads (a .csv file, or an
+                iterable of samples such as `iter_samples` in
+                design_sampler.py).
+
+        Returns:
+            jobs: (list) A dict for every design, in the order they were
+                read: design, name, stage (the last stage it reached,
+                "stored" or "cached"), success, exit_number, error and times (the start
+                and end time.time() of each stage).
+        """
+        os.makedirs(self.proc_dir, exist_ok=True)
+        stages = [
+            ("proc", self._write_proc, self.settings["proc_jobs"]),
+            ("mentat", self._run_mentat, self.settings["mentat_jobs"]),
+            ("marc", self._run_marc, self.settings["max_jobs"]),
+        ]
+        # a thread for every proc, mentat and Marc worker and one to read
+        # the designs, so no stage waits for a thread of another
+        self._threads = ThreadPoolExecutor(
+            1 + sum(n_workers for _, _, n_workers in stages)
+        )
+        if self.store is not None:
+            from py_post_process import set_up_node_targets
+
+            self.node_targets = set_up_node_targets(self.intervals)
+            stages.append(("post", self._post_process, self.settings["post_jobs"]))
+            self._pool = self._new_pool()
+        queues = [asyncio.Queue(self.settings["queue_size"]) for _ in stages]
+
+        tasks = [asyncio.create_task(self._feed(designs, queues[0], stages[0][2]))]
+        for k, (stage, function, n_workers) in enumerate(stages):
+            last = k + 1 == len(stages)
+            tasks.append(
+                asyncio.create_task(
+                    self._run_stage(
+                        stage,
+                        function,
+                        n_workers,
+                        queues[k],
+                        None if last else queues[k + 1],
+                        0 if last else stages[k + 1][2],
+                    )
+                )
+            )
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            self._threads.shutdown()
+            self._threads = None
+            if self.store is not None:
+                self.store.flush()
+        return self.jobs
+
+
+def run_pipeline(
+    designs,
+    settings: dict = None,
+    params: dict = None,
+    proc_dir: str = "marcmentat_files",
+    results_dir: str = None,
+    store: ResultsStore = None,
+    intervals: int = 50,
+    cache=None,
+) -> list:
+    """
+    Run the whole pipeline for many designs, see `Pipeline`.
+
+    Args:
+        designs: The designs, see `Pipeline.run`.
+        settings: (dict) The settings, defaults to `read_pipeline_settings()`.
+        params: (dict) The loadcase parameters, defaults to
+            `read_parameters()`.
+        proc_dir: (str) Where the proc files are written.
+        results_dir: (str) Where the results go, defaults to proc_dir.
+        store: (ResultsStore) Optional results store for the final positions.
+        intervals: (int) The number of node targets per side of the unit.
+        cache: (ResultCache) Optional result cache, see `Pipeline`.
+
+    Returns:
+        jobs: (list) The dict of every design, see `Pipeline.run`.
+    """
+    pipeline = Pipeline(
+        settings or read_pipeline_settings(),
+        params or read_parameters(),
+        proc_dir,
+        results_dir,
+        store,
+        intervals,
+        cache,
+    )
+    return asyncio.run(pipeline.run(designs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--designs", default="Rectangle_inputs.csv")
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--proc-dir", default="marcmentat_files")
+    parser.add_argument("--results-dir", default=None)
+    parser.add_argument(
+        "--store",
+        default=None,
+        help="The results store, created if it does not exist. Defaults to "
+        "Example_output.npy in the results directory.",
+    )
+    parser.add_argument(
+        "--no-post", action="store_true", help="Only create and solve the models."
+    )
+    parser.add_argument(
+        "--cache",
+        help="Take the results of repeated designs from this cache directory "
+        "and add the new ones to it.",
+    )
+    parser.add_argument("--mentat-command", help="Overrides the config file.")
+    parser.add_argument("--marc-command", help="Overrides the config file.")
+    parser.add_argument(
+        "--timings", help="Append the time of every stage to this JSON lines file."
+    )
+    args = parser.parse_args()
+
+    if args.timings:
+        enable(args.timings)
+    settings = read_pipeline_settings(args.config)
+    for key in ("mentat_command", "marc_command"):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+
+    store = None
+    if not args.no_post:
+        from py_post_process import set_up_node_targets
+
+        store_file = args.store or os.path.join(
+            args.results_dir or args.proc_dir, "Example_output.npy"
+        )
+        n_designs = sum(len(chunk) for chunk in iter_design_chunks(args.designs))
+        n_values = 2 * len(set_up_node_targets())
+        os.makedirs(os.path.dirname(store_file) or ".", exist_ok=True)
+        num_sims = None if os.path.isfile(store_file) else n_designs
+        store = ResultsStore(store_file, num_sims, n_values)
+        if len(store.values) < n_designs:
+            raise SystemExit(f"{store_file} has fewer rows than {n_designs} designs")
+
+    cache = None
+    if args.cache and store is not None:
+        from result_cache import ResultCache
+
+        cache = ResultCache(args.cache)
+
+    jobs = run_pipeline(
+        args.designs,
+        settings,
+        read_parameters(args.config),
+        args.proc_dir,
+        args.results_dir,
+        store,
+        cache=cache,
+    )
+    for job in jobs:
+        if not job["success"]:
+            print(f"{job['name']}: failed at {job['stage']} ({job['error']})")
+    n_done = sum(job["success"] for job in jobs)
+    if cache is not None:
+        print(cache.report())
+    print(f"pipeline - {n_done} of {len(jobs)} designs completed")
@@ -0,0 +1,328 @@
+"""
+Record how long each stage of the pipeline takes for each design.
+
+Timing is off unless the MARC_PIPELINE_TIMINGS environment variable names a
+file (`enable` sets it, and worker processes inherit it). Every timed stage
+then appends one JSON line to that file:
+
+    {"stage": "marc", "design": 12, "seconds": 81.2, "start": 1700000000.0,
+     "pid": 4242, "n_designs": 1, "increments": 103, "cycles": 412, ...}
+
+When timing is off `stage_timer` returns a shared object that does nothing,
+so the instrumented code pays for one environment lookup per stage. Run
+`python pipeline_timing.py timings.jsonl` for the throughput, percentiles and
+slowest designs of every stage.
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import numpy as np
+
+TIMINGS_ENV = "MARC_PIPELINE_TIMINGS"
+
+
+def enable(file_name: str = "timings.jsonl"):
+    """
+    Start recording timings to a JSON lines file, in this process and in the
+        processes it starts. Records are appended to an existing file.
+
+    Args:
+        file_name: (str) The file name.
+    """
+    os.environ[TIMINGS_ENV] = os.path.abspath(file_name)
+
+
+def disable():
+    """Stop recording timings."""
+    os.environ.pop(TIMINGS_ENV, None)
+
+
+def enabled() -> bool:
+    """(bool) True if timings are being recorded."""
+    return TIMINGS_ENV in os.environ
+
+
+def design_number(name):
+    """
+    The design number in a file name, e.g. 12 for example_model_12.t16.
+
+    Args:
+        name: A file name, or a design number.
+
+    Returns:
+        design: (int) The design number, None if the name has none.
+    """
+    if name is None or isinstance(name, (int, np.integer)):
+        return None if name is None else int(name)
+    stem = os.path.splitext(os.path.basename(str(name)))[0]
+    numbers = re.findall(r"\d+", stem)
+    return int(numbers[-1]) if numbers else None
+
+
+def record(
+    stage: str, design=None, seconds: float = None, start: float = None, **counters
+):
+    """
+    Append one record to the timings file, if timing is on.
+
+    Args:
+        stage: (str) The pipeline stage, e.g. "read_designs" or "marc".
+        design: The design number (or a file name holding it), None for
+            records that cover several designs.
+        seconds: (float) How long the stage took.
+        start: (float) When the stage started (time.time()), defaults to
+            `seconds` before now.
+        counters: Any other values, e.g. n_designs (the number of designs
+            the record covers, 1 if not given) or increments.
+    """
+    file_name = os.environ.get(TIMINGS_ENV)
+    if file_name is None:
+        return
+    if start is None:
+        start = time.time() - (seconds or 0.0)
+    entry = {
+        "stage": stage,
+        "design": design_number(design),
+        "seconds": seconds,
+        "start": start,
+        "pid": os.getpid(),
+    }
+    entry.update(counters)
+    # one write of one line, so lines from several processes do not mix
+    with open(file_name, "a") as file:
+        file.write(json.dumps(entry, default=float) + "\n")
+
+
+class _StageTimer:
+    """
+    Time a block of code and record it when the block ends.
+        The counters dict returned by `with` can be filled in the block. If
+        the block raises, the record gets an "error" with the exception type.
+    """
+
+    __slots__ = ("stage", "design", "counters", "_start", "_wall_start")
+
+    def __init__(self, stage: str, design, counters: dict):
+        self.stage = stage
+        self.design = design
+        self.counters = counters
+
+    def __enter__(self) -> dict:
+        self._wall_start = time.time()
+        self._start = time.perf_counter()
+        return self.counters
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.counters["error"] = exc_type.__name__
+        record(self.stage, self.design, seconds, self._wall_start, **self.counters)
+        return False
+
+
+class _Counters(dict):
+    """A dict that ignores what is put in it, for when timing is off."""
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+class _NullTimer:
+    """A stage timer that does nothing, for when timing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> dict:
+        return _NULL_COUNTERS
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_COUNTERS = _Counters()
+_NULL_TIMER = _NullTimer()
+
+
+def stage_timer(stage: str, design=None, **counters):
+    """
+    Time a stage of the pipeline:
+
+        with stage_timer("marc", design=12) as counters:
+            ...
+            counters["increments"] = 103
+
+    Args:
+        stage: (str) The pipeline stage.
+        design: The design number (or a file name holding it).
+        counters: The initial counters, see `record`.
+
+    Returns:
+        timer: A context manager that yields the counters dict.
+    """
+    if TIMINGS_ENV not in os.environ:
+        return _NULL_TIMER
+    return _StageTimer(stage, design, counters)
+
+
+def timed_iter(stage: str, iterable, count=len):
+    """
+    Time how long each item of an iterable takes to produce, e.g. each chunk
+        read from a csv file.
+
+    Args:
+        stage: (str) The pipeline stage.
+        iterable: The iterable.
+        count: A function giving the number of designs in an item.
+
+    Returns:
+        iterable: The same items. When timing is off, the iterable itself.
+    """
+    if TIMINGS_ENV not in os.environ:
+        return iterable
+
+    def timed():
+        iterator = iter(iterable)
+        while True:
+            wall_start = time.time()
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            record(
+                stage,
+                seconds=time.perf_counter() - start,
+                start=wall_start,
+                n_designs=count(item),
+            )
+            yield item
+
+    return timed()
+
+
+def read_timings(file_name: str) -> list:
+    """
+    Read a timings file. Lines that are not complete records (e.g. the last
+        line of a file that is still being written) are skipped.
+
+    Args:
+        file_name: (str) The JSON lines file.
+
+    Returns:
+        records: (list) A dict for every record.
+    """
+    records = []
+    with open(file_name) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and entry.get("seconds") is not None:
+                records.append(entry)
+    return records
+
+
+def summarise_timings(records: list, top: int = 5) -> dict:
+    """
+    Aggregate the records of every stage.
+
+    Args:
+        records: (list) The records from `read_timings`.
+        top: (int) The number of slowest designs to keep per stage.
+
+    Returns:
+        summary: (dict) For every stage, in the order they first appear:
+            records, designs (the sum of n_designs), total_seconds, wall_span
+            (s from the first start to the last end), throughput (designs per
+            second of wall span, which includes any parallelism), p50, p90,
+            p99 and max (s per record), errors, the totals of the numeric
+            counters, and slowest (a list of (design, seconds)).
+    """
+    stages = {}
+    for entry in records:
+        stages.setdefault(entry["stage"], []).append(entry)
+
+    summary = {}
+    # values that do not add up
+    skip = {"stage", "design", "seconds", "start", "pid", "n_designs", "error"}
+    skip |= {"attempt", "exit_number"}
+    for stage, entries in stages.items():
+        seconds = np.array([entry["seconds"] for entry in entries], dtype=float)
+        starts = np.array([entry["start"] for entry in entries], dtype=float)
+        n_designs = sum(entry.get("n_designs", 1) for entry in entries)
+        wall_span = float(np.max(starts + seconds) - np.min(starts))
+        p50, p90, p99 = np.percentile(seconds, [50, 90, 99])
+
+        counters = {}
+        for entry in entries:
+            for key, value in entry.items():
+                if key in skip or isinstance(value, bool):
+                    continue
+                if isinstance(value, (int, float)):
+                    counters[key] = counters.get(key, 0) + value
+
+        per_design = [
+            (entry["design"], entry["seconds"])
+            for entry in entries
+            if entry.get("design") is not None
+        ]
+        per_design.sort(key=lambda item: -item[1])
+
+        summary[stage] = {
+            "records": len(entries),
+            "designs": n_designs,
+            "total_seconds": float(seconds.sum()),
+            "wall_span": wall_span,
+            "throughput": n_designs / wall_span if wall_span > 0 else None,
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(seconds.max()),
+            "errors": sum(1 for entry in entries if entry.get("error")),
+            "counters": counters,
+            "slowest": per_design[:top],
+        }
+    return summary
+
+
+def print_summary(summary: dict):
+    """
+    Print a summary from `summarise_timings` as a table.
+
+    Args:
+        summary: (dict) The summary.
+    """
+    print(
+        f"{'stage':16s} {'designs':>9s} {'total s':>10s} {'designs/s':>10s} "
+        f"{'p50 s':>9s} {'p90 s':>9s} {'p99 s':>9s} {'max s':>9s} {'errors':>6s}"
+    )
+    for stage, row in summary.items():
+        throughput = "" if row["throughput"] is None else f"{row['throughput']:.3g}"
+        print(
+            f"{stage:16s} {row['designs']:9d} {row['total_seconds']:10.3f} "
+            f"{throughput:>10s} {row['p50']:9.4f} {row['p90']:9.4f} "
+            f"{row['p99']:9.4f} {row['max']:9.4f} {row['errors']:6d}"
+        )
+    for stage, row in summary.items():
+        if row["counters"]:
+            totals = ", ".join(f"{k} {v:.6g}" for k, v in row["counters"].items())
+            print(f"{stage} totals: {totals}")
+        if row["slowest"]:
+            slowest = ", ".join(f"{d} ({s:.3g} s)" for d, s in row["slowest"])
+            print(f"{stage} slowest designs: {slowest}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a timings file.")
+    parser.add_argument("timings_file", nargs="?", default="timings.jsonl")
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    print_summary(summarise_timings(read_timings(args.timings_file), args.top))
@@ -11,10 +11,86 @@ from py_post import post_open
 import matplotlib.pyplot as plt
 import numpy as np
 import os  # for file handling
+from campaign_index import mark_post_processed
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from create_model import DESIGN_COLUMNS, create_rectangles, read_parameters
+from node_search import find_nearest_nodes
+from pipeline_timing import stage_timer
+from result_cache import ResultCache
+from results_store import (
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_MISSING,
+    ResultsStore,
+    read_results,
+)
+from strain_reductions import STRAIN_SUMMARY_FIELDS, summarise_strains, summary_vector
+from t16_sidecar import (
+    enforce_size_cap,
+    fingerprint,
+    load_sidecar,
+    save_sidecar,
+    targets_key,
+)
+
+
+def get_node_coordinates(t_16_file, node_seq=None) -> np.ndarray:
+    """
+    Get the original coordinates of the nodes, fetching each node only once.
+
+    Args:
+        t_16_file: The mentat post file object class.
+        node_seq: The node indices to get, all the nodes if None.
+
+    Returns:
+        node_coor: (np.ndarray) The (N, 3) node coordinates.
+    """
+    if node_seq is None:
+        node_seq = range(t_16_file.nodes())
 
+    node_coor = np.empty((len(node_seq), 3))
+    for i, j in enumerate(node_seq):
+        node = t_16_file.node(int(j))
+        node_coor[i] = node.x, node.y, node.z
+    return node_coor
 
-def find_closest_node(t_16_file, node_targets):
+
+def find_closest_node(t_16_file, node_targets, tolerance=0.0, tie_break="lowest"):
     """Find the node in the model that is closest to the target node.
+        All the targets are looked up together in a grid index over the node
+        coordinates. The result is the same as a brute force search.
+    
+    Args:
+        t_16_file: The mentat post file object class.
+        node_targets: tuple with all the node targets, takes form:
+            ((x1, y1, z1), (x2, y2, z2), ..., (xn, yn, zn)).
+        tolerance: (float) Nodes within this distance of the closest node
+            count as equally close.
+        tie_break: (str) Which of equally close nodes to use, the "lowest"
+            or "highest" node number.
+        
+    Returns:
+        actual_node_pos_and_num: np array of the node numbers for the node
+        targets as well as the actual position of that node. Takes the form
+        (x, y, z, node_num)
+    """
+    increment = 0
+    t_16_file.moveto(increment)
+
+    node_coor = get_node_coordinates(t_16_file)
+    closest_node_ids, _ = find_nearest_nodes(
+        node_coor, node_targets, tolerance=tolerance, tie_break=tie_break
+    )
+
+    return np.column_stack((node_coor[closest_node_ids], closest_node_ids))
+
+
+def find_closest_node_vectorised(t_16_file, node_targets):
+    """Find the node in the model that is closest to the target node.
+        The previous version of `find_closest_node`, kept as a reference. It
+        computes the distance from every target to every node.
     
     Args:
         t_16_file: The mentat post file object class.
@@ -118,17 +194,71 @@ def _write_positions_to_file(displacements: np.array, file_name):
 
     combined_array = np.concatenate((x, y), axis=0).transpose()
     # Save the x and y values to a CSV file
+    _write_values_to_file(combined_array, file_name)
+    return None
+
+
+def _write_values_to_file(values, file_name):
+    """Append a line of values to a text file, with a zero at the end."""
     with open(file_name, "a") as file:
         file.write("\n")
-        for k in combined_array:
+        for k in values:
             file.write(f"{k}, ")
         file.write("0")  # append a zero to the end of each line.
-    return None
 
 
-def get_node_position(t_16_file, node_nums="") -> tuple:
+def select_increments(t_16_file, increments=None) -> list:
+    """
+    Work out which increments of a post file to read.
+
+    Args:
+        t_16_file: The mentat post file object class.
+        increments: Which increments to read, one of:
+            None: all the increments (1 to n_incs).
+            "last": only the last increment.
+            int k: every k-th increment, counted back from the last one so
+                that the last increment is always included.
+            list of ints: these increments, negative numbers count from the
+                end (-1 is the last increment).
+            list of floats: for each target time the increment whose time is
+                closest to it. Every increment is visited to read its time,
+                but no displacements are read.
+
+    Returns:
+        increments: (list) The increment numbers, as passed to moveto.
+    """
+    n_incs = t_16_file.increments() - 1
+
+    if increments is None:
+        return list(range(1, n_incs + 1))
+    if isinstance(increments, str):
+        if increments != "last":
+            raise ValueError(f"unknown increments option {increments!r}")
+        return [n_incs]
+    if isinstance(increments, (int, np.integer)):
+        if increments < 1:
+            raise ValueError("the increment step must be at least 1")
+        return list(range(n_incs, 0, -int(increments)))[::-1]
+
+    increments = np.asarray(increments)
+    if increments.dtype.kind == "f":
+        times = np.empty(n_incs)
+        for i in range(1, n_incs + 1):
+            t_16_file.moveto(i)
+            times[i - 1] = t_16_file.time
+        closest = np.abs(times[None, :] - increments[:, None]).argmin(axis=1)
+        return [int(i) + 1 for i in closest]
+
+    selected = [int(i) + n_incs + 1 if i < 0 else int(i) for i in increments]
+    for i in selected:
+        if not 1 <= i <= n_incs:
+            raise ValueError(f"increment {i} is not between 1 and {n_incs}")
+    return selected
+
+
+def get_node_position(t_16_file, node_nums="", increments=None) -> tuple:
     """
-    get_node_position(t_16_file,node_nums = '')
+    get_node_position(t_16_file,node_nums = '', increments=None)
         Get the node coordinates and their displacements for all the time steps in all 3 dimensions without
         the need of a .dat file
 
@@ -137,10 +267,13 @@ def get_node_position(t_16_file, node_nums="") -> tuple:
         t_16_file : must be a mentat post file class
         node_nums : if data from specific set of nodes is to be extracted, list object,
         otherwise leave this blank
+        increments : which increments to read, "last", a list of increments, every
+        k-th increment or a list of target times, see `select_increments`. Only
+        these increments are visited. All the increments if left blank.
 
         Returns
         -------
-        node_position   : The final positions of the nodes.
+        node_position   : The final positions of the nodes, (n_selected_incs, n_nodes, 3).
         node_disp       : The displacements of the nodes.
 
         Written by John van Tonder 06/09/2021
@@ -152,11 +285,10 @@ def get_node_position(t_16_file, node_nums="") -> tuple:
         check_flag = 1
 
     t_16_file.moveto(1)
-    n_incs = t_16_file.increments() - 1
+    selected = select_increments(t_16_file, increments)
 
     if type(node_nums) == str:
         n_nodes = t_16_file.nodes()
-        node_seq = [t_16_file.node_sequence(i) for i in np.arange(1, n_nodes + 1)]
         node_seq = range(n_nodes)
     else:
         n_nodes = len(node_nums)
@@ -164,25 +296,15 @@ def get_node_position(t_16_file, node_nums="") -> tuple:
         # filter for nodes that do not exist
 
     # get orginal node position
-    x = np.array([t_16_file.node(int(j)).x for j in node_seq])
-    y = np.array([t_16_file.node(int(j)).y for j in node_seq])
-    z = np.array([t_16_file.node(int(j)).z for j in node_seq])
+    node_coor = get_node_coordinates(t_16_file, node_seq)
 
-    node_coor = np.vstack([x, y, z]).transpose()
-
-    # get node displacemnts
-    dx = np.zeros([n_incs, n_nodes])
-    dy = np.zeros([n_incs, n_nodes])
-    dz = np.zeros([n_incs, n_nodes])
+    # get node displacemnts of the selected increments only
+    node_disp = np.empty([len(selected), n_nodes, 3])
 
-    for i in range(1, n_incs + 1):
+    for k, i in enumerate(selected):
         t_16_file.moveto(i)
         for j, e in enumerate(node_seq):
-            dx[i - 1, j], dy[i - 1, j], dz[i - 1, j] = t_16_file.node_displacement(e)
-
-    node_disp = np.vstack(
-        [[dx.transpose()], [dy.transpose()], [dz.transpose()]]
-    ).transpose()
+            node_disp[k, j] = t_16_file.node_displacement(e)
 
     node_position = node_coor + node_disp
 
@@ -192,6 +314,230 @@ def get_node_position(t_16_file, node_nums="") -> tuple:
     return node_position, node_disp
 
 
+def iter_node_positions(t_16_file, node_nums="", increments=None, dtype=np.float64):
+    """
+    Yield the node positions one increment at a time.
+        Only one increment is held in memory, however long the job is. The
+        positions are a view into a buffer that is reused for every
+        increment, so copy them if they have to be kept.
+
+    Args:
+        t_16_file: The mentat post file object class, or the .t16 file name.
+        node_nums: The node numbers to read, all the nodes if left blank.
+        increments: Which increments to read, see `select_increments`.
+        dtype: The data type of the positions, e.g. np.float32.
+
+    Yields:
+        time: (float) The time of the increment.
+        positions: (np.ndarray) The (n_nodes, 3) node positions.
+    """
+    check_flag = 0
+    if type(t_16_file) == str:
+        t_16_file = post_open(t_16_file)
+        check_flag = 1
+
+    try:
+        t_16_file.moveto(1)
+        selected = select_increments(t_16_file, increments)
+        if type(node_nums) == str:
+            node_seq = range(t_16_file.nodes())
+        else:
+            node_seq = [i for i in node_nums]
+
+        node_coor = get_node_coordinates(t_16_file, node_seq)
+        node_disp = np.empty([len(node_seq), 3])
+        positions = np.empty([len(node_seq), 3], dtype=dtype)
+
+        for i in selected:
+            t_16_file.moveto(i)
+            for j, e in enumerate(node_seq):
+                node_disp[j] = t_16_file.node_displacement(e)
+            np.add(node_coor, node_disp, out=positions, casting="same_kind")
+            yield t_16_file.time, positions
+    finally:
+        if check_flag == 1:
+            t_16_file.close()
+
+
+def _history_times_file(file_name: str) -> str:
+    """The file next to a history file that holds its increment times."""
+    return os.path.splitext(file_name)[0] + "_times.npy"
+
+
+def write_node_history(
+    t_16_file, file_name: str, node_nums="", increments=None, dtype=np.float64
+) -> np.ndarray:
+    """
+    Stream the node positions of every selected increment into a .npy file.
+        The file is preallocated and filled one increment at a time through
+        a memory map, so the history never has to fit in memory. The
+        increment times are saved next to it in `<name>_times.npy`.
+
+    Args:
+        t_16_file: The mentat post file object class, or the .t16 file name.
+        file_name: (str) The .npy file name with extension.
+        node_nums: The node numbers to read, all the nodes if left blank.
+        increments: Which increments to read, see `select_increments`.
+        dtype: The data type of the positions, np.float32 halves the size.
+
+    Returns:
+        times: (np.ndarray) The time of each increment written.
+    """
+    check_flag = 0
+    if type(t_16_file) == str:
+        t_16_file = post_open(t_16_file)
+        check_flag = 1
+
+    try:
+        t_16_file.moveto(1)
+        selected = select_increments(t_16_file, increments)
+        n_nodes = t_16_file.nodes() if type(node_nums) == str else len(node_nums)
+
+        history = np.lib.format.open_memmap(
+            file_name, mode="w+", dtype=dtype, shape=(len(selected), n_nodes, 3)
+        )
+        times = np.empty(len(selected))
+        for k, (time, positions) in enumerate(
+            iter_node_positions(t_16_file, node_nums, selected, dtype)
+        ):
+            history[k] = positions
+            times[k] = time
+        history.flush()
+        del history
+    finally:
+        if check_flag == 1:
+            t_16_file.close()
+
+    np.save(_history_times_file(file_name), times)
+    return times
+
+
+def read_node_history(file_name: str) -> tuple:
+    """
+    Open a history written by `write_node_history` without reading it.
+
+    Args:
+        file_name: (str) The .npy file name with extension.
+
+    Returns:
+        times: (np.ndarray) The time of each increment.
+        history: (np.memmap) The read-only (n_incs, n_nodes, 3) positions.
+    """
+    times = np.load(_history_times_file(file_name))
+    return times, np.load(file_name, mmap_mode="r")
+
+
+# Other names the tensors are written under. Marc writes the logarithmic
+# strain of a large strain analysis as the total strain (post code 301).
+_TENSOR_ALIASES = {
+    "logstrain": ("logstrain", "logarithmicstrain", "totalstrain"),
+}
+
+
+def _normalise_label(label: str) -> str:
+    """A tensor label in lower case without spaces or underscores."""
+    return "".join(c for c in label.lower() if c.isalnum())
+
+
+def find_element_tensor(t_16_file, name: str = "log_strain") -> int:
+    """
+    Find an element tensor of a post file by its label.
+
+    Args:
+        t_16_file: The mentat post file object class, moved to an increment.
+        name: (str) The label, e.g. "log_strain". Case, spaces and
+            underscores are ignored.
+
+    Returns:
+        index: (int) The tensor index, as passed to element_tensor.
+    """
+    labels = [
+        _normalise_label(t_16_file.element_tensor_label(k))
+        for k in range(t_16_file.element_tensors())
+    ]
+    wanted = _normalise_label(name)
+    for candidate in _TENSOR_ALIASES.get(wanted, (wanted,)):
+        if candidate in labels:
+            return labels.index(candidate)
+    raise ValueError(f"the post file has no {name} tensor, only {labels}")
+
+
+def get_element_tensors(
+    t_16_file, name: str = "log_strain", increments="last", elements=None
+) -> np.ndarray:
+    """
+    Get an element tensor of every integration point of the elements.
+        Each selected increment is visited once and all the elements are
+        read from it.
+
+    Args:
+        t_16_file: The mentat post file object class, or a .t16 file name.
+        name: (str) The tensor label, see `find_element_tensor`.
+        increments: Which increments to read, see `select_increments`.
+        elements: The element indices to get, all the elements if None.
+
+    Returns:
+        tensors: (np.ndarray) The (n_selected_incs, n_elements, n_points, 6)
+            tensors, components xx, yy, zz, xy, yz, zx. Elements with fewer
+            integration points than the others are padded with NaN.
+    """
+    check_flag = isinstance(t_16_file, str)
+    if check_flag:
+        t_16_file = post_open(t_16_file)
+
+    t_16_file.moveto(1)
+    selected = select_increments(t_16_file, increments)
+    index = find_element_tensor(t_16_file, name)
+    if elements is None:
+        elements = range(t_16_file.elements())
+
+    tensors = None
+    for k, i in enumerate(selected):
+        t_16_file.moveto(i)
+        values = [t_16_file.element_tensor(int(e), index) for e in elements]
+        if tensors is None:
+            n_points = max((len(points) for points in values), default=0)
+            tensors = np.full((len(selected), len(values), n_points, 6), np.nan)
+        for j, points in enumerate(values):
+            tensors[k, j, : len(points)] = [
+                (t.t11, t.t22, t.t33, t.t12, t.t23, t.t13) for t in points
+            ]
+
+    if check_flag:
+        t_16_file.close()
+    if tensors is None:
+        tensors = np.empty((0, len(elements), 0, 6))
+    return tensors
+
+
+def get_element_centroids(t_16_file, elements=None) -> tuple:
+    """
+    Get the centroids of the elements in the undeformed mesh.
+        The post file is moved to increment 0 first, so it is left there.
+
+    Args:
+        t_16_file: The mentat post file object class.
+        elements: The element indices to get, all the elements if None.
+
+    Returns:
+        centroids: (np.ndarray) The (n_elements, 3) centroids.
+        element_ids: (np.ndarray) The element ids.
+    """
+    if elements is None:
+        elements = range(t_16_file.elements())
+    t_16_file.moveto(0)
+    coordinates = get_node_coordinates(t_16_file)
+
+    centroids = np.empty((len(elements), 3))
+    element_ids = np.empty(len(elements), dtype=np.int64)
+    for i, e in enumerate(elements):
+        element = t_16_file.element(int(e))
+        nodes = [t_16_file.node_sequence(n) for n in element.items]
+        centroids[i] = coordinates[nodes].mean(axis=0)
+        element_ids[i] = element.id
+    return centroids, element_ids
+
+
 def set_up_node_targets(intervals: int=50, UNIT_DIM_BASE: float=25., UNIT_DIM_BASE_X: float=25., UNIT_DIM_BASE_Y:float=25.):
     """
     Create the target node positions.
@@ -239,7 +585,100 @@ def set_up_node_targets(intervals: int=50, UNIT_DIM_BASE: float=25., UNIT_DIM_BA
     return node_targets
 
 
-def get_positions(file_name: str, node_targets: tuple):
+def get_cached_positions(
+    file_name: str, node_targets: tuple, increments="last", content_hash: bool = False
+) -> np.ndarray:
+    """
+    Get the positions of the node targets, using the sidecar of the .t16 file.
+        The first time, the coordinates and the displacements of the selected
+        increments of every node are read from the .t16 file and kept in its
+        sidecar (see t16_sidecar.py). After that py_post is only used again
+        if the .t16 file changes or other increments are asked for. A new set
+        of node targets only needs a closest node search on the sidecar.
+
+    Args:
+        file_name: (string) The .t16 file name with extension.
+        node_targets: (tuple) The positions of the nodes of interest in rest
+            state, i.e., at the start of the simulation.
+        increments: Which increments to read, see `select_increments`.
+        content_hash: (bool) Identify the .t16 file by a hash of its contents
+            rather than its size and modification time.
+
+    Returns:
+        positions: (np.ndarray) The (n_selected_incs, n_targets, 3) positions,
+            the same as `get_node_position` for the closest nodes.
+    """
+    entry, changed = _read_sidecar(file_name, increments, content_hash)
+    return _sidecar_positions(file_name, entry, node_targets, changed)
+
+
+def _read_sidecar(
+    file_name: str, increments="last", content_hash: bool = False, strains=False
+) -> tuple:
+    """
+    Load the sidecar of a .t16 file and read what it is missing from the
+        .t16 file, which is opened at most once.
+
+    Args:
+        file_name: (string) The .t16 file name with extension.
+        increments: Which increments the displacements are needed for.
+        content_hash: (bool) See `fingerprint` in t16_sidecar.py.
+        strains: (bool) The final log strains are needed as well.
+
+    Returns:
+        entry: (dict) The sidecar entry, see `load_sidecar`.
+        changed: (bool) Whether the entry has to be saved.
+    """
+    entry = load_sidecar(file_name, content_hash)
+    read_positions = entry is None or entry["increments"] != repr(increments)
+    read_strains = strains and (entry is None or entry["strains"] is None)
+    if not (read_positions or read_strains):
+        return entry, False
+
+    version = fingerprint(file_name, content_hash)
+    p_obj = py_post.post_open(file_name)
+    if read_positions:
+        p_obj.moveto(0)
+        coordinates = get_node_coordinates(p_obj)
+        _, displacements = get_node_position(p_obj, increments=increments)
+        entry = {
+            "fingerprint": version,
+            "coordinates": coordinates,
+            "displacements": displacements,
+            "increments": repr(increments),
+            "targets": {},
+            # the strains of the same version of the .t16 file still hold
+            "strains": None if entry is None else entry["strains"],
+        }
+    if read_strains:
+        tensors = get_element_tensors(p_obj, "log_strain", increments="last")[-1]
+        centroids, element_ids = get_element_centroids(p_obj)
+        entry["strains"] = {
+            "tensors": tensors,
+            "centroids": centroids,
+            "element_ids": element_ids,
+        }
+    p_obj.close()
+    return entry, True
+
+
+def _sidecar_positions(
+    file_name: str, entry: dict, node_targets: tuple, changed: bool
+) -> np.ndarray:
+    """The positions of the node targets from a sidecar entry, which is saved
+    if it changed or the node targets are new."""
+    key = targets_key(node_targets)
+    if key not in entry["targets"]:
+        entry["targets"][key], _ = find_nearest_nodes(entry["coordinates"], node_targets)
+        changed = True
+    if changed:
+        save_sidecar(file_name, entry)
+
+    nodes = entry["targets"][key]
+    return entry["coordinates"][nodes] + entry["displacements"][:, nodes]
+
+
+def get_positions(file_name: str, node_targets: tuple, sidecar: bool = False):
     """
     Get the final positions of a .t16 file.
 
@@ -247,20 +686,71 @@ def get_positions(file_name: str, node_targets: tuple):
         file_name: (string) The .t16 file name with extension.
         node_targets: (tuple) The positions of the nodes of interest in rest
             state, i.e., at the start of the simulation.
+        sidecar: (bool) Use (and fill) the sidecar of the .t16 file, see
+            `get_cached_positions`.
 
     Returns:
         final_positions: (array) The final positions of the node targets in form
             [[[x1], [y1], [z1]], [[x2], [y2], [z2]], ...]"""
 
+    if sidecar:
+        return get_cached_positions(file_name, node_targets)[-1]
+
     # Create the post objectj
     p_obj = py_post.post_open(file_name)
     nodes_pos_and_id = find_closest_node(p_obj, node_targets)
     node_numbers = [int(i[-1]) for i in nodes_pos_and_id]
-    positions, disps = get_node_position(p_obj, node_numbers)
+    positions, disps = get_node_position(p_obj, node_numbers, increments="last")
 
     return positions[-1, :, :]
 
 
+def get_positions_and_strains(
+    file_name: str,
+    node_targets: tuple,
+    corners=None,
+    sidecar: bool = False,
+    corner_radius: float = 1.0,
+) -> tuple:
+    """
+    Get the final positions of a .t16 file and a summary of its final log
+        strains, see `summarise_strains` in strain_reductions.py.
+
+    Args:
+        file_name: (string) The .t16 file name with extension.
+        node_targets: (tuple) The positions of the nodes of interest in rest
+            state.
+        corners: (np.ndarray) The (4, 2) cavity corners of the design, for
+            the corner region summary.
+        sidecar: (bool) Get the positions and the final log strains from
+            the sidecar, see `get_cached_positions`. The .t16 file is only
+            opened if the sidecar is missing or out of date.
+        corner_radius: (float) The size of the corner region.
+
+    Returns:
+        final_positions: (np.ndarray) The final positions of the node targets.
+        strains: (np.ndarray) The summary values, in the order of
+            STRAIN_SUMMARY_FIELDS.
+    """
+    if sidecar:
+        entry, changed = _read_sidecar(file_name, strains=True)
+        positions = _sidecar_positions(file_name, entry, node_targets, changed)[-1]
+        tensors = entry["strains"]["tensors"]
+        centroids = entry["strains"]["centroids"]
+        element_ids = entry["strains"]["element_ids"]
+    else:
+        p_obj = py_post.post_open(file_name)
+        nodes_pos_and_id = find_closest_node(p_obj, node_targets)
+        node_numbers = [int(i[-1]) for i in nodes_pos_and_id]
+        positions = get_node_position(p_obj, node_numbers, increments="last")[0][-1]
+        tensors = get_element_tensors(p_obj, "log_strain", increments="last")[-1]
+        centroids, element_ids = get_element_centroids(p_obj)
+        p_obj.close()
+
+    summary = summarise_strains(tensors, centroids, element_ids, corners, corner_radius)
+    return positions, summary_vector(summary)
+
+
 def check_if_file_exists(file_name: str, directory: str):
     """
     Check if a file exists. If not, write the file name to a file
@@ -278,11 +768,27 @@ def check_if_file_exists(file_name: str, directory: str):
         return True
     else:
         print(file_name)
-        with open(f"{directory}\missing_files.txt", "a") as f:
-            f.write(f"{file_name}\n")
+        _record_file_name(os.path.join(directory, "missing_files.txt"), file_name)
         return False
 
 
+def _record_file_name(list_file: str, file_name: str):
+    """
+    Append a file name to a list file, unless it is listed already (e.g.
+        by an earlier run of the post processing).
+
+    Args:
+        list_file: (string) The list file, e.g. missing_files.txt.
+        file_name: (string) The file name to add.
+    """
+    if os.path.isfile(list_file):
+        with open(list_file) as f:
+            if file_name in f.read().splitlines():
+                return
+    with open(list_file, "a") as f:
+        f.write(f"{file_name}\n")
+
+
 def _check_if_successful(file_name: str, directory: str):
     """
     Open the .sts file and check if the exit code is 3004. if not write the
@@ -307,19 +813,42 @@ def _check_if_successful(file_name: str, directory: str):
         if word in content:
             successful_run = True
         else:
-            with open(f"{directory}\\failed_sims.txt", "a") as f:
-                f.write(f"{file_name}\n") 
+            _record_file_name(os.path.join(directory, "failed_sims.txt"), file_name)
     return successful_run
 
 
-def do_the_post_processing(iteration: int, directory_loc: str, file_name: str):
+def do_the_post_processing(
+    iteration: int,
+    directory_loc: str,
+    file_name: str,
+    design=None,
+    params: dict = None,
+    cache=None,
+    index=None,
+    strain: bool = False,
+):
     """
     Do the post processing for the given simulation.
+        If a result cache and the design are given, the cache is checked
+        first and new results are added to it. With strain, the summary of
+        the final log strains is appended to Example_strain_file.txt, one
+        line per simulation in the order of STRAIN_SUMMARY_FIELDS. The cache
+        only holds positions, so it is not used then.
 
     Args:
         iteration: (int) The iteration number.
         directory_loc: (string) The directory where the .dat files are located.
         file_name: (string) The file name of the .dat file with extension.
+        design: The design of this simulation (e.g. its row of
+            Rectangle_inputs.csv), only needed with a cache or for the
+            corner region of the strain summary.
+        params: (dict) The loadcase parameters, only needed with a cache.
+        cache: (ResultCache) Optional result cache.
+        index: (sqlite3.Connection) Optional campaign index
+            (campaign_index.py), the simulation is marked post processed in
+            it once its positions are written.
+        strain: (bool) Summarise the final log strains as well, see
+            `get_positions_and_strains`.
 
     Returns:
         None
@@ -332,41 +861,384 @@ def do_the_post_processing(iteration: int, directory_loc: str, file_name: str):
     size_y = 25
     node_targets = set_up_node_targets(intervals, unit_size, size_x, size_y)
 
-    out_put_file = f"{directory_loc}\Example_ouput_file.txt"
+    out_put_file = os.path.join(directory_loc, "Example_ouput_file.txt")
+    strain_file = os.path.join(directory_loc, "Example_strain_file.txt")
 
-    file_name = f"{directory_loc}\\{file_name}" 
+    use_cache = cache is not None and design is not None and not strain
+    if use_cache:
+        positions = cache.get(design, params, node_targets)
+        if positions is not None:
+            _write_positions_to_file(positions, out_put_file)
+            if index is not None:
+                mark_post_processed(index, [iteration])
+            return
+
+    file_name = os.path.join(directory_loc, file_name)
     if check_if_file_exists(file_name, directory_loc):
         if _check_if_successful(file_name, directory_loc):
-            positions = get_positions(
-                file_name=file_name, node_targets=node_targets
-            )
+            with stage_timer("post_process", iteration, strain=strain):
+                if strain:
+                    corners = None if design is None else _design_corners(design)
+                    positions, summary = get_positions_and_strains(
+                        file_name, node_targets, corners
+                    )
+                else:
+                    positions = get_positions(
+                        file_name=file_name, node_targets=node_targets
+                    )
             _write_positions_to_file(positions, out_put_file)
+            if strain:
+                _write_values_to_file(summary, strain_file)
+            if use_cache:
+                cache.put(design, params, positions, node_targets)
+            if index is not None:
+                mark_post_processed(index, [iteration])
         else:
             print(f"Simulation {iteration} failed.")
     else:
         print(f"Simulation {iteration} does not exist.")
 
 
+def _design_corners(design) -> np.ndarray:
+    """The (4, 2) cavity corners of a design, a row of Rectangle_inputs.csv
+    as a sequence or with the DESIGN_COLUMNS keys."""
+    if hasattr(design, "keys"):
+        design = [design[column] for column in DESIGN_COLUMNS]
+    return create_rectangles([design])[0][0]
+
+
+# The node targets of a worker process, whether it uses the .t16 sidecars
+# and whether it summarises the strains, set once by `init_worker`.
+_worker_node_targets = None
+_worker_sidecar = False
+_worker_strain = False
+
+
+def init_worker(node_targets: tuple, sidecar: bool = False, strain: bool = False):
+    """
+    Set up a post processing worker process, of `post_process_parallel` or
+        of pipeline.py. py_post is imported once per worker, with this module, and the node
+        targets are kept for all the files the worker processes.
+
+    Args:
+        node_targets: (tuple) The node targets.
+        sidecar: (bool) Use the sidecars of the .t16 files.
+        strain: (bool) Summarise the log strains as well.
+    """
+    global _worker_node_targets, _worker_sidecar, _worker_strain
+    _worker_node_targets = node_targets
+    _worker_sidecar = sidecar
+    _worker_strain = strain
+
+
+def post_process_worker(file_name: str, corners=None):
+    """
+    Get the final positions of one .t16 file in a worker process.
+
+    Args:
+        file_name: (string) The .t16 file name with extension.
+        corners: (np.ndarray) The cavity corners of the design, only used
+            when the worker summarises the strains.
+
+    Returns:
+        positions: (np.ndarray) The final positions of the node targets, or
+            the positions and the strain summary, see
+            `get_positions_and_strains`.
+    """
+    with stage_timer(
+        "post_process", file_name, sidecar=_worker_sidecar, strain=_worker_strain
+    ):
+        if _worker_strain:
+            return get_positions_and_strains(
+                file_name, _worker_node_targets, corners, _worker_sidecar
+            )
+        return get_positions(file_name, _worker_node_targets, _worker_sidecar)
+
+
+def _run_in_pool(
+    file_names: dict,
+    node_targets: tuple,
+    processes: int,
+    sidecar: bool = False,
+    strain: bool = False,
+    corners: dict = None,
+):
+    """
+    Get the final positions of many .t16 files in a process pool.
+        Results are yielded as they finish. An exception in a worker only
+        fails its own file. At most `processes` files are given to the pool
+        at a time, so if a worker dies (e.g. py_post crashes on a corrupt
+        file) the file that killed it is one of those. The files that were
+        not given to the pool yet go on in a new pool of `processes`
+        workers, and only the ones that were in flight are run again, each
+        in a fresh process of its own, so the file that kills its worker is
+        the only one lost.
+
+    Args:
+        file_names: (dict) The .t16 file name of each iteration.
+        node_targets: (tuple) The node targets.
+        processes: (int) The number of worker processes.
+        sidecar: (bool) Use the sidecars of the .t16 files.
+        strain: (bool) Summarise the log strains as well.
+        corners: (dict) The cavity corners of each iteration, if known.
+
+    Yields:
+        iteration: (int) The iteration number.
+        positions: (np.ndarray) The final positions (with strain, a tuple of
+            the positions and the strain summary), None if it failed.
+        error: (str) Why it failed, None if it did not.
+    """
+    corners = corners or {}
+    initargs = (node_targets, sidecar, strain)
+    processes = processes or os.cpu_count()
+    remaining = deque(file_names)
+    in_flight_at_crash = []
+    while remaining:
+        with ProcessPoolExecutor(
+            processes, initializer=init_worker, initargs=initargs
+        ) as executor:
+            running = {}
+            broken = False
+            while remaining or running:
+                while remaining and len(running) < processes:
+                    iteration = remaining.popleft()
+                    future = executor.submit(
+                        post_process_worker,
+                        file_names[iteration],
+                        corners.get(iteration),
+                    )
+                    running[future] = iteration
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                if any(isinstance(f.exception(), BrokenProcessPool) for f in done):
+                    # every file still in the pool fails with the crash
+                    broken = True
+                    done, _ = wait(running)
+                for future in done:
+                    iteration = running.pop(future)
+                    try:
+                        yield iteration, future.result(), None
+                    except BrokenProcessPool:
+                        in_flight_at_crash.append(iteration)
+                    except Exception as error:
+                        yield iteration, None, f"{type(error).__name__}: {error}"
+                if broken:
+                    break
+
+    for iteration in sorted(in_flight_at_crash):
+        with ProcessPoolExecutor(
+            1, initializer=init_worker, initargs=initargs
+        ) as executor:
+            future = executor.submit(
+                post_process_worker, file_names[iteration], corners.get(iteration)
+            )
+            try:
+                yield iteration, future.result(), None
+            except BrokenProcessPool:
+                yield iteration, None, "the post processing process crashed"
+            except Exception as error:
+                yield iteration, None, f"{type(error).__name__}: {error}"
+
+
+def post_process_parallel(
+    iterations,
+    directory_loc: str,
+    processes: int = None,
+    file_name_format: str = "example_model_{}.t16",
+    designs=None,
+    params: dict = None,
+    cache=None,
+    store=None,
+    sidecar: bool = False,
+    sidecar_max_bytes: int = None,
+    intervals: int = 50,
+    strain: bool = False,
+    index=None,
+) -> dict:
+    """
+    Do the post processing of many simulations in a process pool.
+        The missing and failed simulations are found and recorded as in
+        `do_the_post_processing`, then the .t16 files are read by the
+        workers. The results come back to this process, which is the only
+        one that writes the output file, in iteration order, so the file is
+        the same as when the simulations are post processed one by one. A
+        file that cannot be read is reported and skipped. With a results
+        store the rows go to the store instead of the text file, and the
+        simulations the store already holds are skipped. With strain, the
+        summary of the final log strains of every simulation is written to
+        the store after its positions.
+
+    Args:
+        iterations: The iteration numbers of the simulations.
+        directory_loc: (string) The directory where the files are located.
+        processes: (int) The number of worker processes, default cpu count.
+        file_name_format: (string) The .t16 file name of an iteration.
+        designs: The design of each iteration (e.g. rows of
+            Rectangle_inputs.csv indexed by iteration), only needed with a
+            cache or for the corner region of the strain summary.
+        params: (dict) The loadcase parameters, only needed with a cache.
+        cache: (ResultCache) Optional result cache.
+        store: (ResultsStore) Optional results store, with a row for every
+            iteration.
+        sidecar: (bool) Use (and fill) the sidecars of the .t16 files, so
+            that running again, e.g. with other intervals, does not have to
+            read the .t16 files.
+        sidecar_max_bytes: (int) Optional size cap of all the sidecars in
+            directory_loc, the least recently used ones are deleted.
+        intervals: (int) The number of node targets per side of the unit.
+        strain: (bool) Summarise the final log strains as well, see
+            `get_positions_and_strains`. Needs a store with
+            len(STRAIN_SUMMARY_FIELDS) values per row after the positions.
+            The cache only holds positions, so it is not used.
+        index: (sqlite3.Connection) Optional campaign index
+            (campaign_index.py), the simulations with a result are marked
+            post processed in it.
+
+    Returns:
+        status: (dict) For each iteration "done", "cached", "stored" (already
+            in the store), "missing", "failed" (exit number not 3004) or the
+            error that stopped its post processing.
+    """
+    unit_size = 25
+    size_x = 25
+    size_y = 25
+    node_targets = set_up_node_targets(intervals, unit_size, size_x, size_y)
+
+    out_put_file = os.path.join(directory_loc, "Example_ouput_file.txt")
+    use_cache = cache is not None and designs is not None and not strain
+    if strain:
+        n_values = 2 * len(node_targets) + len(STRAIN_SUMMARY_FIELDS)
+        if store is None or store.values.shape[1] != n_values:
+            raise ValueError(f"the strain summary needs a store with {n_values} values")
+
+    iterations = list(iterations)
+    status = {}
+    positions = {}
+    to_run = {}
+    corners = {}
+    for iteration in iterations:
+        if store is not None and store.status[iteration] == STATUS_DONE:
+            status[iteration] = "stored"
+            continue
+        if use_cache:
+            positions[iteration] = cache.get(designs[iteration], params, node_targets)
+            if positions[iteration] is not None:
+                status[iteration] = "cached"
+                continue
+        file_name = os.path.join(directory_loc, file_name_format.format(iteration))
+        try:
+            if not check_if_file_exists(file_name, directory_loc):
+                status[iteration] = "missing"
+            elif not _check_if_successful(file_name, directory_loc):
+                status[iteration] = "failed"
+            else:
+                to_run[iteration] = file_name
+                if strain and designs is not None:
+                    corners[iteration] = _design_corners(designs[iteration])
+        except OSError as error:
+            status[iteration] = f"{type(error).__name__}: {error}"
+
+    def write_row(iteration):
+        if status[iteration] in ("done", "cached"):
+            if strain:
+                store.write(iteration, *positions.pop(iteration))
+            elif store is not None:
+                store.write(iteration, positions.pop(iteration))
+            else:
+                _write_positions_to_file(positions.pop(iteration), out_put_file)
+        elif store is not None and status[iteration] != "stored":
+            missing = status[iteration] == "missing"
+            store.mark(iteration, STATUS_MISSING if missing else STATUS_FAILED)
+
+    # write the rows in iteration order as soon as all earlier ones are known
+    next_row = 0
+    for iteration, result, error in _run_in_pool(
+        to_run, node_targets, processes, sidecar, strain, corners
+    ):
+        status[iteration] = error or "done"
+        positions[iteration] = result
+        if result is not None and use_cache:
+            cache.put(designs[iteration], params, result, node_targets)
+        while next_row < len(iterations) and iterations[next_row] in status:
+            write_row(iterations[next_row])
+            next_row += 1
+    for iteration in iterations[next_row:]:
+        write_row(iteration)
+
+    if store is not None:
+        store.flush()
+    if index is not None:
+        done = ("done", "cached", "stored")
+        mark_post_processed(index, [i for i in iterations if status[i] in done])
+    if sidecar and sidecar_max_bytes is not None:
+        enforce_size_cap(directory_loc, sidecar_max_bytes)
+    return status
+
+
 if __name__ == "__main__":
 
 
-    # Note: A Zero is appended to the end of each line. This is to correct for
-    # the final comma as a result of my bad file writing. This just means that
-    # the last value is a zero and can be ignored when working with the results.
+    # The final positions are stored in Example_output.npy, one row per
+    # simulation. Run `python results_store.py <store> <text file>` to get the
+    # text file. Note: A Zero is appended to the end of each line of the text
+    # file. This is to correct for the final comma as a result of my bad file
+    # writing. This just means that the last value is a zero and can be
+    # ignored when working with the results.
+    # Example_strains.npy holds the positions followed by the summary of the
+    # final log strains, in the order of STRAIN_SUMMARY_FIELDS. It is written
+    # first and fills the .t16 sidecars, so the positions are then read from
+    # the sidecars without opening the .t16 files again.
+    # If there is a result cache (e.g. from create_model.py --cache), the
+    # positions of the designs it holds are taken from it, so the designs
+    # whose proc files were skipped still get their row, and the new
+    # positions are added to it.
 
     num_sims = 2 
-    for iteration in range(num_sims):
-        file_name=f"example_model_{iteration}.t16"
-        directory_loc=".\marcmentat_files"
-        do_the_post_processing(iteration, directory_loc, file_name)
+    cache_dir = "result_cache"
+    directory_loc = "marcmentat_files"
+    n_targets = len(set_up_node_targets())
+    designs = np.loadtxt("Rectangle_inputs.csv", delimiter=",", ndmin=2)
+    strain_file = os.path.join(directory_loc, "Example_strains.npy")
+    n_values = 2 * n_targets + len(STRAIN_SUMMARY_FIELDS)
+    strain_store = ResultsStore(strain_file, num_sims, n_values)
+    post_process_parallel(
+        range(num_sims),
+        directory_loc,
+        designs=designs,
+        store=strain_store,
+        sidecar=True,
+        strain=True,
+    )
+    strains, valid = read_results(strain_file)
+    for iteration in np.flatnonzero(valid):
+        summary = zip(STRAIN_SUMMARY_FIELDS, strains[iteration, 2 * n_targets :])
+        print(f"Simulation {iteration} strains: {dict(summary)}")
+
+    store_file = os.path.join(directory_loc, "Example_output.npy")
+    store = ResultsStore(store_file, num_sims, 2 * n_targets)
+    cache = ResultCache(cache_dir) if os.path.isdir(cache_dir) else None
+    status = post_process_parallel(
+        range(num_sims),
+        directory_loc,
+        designs=designs,
+        params=read_parameters(),
+        cache=cache,
+        store=store,
+        sidecar=True,
+    )
+    for iteration, result in status.items():
+        if result not in ("done", "cached", "stored"):
+            print(f"Simulation {iteration}: {result}")
+    if cache is not None:
+        print(cache.report())
+    
     
     # plotting the data for some visual feedback
-    data = np.loadtxt(".\marcmentat_files\Example_ouput_file.txt", delimiter=",")
+    data, valid = read_results(store_file)
     x0 = data[0, 0:int(data.shape[1]/2)]
-    y0 = data[0, int(data.shape[1]/2):-1] # ignore the last value
+    y0 = data[0, int(data.shape[1]/2):]
     plt.plot(x0, y0, "o", label="Simulation 0")
     x1 = data[1, 0:int(data.shape[1]/2)]
-    y1 = data[1, int(data.shape[1]/2):-1] # ignore the last value
+    y1 = data[1, int(data.shape[1]/2):]
     plt.plot(x1, y1, "o", label="Simulation 1")
     plt.plot([0, 25, 25, 0, 0], [0, 0, 25, 25, 0], "k--", label="Undeformed")
     plt.axis("equal")
@@ -0,0 +1,313 @@
+"""
+Mesh the rectangular void unit with linear quads and write the Marc .dat file
+directly, without mentat.
+
+The unit is meshed as a structured O-grid around the cavity: rays from the
+cavity center pass through nodes spaced `element_size` apart along the outer
+edges of the unit, and every ray is divided into the same number of radial
+layers between the cavity and the outer edge. Because the rays never cross,
+every element is a convex quad. The rays closest to the cavity corners are
+moved onto the corners so that the cavity edges are meshed exactly.
+"""
+
+import argparse
+import os
+import numpy as np
+from create_model import (
+    UNIT_SIZE,
+    create_rectangles,
+    iter_design_chunks,
+    read_parameters,
+)
+from marc_dat import write_marc_dat
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """The z component of the cross product of 2D vectors, broadcast."""
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _ray_hits(
+    center: np.ndarray, directions: np.ndarray, polygon: np.ndarray
+) -> np.ndarray:
+    """
+    Intersect rays from a point inside a convex polygon with its boundary.
+
+    Args:
+        center: (array) (2,) The start of every ray, inside the polygon.
+        directions: (array) (M, 2) The ray directions.
+        polygon: (array) (K, 2) The polygon vertices.
+
+    Returns:
+        hits: (array) (M, 2) The point where each ray leaves the polygon.
+    """
+    start = polygon - center
+    edge = np.roll(polygon, -1, axis=0) - polygon
+
+    # solve center + t * direction = start + u * edge for every ray/edge pair
+    denominator = _cross(directions[:, None, :], edge[None, :, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = _cross(start[None, :, :], edge[None, :, :]) / denominator
+        u = _cross(start[None, :, :], directions[:, None, :]) / denominator
+    hit = (t > 0) & (u >= -1e-12) & (u <= 1 + 1e-12)
+    t = np.where(hit, t, np.inf).min(axis=1)
+
+    return center + t[:, None] * directions
+
+
+def _edge_arc(points: np.ndarray, unit_size: float) -> np.ndarray:
+    """
+    The arc length position of points on the edge of the unit, measured
+        counterclockwise from (0, 0).
+
+    Args:
+        points: (array) (M, 2) points on the edge of the unit.
+        unit_size: (float) The side length of the square unit.
+
+    Returns:
+        arc: (array) (M,) positions in [0, 4 * unit_size).
+    """
+    x, y = points[:, 0], points[:, 1]
+    arc = np.select(
+        [
+            np.isclose(y, 0) & ~np.isclose(x, unit_size),
+            np.isclose(x, unit_size) & ~np.isclose(y, unit_size),
+            np.isclose(y, unit_size) & ~np.isclose(x, 0),
+        ],
+        [x, unit_size + y, 3 * unit_size - x],
+        4 * unit_size - y,
+    )
+    return arc % (4 * unit_size)
+
+
+def _edge_point(arc: np.ndarray, unit_size: float) -> np.ndarray:
+    """
+    The points on the edge of the unit at the given arc length positions.
+
+    Args:
+        arc: (array) (M,) positions, see `_edge_arc`.
+        unit_size: (float) The side length of the square unit.
+
+    Returns:
+        points: (array) (M, 2) the points.
+    """
+    side, along = np.divmod(arc % (4 * unit_size), unit_size)
+    side = side.astype(int)[:, None]
+    zeros = np.zeros_like(along)
+    full = np.full_like(along, unit_size)
+    return np.select(
+        [side == 0, side == 1, side == 2],
+        [
+            np.column_stack([along, zeros]),
+            np.column_stack([full, along]),
+            np.column_stack([unit_size - along, full]),
+        ],
+        np.column_stack([zeros, unit_size - along]),
+    )
+
+
+def _mean_neighbour_distance(points: np.ndarray) -> np.ndarray:
+    """
+    The mean distance from each point on a closed loop to its two neighbours.
+
+    Args:
+        points: (array) (M, 2) points in order around the loop.
+
+    Returns:
+        spacing: (array) (M,) the mean neighbour distance of each point.
+    """
+    forward = np.linalg.norm(np.roll(points, -1, axis=0) - points, axis=1)
+    return 0.5 * (forward + np.roll(forward, 1))
+
+
+def mesh_unit_cell(
+    x_vals,
+    y_vals,
+    element_size: float,
+    unit_size: float = UNIT_SIZE,
+    radial_layers: int = None,
+):
+    """
+    Mesh the unit with a rectangular cavity using linear quads.
+        Node 1 to 4 are the corners of the unit, (0, 0), (L, 0), (L, L) and
+        (0, L), and node 5 to 8 are the cavity corners in the given order,
+        the same numbering the proc files use.
+
+    Args:
+        x_vals: (list) The four cavity corner node x values.
+        y_vals: (list) The four cavity corner node y values.
+        element_size: (float) The mesh size along the edges of the unit.
+        unit_size: (float) The side length of the square unit.
+        radial_layers: (int) The number of elements between the cavity and
+            the edge of the unit. Defaults to the mean distance divided by
+            the element size.
+
+    Returns:
+        coordinates: (array) (n_nodes, 2) node coordinates.
+        connectivity: (array) (n_elements, 4) counterclockwise corner node
+            numbers (1-based).
+        cavity_elements: (array) The element numbers (1-based) of the
+            elements on the cavity, their first edge lies on the cavity.
+    """
+    cavity = np.column_stack([x_vals, y_vals]).astype(float)
+    center = cavity.mean(axis=0)
+
+    # nodes along the outer edges, counterclockwise from (0, 0), given by
+    # their arc length position
+    n_side = max(1, int(round(unit_size / element_size)))
+    n_rays = 4 * n_side
+    perimeter = 4 * unit_size
+    arc = np.arange(n_rays) * (unit_size / n_side)
+    unit_corners = np.arange(4) * n_side
+
+    # move the outer node next to where each cavity corner ray meets the
+    # outer edge onto that point. If that point is very close to a corner of
+    # the unit, the cavity corner is joined to the unit corner instead.
+    unit = np.array([[0, 0], [unit_size, 0], [unit_size, unit_size], [0, unit_size]])
+    cavity_arc = _edge_arc(_ray_hits(center, cavity - center, unit), unit_size)
+    step = unit_size / n_side
+    cavity_rays = []
+    for position in cavity_arc:
+        below = int(position // step) % n_rays
+        above = (below + 1) % n_rays
+        distance = {
+            ray: abs((arc[ray] - position + perimeter / 2) % perimeter - perimeter / 2)
+            for ray in (below, above)
+        }
+        for ray in sorted(distance, key=distance.get):
+            if ray in cavity_rays:
+                continue
+            if ray in unit_corners:
+                if distance[ray] < 0.25 * step:
+                    cavity_rays.append(ray)
+                    break
+                continue
+            arc[ray] = position
+            cavity_rays.append(ray)
+            break
+        else:
+            raise ValueError("The element size is too large for this cavity.")
+
+    # spread the other outer nodes evenly between the fixed ones again
+    fixed = np.union1d(unit_corners, cavity_rays)
+    for a, b in zip(fixed, np.r_[fixed[1:], fixed[0] + n_rays]):
+        end = arc[b % n_rays] + (perimeter if b >= n_rays else 0)
+        arc[np.arange(a, b) % n_rays] = np.linspace(arc[a], end, b - a, endpoint=False)
+    outer = _edge_point(arc, unit_size)
+    outer[unit_corners] = unit
+
+    inner = _ray_hits(center, outer - center, cavity)
+    inner[cavity_rays] = cavity
+
+    # divide every ray into the same number of layers, graded from the node
+    # spacing on the cavity to the node spacing on the outer edge so that
+    # the elements stay close to square
+    gaps = np.linalg.norm(outer - inner, axis=1)
+    inner_spacing = _mean_neighbour_distance(inner)
+    outer_spacing = _mean_neighbour_distance(outer)
+    if radial_layers is None:
+        radial_layers = max(1, int(np.ceil(gaps.mean() / element_size)))
+    k = np.arange(radial_layers) / max(radial_layers - 1, 1)
+    sizes = inner_spacing[:, None] + (outer_spacing - inner_spacing)[:, None] * k
+    s = np.hstack([np.zeros((n_rays, 1)), np.cumsum(sizes, axis=1)])
+    s /= s[:, -1:]
+    points = inner[:, None, :] + s[:, :, None] * (outer - inner)[:, None, :]
+
+    # number the nodes: unit corners, cavity corners, then the rest
+    node_ids = np.zeros((n_rays, radial_layers + 1), dtype=int)
+    node_ids[unit_corners, -1] = np.arange(1, 5)
+    node_ids[cavity_rays, 0] = np.arange(5, 9)
+    remaining = node_ids == 0
+    node_ids[remaining] = np.arange(9, 9 + np.count_nonzero(remaining))
+
+    coordinates = np.empty((node_ids.size, 2))
+    coordinates[node_ids.ravel() - 1] = points.reshape(-1, 2)
+
+    # elements layer by layer, starting at the cavity
+    i = np.arange(n_rays)
+    i_next = np.roll(i, -1)
+    connectivity = np.vstack(
+        [
+            np.column_stack(
+                [
+                    node_ids[i_next, j],
+                    node_ids[i, j],
+                    node_ids[i, j + 1],
+                    node_ids[i_next, j + 1],
+                ]
+            )
+            for j in range(radial_layers)
+        ]
+    )
+    cavity_elements = np.arange(1, n_rays + 1)
+
+    return coordinates, connectivity, cavity_elements
+
+
+def create_rectangle_dat(
+    x_vals,
+    y_vals,
+    element_size,
+    pressure_val,
+    min_fraction,
+    dat_file_name,
+    radial_layers: int = None,
+):
+    """
+    Create a .dat file for one design without mentat.
+        This is the native counterpart of running the proc file of
+        `create_rectangle_proc_dat` with `mentat -bg`.
+
+    Args:
+        x_vals: (list) The four cavity corner node x values.
+        y_vals: (list) The four cavity corner node y values.
+        element_size: (float) The mesh size.
+        pressure_val: (float) The pressure to be applied to the cavity (MPa)
+        min_fraction: (float) The minimum allowed fraction of load case time.
+        dat_file_name: (str) The name of the dat file, without extension.
+        radial_layers: (int) See `mesh_unit_cell`.
+
+    Returns:
+        None: It just produces a .dat file.
+    """
+    coordinates, connectivity, cavity_elements = mesh_unit_cell(
+        x_vals, y_vals, element_size, radial_layers=radial_layers
+    )
+    write_marc_dat(
+        f"{dat_file_name}.dat",
+        coordinates,
+        connectivity,
+        cavity_elements,
+        pressure_val,
+        min_fraction,
+    )
+
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write the .dat files of the designs without mentat."
+    )
+    parser.add_argument("design_file", nargs="?", default="Rectangle_inputs.csv")
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--start-index", type=int, default=0)
+    parser.add_argument("--dat-dir", default="marcmentat_files")
+    args = parser.parse_args()
+
+    params = read_parameters(args.config)
+    for chunk in iter_design_chunks(args.design_file, start_index=args.start_index):
+        vertices, valid = create_rectangles(chunk)
+        for i, index in enumerate(chunk.index):
+            if not valid[i]:
+                print(f"Design {index} is not a valid cavity, skipping.")
+                continue
+            create_rectangle_dat(
+                vertices[i, :, 0],
+                vertices[i, :, 1],
+                params["element_size"],
+                params["pressure"],
+                params["min_fraction"],
+                os.path.join(args.dat_dir, f"example_model_{index}"),
+            )
+    print("quad_mesher - completed")
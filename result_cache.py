@@ -0,0 +1,185 @@
+"""
+Cache of simulation results keyed by the design, the loadcase parameters and
+the node targets.
+
+Identical designs (after rounding) with the same config.ini parameters and
+the same proc commands give the same result, so a repeated design can take
+its final node positions from the cache instead of going through mentat,
+Marc and py_post again. create_model.py --cache skips writing the proc files
+of such designs, and the post processing (py_post_process.py, job_runner.py
+--post-process and pipeline.py with --cache) fills the cache and writes the
+cached positions to the output like any other result.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from create_model import DESIGN_COLUMNS
+from create_rectangle_proc_dat import PROC_TEMPLATE_VERSION
+from t16_sidecar import targets_key
+
+
+class ResultCache:
+    """
+    A size bounded, least recently used, on disk cache of final positions.
+
+    Every entry is a `{key}.npz` file with the final positions and the node
+    targets they belong to. Hits update the file modification time, which is
+    used to evict the least recently used entries once the cache is larger
+    than `max_bytes`.
+    """
+
+    def __init__(
+        self, directory: str = "result_cache", max_bytes: int = 10**9, decimals: int = 6
+    ):
+        """
+        Args:
+            directory: (str) The cache directory, created if needed.
+            max_bytes: (int) The maximum size of the cache on disk.
+            decimals: (int) The design values are rounded to this many
+                decimals, designs that are equal after rounding share a key.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()
+        )
+
+    def key(self, design, params: dict, node_targets=()) -> str:
+        """
+        The cache key of a design.
+
+        Args:
+            design: The design, a mapping with the DESIGN_COLUMNS (e.g. a
+                dataframe row) or a sequence in that order.
+            params: (dict) The loadcase parameters from `read_parameters`.
+            node_targets: (tuple) The node targets of the positions.
+
+        Returns:
+            key: (str) The hexadecimal key.
+        """
+        if hasattr(design, "keys"):
+            design = [design[column] for column in DESIGN_COLUMNS]
+        content = {
+            "design": [round(float(value), self.decimals) + 0.0 for value in design],
+            "params": {name: float(params[name]) for name in sorted(params)},
+            "proc": PROC_TEMPLATE_VERSION,
+            "targets": targets_key(np.reshape(node_targets, (-1, 3))),
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}{extension}")
+
+    def get(self, design, params: dict, node_targets=()):
+        """
+        Look up the final positions of a design.
+
+        Args:
+            design: The design, see `key`.
+            params: (dict) The loadcase parameters.
+            node_targets: (tuple) The node targets of the positions.
+
+        Returns:
+            positions: (array) The cached final positions, None on a miss.
+        """
+        path = self._path(self.key(design, params, node_targets), ".npz")
+        try:
+            with np.load(path) as entry:
+                positions = entry["positions"]
+                targets = entry["node_targets"]
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+
+        # the key is a hash, make sure it is the right entry
+        if not np.array_equal(targets, np.reshape(node_targets, (-1, 3))):
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return positions
+
+    def put(self, design, params: dict, positions, node_targets=()):
+        """
+        Store the result of a design.
+
+        Args:
+            design: The design, see `key`.
+            params: (dict) The loadcase parameters.
+            positions: (array) The final positions of the node targets.
+            node_targets: (tuple) The node targets of the positions.
+
+        Returns:
+            key: (str) The cache key of the entry.
+        """
+        key = self.key(design, params, node_targets)
+        path = self._path(key, ".npz")
+        # write to a temporary file first so readers never see half an entry
+        temporary = self._path(key, ".tmp.npz")
+        np.savez(
+            temporary,
+            positions=np.asarray(positions),
+            node_targets=np.reshape(node_targets, (-1, 3)),
+        )
+        self._replace(temporary, path)
+
+        if self._size > self.max_bytes:
+            self.evict()
+        return key
+
+    def _replace(self, source: str, destination: str):
+        if os.path.isfile(destination):
+            self._size -= os.path.getsize(destination)
+        os.replace(source, destination)
+        self._size += os.path.getsize(destination)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+            `max_bytes`. Any files left next to an entry, e.g. by an older
+            version of the cache, are removed with it.
+
+        Returns:
+            None
+        """
+        entries = {}
+        for file in os.scandir(self.directory):
+            if file.is_file():
+                entries.setdefault(file.name.split(".")[0], []).append(file)
+        last_used = {
+            key: max(file.stat().st_mtime for file in files)
+            for key, files in entries.items()
+        }
+        self._size = sum(
+            file.stat().st_size for files in entries.values() for file in files
+        )
+        for key in sorted(entries, key=last_used.get):
+            if self._size <= self.max_bytes:
+                break
+            for file in entries[key]:
+                self._size -= file.stat().st_size
+                os.remove(file.path)
+            self.evictions += 1
+
+    def report(self) -> str:
+        """
+        A one line summary of the cache use.
+
+        Returns:
+            report: (str) The hits, misses, hit rate, evictions and size.
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"result cache: {self.hits} hits, {self.misses} misses "
+            f"({rate:.1%} hit rate), {self.evictions} evictions, "
+            f"{self._size / 1e6:.1f} MB in {self.directory}"
+        )
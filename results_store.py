@@ -0,0 +1,155 @@
+"""
+Store the post processed positions of many simulations in one binary file.
+
+Row i of the store holds the final positions of the node targets of
+simulation i as x0, x1, ..., xn, y0, y1, ..., yn, the same convention as the
+text output file. The rows are a memory mapped .npy file that is preallocated
+for all the simulations, next to a status .npy file that records which rows
+are valid. Rows can be written in any order, by several processes at once,
+and an interrupted run can be resumed by post processing only the rows that
+are still empty.
+"""
+
+import argparse
+import os
+import numpy as np
+
+STATUS_EMPTY = 0
+STATUS_DONE = 1
+STATUS_FAILED = 2
+STATUS_MISSING = 3
+
+
+def _status_file(file_name: str) -> str:
+    """The file next to a store that holds the status of every row."""
+    return os.path.splitext(file_name)[0] + "_status.npy"
+
+
+class ResultsStore:
+    """
+    A preallocated results file, indexed by simulation number.
+        If the file exists it is opened for writing as it is (to resume or
+        to write rows from another process), otherwise it is created with
+        every row empty (NaN). Create the file before starting processes
+        that write to it.
+
+    Args:
+        file_name: (str) The .npy file name with extension.
+        num_sims: (int) The number of simulations, needed to create the file.
+        n_values: (int) The values per row (2 * number of node targets,
+            plus any extra values), needed to create the file.
+        dtype: The data type of the values, used when the file is created.
+    """
+
+    def __init__(
+        self,
+        file_name: str,
+        num_sims: int = None,
+        n_values: int = None,
+        dtype=np.float64,
+    ):
+        self.file_name = file_name
+        if os.path.isfile(file_name):
+            self.values = np.load(file_name, mmap_mode="r+")
+            self.status = np.load(_status_file(file_name), mmap_mode="r+")
+            if num_sims is not None and num_sims != len(self.values):
+                raise ValueError(
+                    f"{file_name} holds {len(self.values)} simulations, not {num_sims}"
+                )
+            return
+
+        if num_sims is None or n_values is None:
+            raise ValueError(f"{file_name} does not exist, give num_sims and n_values")
+        self.values = np.lib.format.open_memmap(
+            file_name, mode="w+", dtype=dtype, shape=(num_sims, n_values)
+        )
+        self.values[:] = np.nan
+        self.status = np.lib.format.open_memmap(
+            _status_file(file_name), mode="w+", dtype=np.uint8, shape=(num_sims,)
+        )
+        self.flush()
+
+    def write(self, iteration: int, positions: np.ndarray, extras=None):
+        """
+        Write the final positions of one simulation.
+
+        Args:
+            iteration: (int) The simulation number.
+            positions: (np.ndarray) The (n_targets, 3) final positions.
+            extras: (array) Other values of the simulation (e.g. its strain
+                summary), written after the positions.
+        """
+        n_targets = len(positions)
+        self.values[iteration, :n_targets] = positions[:, 0]
+        self.values[iteration, n_targets : 2 * n_targets] = positions[:, 1]
+        if extras is not None:
+            self.values[iteration, 2 * n_targets :] = extras
+        self.status[iteration] = STATUS_DONE
+
+    def mark(self, iteration: int, status: int):
+        """
+        Record that a simulation has no results, e.g. STATUS_FAILED.
+
+        Args:
+            iteration: (int) The simulation number.
+            status: (int) The status of the row.
+        """
+        self.values[iteration] = np.nan
+        self.status[iteration] = status
+
+    def pending(self) -> np.ndarray:
+        """
+        Returns:
+            iterations: (np.ndarray) The simulations that have no row yet.
+        """
+        return np.flatnonzero(self.status == STATUS_EMPTY)
+
+    def flush(self):
+        """Write the changes to disk."""
+        self.values.flush()
+        self.status.flush()
+
+
+def read_results(file_name: str) -> tuple:
+    """
+    Open a results store for reading without copying it into memory.
+
+    Args:
+        file_name: (str) The .npy file name with extension.
+
+    Returns:
+        values: (np.memmap) The read-only (num_sims, n_values) rows.
+        valid: (np.ndarray) True for the rows that hold results.
+    """
+    values = np.load(file_name, mmap_mode="r")
+    status = np.load(_status_file(file_name), mmap_mode="r")
+    return values, status == STATUS_DONE
+
+
+def export_text(file_name: str, text_file_name: str):
+    """
+    Append the valid rows of a results store to a text file, in the format
+        written by py_post_process.py (with the trailing zero).
+
+    Args:
+        file_name: (str) The .npy file name with extension.
+        text_file_name: (str) The text file name with extension.
+    """
+    values, valid = read_results(file_name)
+    with open(text_file_name, "a") as file:
+        for row in values[valid]:
+            file.write("\n")
+            for k in row:
+                file.write(f"{k}, ")
+            file.write("0")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a results store to text.")
+    parser.add_argument("store_file")
+    parser.add_argument("text_file")
+    args = parser.parse_args()
+
+    export_text(args.store_file, args.text_file)
+    values, valid = read_results(args.store_file)
+    print(f"{valid.sum()} of {len(valid)} simulations written to {args.text_file}")
@@ -0,0 +1,173 @@
+"""
+Reduce element strain tensors to a few numbers per simulation.
+
+The tensors are (..., 6) arrays with the components in the order of
+TENSOR_COMPONENTS, as read by `get_element_tensors` in py_post_process.py
+(one row per element integration point). The shear components are tensor
+components, not engineering shears. Every reduction works on all the elements
+and integration points (and increments) at once.
+"""
+
+import numpy as np
+
+TENSOR_COMPONENTS = ("xx", "yy", "zz", "xy", "yz", "zx")
+
+# the values `summarise_strains` returns, in the order of `summary_vector`
+STRAIN_SUMMARY_FIELDS = (
+    "max_principal",
+    "max_principal_element",
+    "max_principal_x",
+    "max_principal_y",
+    "max_equivalent",
+    "max_equivalent_element",
+    "max_equivalent_x",
+    "max_equivalent_y",
+    "corner_max_equivalent",
+    "corner_mean_equivalent",
+)
+
+
+def tensor_matrices(tensors: np.ndarray) -> np.ndarray:
+    """
+    Expand tensors to symmetric matrices.
+
+    Args:
+        tensors: (np.ndarray) The (..., 6) tensors.
+
+    Returns:
+        matrices: (np.ndarray) The (..., 3, 3) matrices.
+    """
+    tensors = np.asarray(tensors, dtype=float)
+    xx, yy, zz, xy, yz, zx = np.moveaxis(tensors, -1, 0)
+    rows = [
+        np.stack([xx, xy, zx], axis=-1),
+        np.stack([xy, yy, yz], axis=-1),
+        np.stack([zx, yz, zz], axis=-1),
+    ]
+    return np.stack(rows, axis=-2)
+
+
+def principal_values(tensors: np.ndarray) -> np.ndarray:
+    """
+    The principal values of tensors.
+
+    Args:
+        tensors: (np.ndarray) The (..., 6) tensors. Tensors with NaN
+            components (padding) give NaN.
+
+    Returns:
+        principal: (np.ndarray) The (..., 3) principal values, largest first.
+    """
+    matrices = tensor_matrices(tensors)
+    missing = np.isnan(matrices).any(axis=(-2, -1))
+    matrices[missing] = 0.0
+    principal = np.linalg.eigvalsh(matrices)[..., ::-1]
+    principal[missing] = np.nan
+    return principal
+
+
+def equivalent_strain(tensors: np.ndarray) -> np.ndarray:
+    """
+    The von Mises equivalent strain, sqrt(2/3 e':e') with e' the deviatoric
+        part of the strain.
+
+    Args:
+        tensors: (np.ndarray) The (..., 6) tensors.
+
+    Returns:
+        equivalent: (np.ndarray) The (...) equivalent strains.
+    """
+    tensors = np.asarray(tensors, dtype=float)
+    normal = tensors[..., :3]
+    deviatoric = normal - normal.mean(axis=-1, keepdims=True)
+    contracted = (deviatoric**2).sum(axis=-1) + 2 * (tensors[..., 3:] ** 2).sum(axis=-1)
+    return np.sqrt(2.0 / 3.0 * contracted)
+
+
+def locate_max(values: np.ndarray) -> tuple:
+    """
+    Find the largest value of an (n_elements, n_points) array, ignoring NaN.
+
+    Args:
+        values: (np.ndarray) The values of every integration point.
+
+    Returns:
+        maximum: (float) The largest value, NaN if there is none.
+        element: (int) Its element index, -1 if there is none.
+        point: (int) Its integration point index, -1 if there is none.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == 0 or np.isnan(values).all():
+        return np.nan, -1, -1
+    element, point = np.unravel_index(np.nanargmax(values), values.shape)
+    return float(values[element, point]), int(element), int(point)
+
+
+def summarise_strains(
+    tensors: np.ndarray,
+    centroids: np.ndarray,
+    element_ids=None,
+    corners=None,
+    corner_radius: float = 1.0,
+) -> dict:
+    """
+    Summarise the strains of one increment.
+        The location of a maximum is the centroid of its element. The corner
+        region is every element whose centroid is within `corner_radius` of
+        a cavity corner, where the strain concentrates.
+
+    Args:
+        tensors: (np.ndarray) The (n_elements, n_points, 6) tensors.
+        centroids: (np.ndarray) The (n_elements, 2 or 3) element centroids.
+        element_ids: (array) The element id of every element, the element
+            index by default.
+        corners: (np.ndarray) The (n_corners, 2) cavity corners, the corner
+            values are NaN without them.
+        corner_radius: (float) The size of the corner region.
+
+    Returns:
+        summary: (dict) The STRAIN_SUMMARY_FIELDS.
+    """
+    centroids = np.asarray(centroids, dtype=float)
+    if element_ids is None:
+        element_ids = np.arange(len(centroids))
+    maximum_principal = principal_values(tensors)[..., 0]
+    equivalent = equivalent_strain(tensors)
+
+    summary = {}
+    for name, values in (("principal", maximum_principal), ("equivalent", equivalent)):
+        maximum, element, _ = locate_max(values)
+        summary[f"max_{name}"] = maximum
+        if element < 0:
+            summary[f"max_{name}_element"] = -1
+            summary[f"max_{name}_x"] = summary[f"max_{name}_y"] = np.nan
+        else:
+            summary[f"max_{name}_element"] = int(element_ids[element])
+            summary[f"max_{name}_x"] = float(centroids[element, 0])
+            summary[f"max_{name}_y"] = float(centroids[element, 1])
+
+    summary["corner_max_equivalent"] = summary["corner_mean_equivalent"] = np.nan
+    if corners is not None and len(centroids):
+        corners = np.asarray(corners, dtype=float)
+        offsets = centroids[:, None, :2] - corners[None, :, :2]
+        in_region = (np.hypot(offsets[..., 0], offsets[..., 1]) <= corner_radius).any(1)
+        region = equivalent[in_region]
+        if region.size and not np.isnan(region).all():
+            summary["corner_max_equivalent"] = float(np.nanmax(region))
+            summary["corner_mean_equivalent"] = float(np.nanmean(region))
+    return summary
+
+
+def summary_vector(summary: dict) -> np.ndarray:
+    """
+    Put a summary from `summarise_strains` in the order of
+        STRAIN_SUMMARY_FIELDS, e.g. to write it next to the positions of a
+        simulation in a results store.
+
+    Args:
+        summary: (dict) The summary.
+
+    Returns:
+        values: (np.ndarray) The values.
+    """
+    return np.array([summary[field] for field in STRAIN_SUMMARY_FIELDS], dtype=float)
@@ -0,0 +1,498 @@
+"""
+Screen new designs with a surrogate of the simulations that have been run.
+
+The kept output of a simulation is one row of the results store: the final
+positions of the node targets. `Surrogate` learns the map from a row of
+Rectangle_inputs.csv to that row from the finished simulations: the rows are
+compressed with PCA and each principal component is a Gaussian process of the
+design parameters. For a new design it predicts the row and its standard
+deviation. `screen_designs` sends only the designs the surrogate is unsure
+about to the solver, plus a random fraction of the others so that the error
+of the surrogate keeps being measured on real runs.
+
+    python surrogate.py                 # calibrate, fit and screen
+    python create_model.py --screen screening.npz
+    python surrogate.py --report        # error on the screened designs run since
+
+The settings are read from the [Surrogate] section of config.ini.
+"""
+
+import argparse
+import configparser
+import os
+import numpy as np
+import pandas as pd
+from create_model import DESIGN_COLUMNS, iter_design_chunks
+from results_store import STATUS_DONE, STATUS_EMPTY, ResultsStore, read_results
+
+
+def read_surrogate_settings(config_file: str = "config.ini") -> dict:
+    """
+    Read the screening settings from the config file.
+
+    Args:
+        config_file: (str) The path to the config file.
+
+    Returns:
+        settings: (dict) threshold (the largest predicted standard deviation
+            of a position, in mm, for which a design is not simulated),
+            tolerance (the largest acceptable error of a position, mm),
+            forced_rate (the fraction of the designs the surrogate is sure
+            about that are simulated anyway), seed, max_components and folds
+            (of the cross validation).
+    """
+    config_obj = configparser.ConfigParser()
+    config_obj.read(config_file)
+    section = config_obj["Surrogate"] if "Surrogate" in config_obj else {}
+
+    return {
+        "threshold": float(section.get("threshold", 0.05)),
+        "tolerance": float(section.get("tolerance", 0.1)),
+        "forced_rate": float(section.get("forced_rate", 0.05)),
+        "seed": int(section.get("seed", 0)),
+        "max_components": int(section.get("max_components", 20)),
+        "folds": int(section.get("folds", 5)),
+    }
+
+
+def design_inputs(designs) -> np.ndarray:
+    """
+    The inputs of the surrogate for each design.
+        A rectangle rotated by 180 degrees is the same rectangle, so the
+        rotation enters as the cosine and sine of twice the angle.
+
+    Args:
+        designs: (DataFrame or array) The designs, as in `create_rectangles`.
+
+    Returns:
+        inputs: (np.ndarray) The (N, 6) inputs.
+    """
+    if isinstance(designs, pd.DataFrame):
+        designs = designs[DESIGN_COLUMNS].to_numpy(dtype=float)
+    designs = np.atleast_2d(np.asarray(designs, dtype=float))
+    rotation = np.radians(2 * designs[:, 3])
+    return np.column_stack(
+        [
+            designs[:, 0],
+            designs[:, 1],
+            np.log(designs[:, 2]),
+            np.cos(rotation),
+            np.sin(rotation),
+            designs[:, 4],
+        ]
+    )
+
+
+def _squared_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """The (len(a), len(b)) squared distances between the rows of a and b."""
+    d2 = (a**2).sum(axis=1)[:, None] + (b**2).sum(axis=1)[None, :] - 2 * a @ b.T
+    return np.maximum(d2, 0.0)
+
+
+class Surrogate:
+    """
+    PCA of the output rows with a Gaussian process for every component.
+        All the components share a squared exponential kernel of the scaled
+        inputs. Its length scale and noise are chosen from a grid by the
+        marginal likelihood, the variance of each component in closed form.
+
+    Args:
+        max_components: (int) The most principal components kept.
+        variance_kept: (float) Keep the fewest components that explain this
+            fraction of the variance of the rows.
+        length_scales: (tuple) The length scales tried, in units of the
+            standard deviation of each input.
+        noises: (tuple) The noise variances tried, relative to the variance
+            of each component.
+        max_train: (int) At most this many (randomly chosen) runs are used,
+            the cost of the fit grows with the cube of the number of runs.
+    """
+
+    def __init__(
+        self,
+        max_components: int = 20,
+        variance_kept: float = 0.9999,
+        length_scales: tuple = (0.25, 0.5, 1.0, 2.0, 4.0),
+        noises: tuple = (1e-6, 1e-4, 1e-2),
+        max_train: int = 2000,
+    ):
+        self.max_components = max_components
+        self.variance_kept = variance_kept
+        self.length_scales = length_scales
+        self.noises = noises
+        self.max_train = max_train
+
+    def fit(self, designs, outputs: np.ndarray, seed: int = 0):
+        """
+        Fit the surrogate to finished simulations.
+
+        Args:
+            designs: (DataFrame or array) The designs of the simulations.
+            outputs: (np.ndarray) Their (N, n_values) rows of the results
+                store.
+            seed: (int) The random seed for choosing `max_train` runs.
+
+        Returns:
+            self: (Surrogate) The fitted surrogate.
+        """
+        inputs = design_inputs(designs)
+        outputs = np.asarray(outputs, dtype=float)
+        if len(inputs) < 2:
+            raise ValueError("at least two finished simulations are needed")
+        if len(inputs) > self.max_train:
+            keep = np.random.default_rng(seed).choice(
+                len(inputs), self.max_train, replace=False
+            )
+            inputs, outputs = inputs[keep], outputs[keep]
+        n_runs = len(inputs)
+
+        self.input_min = inputs.min(axis=0)
+        self.input_max = inputs.max(axis=0)
+        self.input_mean = inputs.mean(axis=0)
+        self.input_std = inputs.std(axis=0)
+        self.input_std[self.input_std == 0] = 1.0
+        x = (inputs - self.input_mean) / self.input_std
+
+        self.output_mean = outputs.mean(axis=0)
+        _, singular, components = np.linalg.svd(
+            outputs - self.output_mean, full_matrices=False
+        )
+        explained = np.cumsum(singular**2) / max(np.sum(singular**2), 1e-300)
+        n_components = int(np.searchsorted(explained, self.variance_kept) + 1)
+        n_components = min(n_components, self.max_components, n_runs - 1)
+        self.components = components[:n_components]
+        scores = (outputs - self.output_mean) @ self.components.T
+        # what the kept components cannot reproduce is added to the variance
+        residual = outputs - self.output_mean - scores @ self.components
+        self.residual_variance = (residual**2).mean(axis=0)
+
+        d2 = _squared_distances(x, x)
+        best = None
+        for length_scale in self.length_scales:
+            correlation = np.exp(-0.5 * d2 / length_scale**2)
+            for noise in self.noises:
+                try:
+                    chol = np.linalg.cholesky(correlation + noise * np.eye(n_runs))
+                except np.linalg.LinAlgError:
+                    continue
+                chol_inv = np.linalg.inv(chol)
+                whitened = chol_inv @ scores
+                variances = np.maximum((whitened**2).mean(axis=0), 1e-300)
+                log_likelihood = -0.5 * n_runs * np.log(variances).sum()
+                log_likelihood -= n_components * np.log(np.diag(chol)).sum()
+                if best is None or log_likelihood > best[0]:
+                    best = (log_likelihood, length_scale, noise, chol_inv, variances)
+
+        _, self.length_scale, self.noise, chol_inv, self.variances = best
+        self.x = x
+        self.chol_inv = chol_inv
+        self.alpha = chol_inv.T @ (chol_inv @ scores)
+        return self
+
+    def outside(self, designs) -> np.ndarray:
+        """
+        Find the designs outside the range of the runs the surrogate was
+            fitted to. The uncertainty of an extrapolation is not reliable.
+
+        Args:
+            designs: (DataFrame or array) The designs.
+
+        Returns:
+            outside: (np.ndarray) True for the designs with an input below
+                the smallest, or above the largest, of the fitted runs.
+        """
+        inputs = design_inputs(designs)
+        return ((inputs < self.input_min) | (inputs > self.input_max)).any(axis=1)
+
+    def predict(self, designs, batch_size: int = 10000) -> tuple:
+        """
+        Predict the output rows of designs.
+
+        Args:
+            designs: (DataFrame or array) The designs.
+            batch_size: (int) The designs predicted at a time.
+
+        Returns:
+            mean: (np.ndarray) The (N, n_values) predicted rows.
+            std: (np.ndarray) The (N, n_values) standard deviation of each
+                predicted value.
+        """
+        inputs = (design_inputs(designs) - self.input_mean) / self.input_std
+        means, stds = [], []
+        for start in range(0, len(inputs), batch_size):
+            x = inputs[start : start + batch_size]
+            cross = np.exp(-0.5 * _squared_distances(x, self.x) / self.length_scale**2)
+            scores = cross @ self.alpha
+            reduction = ((self.chol_inv @ cross.T) ** 2).sum(axis=0)
+            score_variance = np.maximum(1.0 + self.noise - reduction, 0.0)
+            score_variance = score_variance[:, None] * self.variances[None, :]
+            variance = score_variance @ self.components**2 + self.residual_variance
+            means.append(self.output_mean + scores @ self.components)
+            stds.append(np.sqrt(variance))
+        n_values = len(self.output_mean)
+        if not means:
+            return np.empty((0, n_values)), np.empty((0, n_values))
+        return np.concatenate(means), np.concatenate(stds)
+
+
+def prediction_report(mean, std, actual, threshold: float, tolerance: float) -> dict:
+    """
+    Measure the error of predictions against real runs.
+
+    Args:
+        mean: (np.ndarray) The (N, n_values) predicted rows.
+        std: (np.ndarray) Their standard deviations, (N, n_values), or the
+            (N,) largest standard deviation of each row.
+        actual: (np.ndarray) The (N, n_values) rows of the real runs.
+        threshold: (float) See `read_surrogate_settings`.
+        tolerance: (float) See `read_surrogate_settings`.
+
+    Returns:
+        report: (dict) n, rmse (mm), median and max of the largest error of
+            each row (mm), coverage (the fraction of rows whose largest error
+            is within twice their largest standard deviation, about 0.95 if
+            the uncertainty is right), skip_rate (the fraction of rows that
+            would not have been simulated) and false_skip_rate (the fraction
+            of those with an error above the tolerance).
+    """
+    mean, actual = np.asarray(mean, dtype=float), np.asarray(actual, dtype=float)
+    std = np.asarray(std, dtype=float)
+    if len(actual) == 0:
+        return {"n": 0}
+    uncertainty = std.max(axis=1) if std.ndim == 2 else std
+    error = np.abs(mean - actual)
+    max_error = error.max(axis=1)
+    skipped = uncertainty <= threshold
+    return {
+        "n": int(len(actual)),
+        "rmse": float(np.sqrt((error**2).mean())),
+        "median_max_error": float(np.median(max_error)),
+        "max_error": float(max_error.max()),
+        "coverage": float(np.mean(max_error <= 2 * uncertainty)),
+        "skip_rate": float(skipped.mean()),
+        "false_skip_rate": (
+            float(np.mean(max_error[skipped] > tolerance)) if skipped.any() else None
+        ),
+    }
+
+
+def calibration_report(designs, outputs, settings: dict) -> dict:
+    """
+    Cross validate the surrogate on finished simulations: every fold of runs
+        is predicted by a surrogate fitted to the other folds.
+
+    Args:
+        designs: (DataFrame or array) The designs of the simulations.
+        outputs: (np.ndarray) Their rows of the results store.
+        settings: (dict) The settings from `read_surrogate_settings`.
+
+    Returns:
+        report: (dict) See `prediction_report`.
+    """
+    if isinstance(designs, pd.DataFrame):
+        designs = designs[DESIGN_COLUMNS].to_numpy(dtype=float)
+    outputs = np.asarray(outputs, dtype=float)
+    n_folds = min(settings["folds"], len(designs) // 2)
+    if n_folds < 2:
+        return {"n": 0}
+    fold = np.random.default_rng(settings["seed"]).permutation(len(designs)) % n_folds
+    mean = np.empty_like(outputs)
+    std = np.empty_like(outputs)
+    for k in range(n_folds):
+        surrogate = Surrogate(settings["max_components"])
+        surrogate.fit(designs[fold != k], outputs[fold != k], settings["seed"])
+        mean[fold == k], std[fold == k] = surrogate.predict(designs[fold == k])
+    return prediction_report(
+        mean, std, outputs, settings["threshold"], settings["tolerance"]
+    )
+
+
+def screen_designs(
+    surrogate: Surrogate, designs: pd.DataFrame, settings: dict, rng=None
+) -> dict:
+    """
+    Decide which designs to simulate.
+
+    Args:
+        surrogate: (Surrogate) The fitted surrogate.
+        designs: (DataFrame) The designs, indexed by design number.
+        settings: (dict) The settings from `read_surrogate_settings`.
+        rng: (np.random.Generator) For the forced simulations.
+
+    Returns:
+        screening: (dict) design (the design numbers), mean (the predicted
+            rows), uncertainty (the largest standard deviation of each row),
+            simulate (True for the designs to simulate) and forced (True for
+            the designs simulated only to check the surrogate). Designs
+            outside the range of the fitted runs are always simulated.
+    """
+    rng = rng or np.random.default_rng(settings["seed"])
+    mean, std = surrogate.predict(designs)
+    uncertainty = std.max(axis=1)
+    uncertain = (uncertainty > settings["threshold"]) | surrogate.outside(designs)
+    forced = ~uncertain & (rng.random(len(designs)) < settings["forced_rate"])
+    return {
+        "design": designs.index.to_numpy(),
+        "mean": mean,
+        "uncertainty": uncertainty,
+        "simulate": uncertain | forced,
+        "forced": forced,
+    }
+
+
+def screen_campaign(
+    design_file="Rectangle_inputs.csv",
+    store_file: str = os.path.join("marcmentat_files", "Example_output.npy"),
+    config_file: str = "config.ini",
+    screening_file: str = "screening.npz",
+    prediction_file: str = "Surrogate_output.npy",
+    chunk_size: int = 10000,
+) -> dict:
+    """
+    Calibrate and fit the surrogate on the finished simulations of a
+        campaign, and screen the designs that have not been simulated yet.
+        The predicted rows are written to a results store of their own
+        (`prediction_file`, one row per design as in `store_file`), the
+        screening decisions to `screening_file`.
+
+    Args:
+        design_file: The designs, see `iter_design_chunks` for the options.
+        store_file: (str) The results store of the real runs.
+        config_file: (str) The config file with the [Surrogate] section.
+        screening_file: (str) The .npz file for design, uncertainty,
+            simulate and forced (see `screen_designs`).
+        prediction_file: (str) The results store for the predicted rows.
+        chunk_size: (int) The designs read and screened at a time.
+
+    Returns:
+        summary: (dict) calibration (see `calibration_report`), n_train,
+            n_screened, n_simulate and n_forced.
+    """
+    settings = read_surrogate_settings(config_file)
+    values, valid = read_results(store_file)
+    status = np.load(os.path.splitext(store_file)[0] + "_status.npy")
+
+    trained = np.flatnonzero(valid)
+    train_designs = []
+    for chunk in iter_design_chunks(design_file, chunk_size):
+        train_designs.append(chunk[chunk.index.isin(trained)])
+    train_designs = pd.concat(train_designs)
+    outputs = np.asarray(values[train_designs.index.to_numpy()])
+
+    calibration = calibration_report(train_designs, outputs, settings)
+    surrogate = Surrogate(settings["max_components"]).fit(
+        train_designs, outputs, settings["seed"]
+    )
+
+    predictions = ResultsStore(prediction_file, len(values), values.shape[1])
+    rng = np.random.default_rng(settings["seed"])
+    screenings = []
+    for chunk in iter_design_chunks(design_file, chunk_size):
+        index = chunk.index.to_numpy()
+        in_store = index < len(status)
+        new = np.ones(len(chunk), dtype=bool)
+        new[in_store] = status[index[in_store]] == STATUS_EMPTY
+        chunk = chunk[new]
+        if len(chunk) == 0:
+            continue
+        screening = screen_designs(surrogate, chunk, settings, rng)
+        rows = screening["design"] < len(values)
+        predictions.values[screening["design"][rows]] = screening["mean"][rows]
+        predictions.status[screening["design"][rows]] = STATUS_DONE
+        del screening["mean"]
+        screenings.append(screening)
+    predictions.flush()
+
+    keys = ("design", "uncertainty", "simulate", "forced")
+    arrays = {
+        key: np.concatenate([s[key] for s in screenings]) if screenings else []
+        for key in keys
+    }
+    np.savez(screening_file, threshold=settings["threshold"], **arrays)
+
+    return {
+        "calibration": calibration,
+        "n_train": len(train_designs),
+        "n_screened": len(arrays["design"]),
+        "n_simulate": int(np.sum(arrays["simulate"])),
+        "n_forced": int(np.sum(arrays["forced"])),
+    }
+
+
+def screening_report(
+    store_file: str = os.path.join("marcmentat_files", "Example_output.npy"),
+    config_file: str = "config.ini",
+    screening_file: str = "screening.npz",
+    prediction_file: str = "Surrogate_output.npy",
+) -> dict:
+    """
+    Measure the error of the screening predictions on the screened designs
+        that have been simulated since.
+
+    Args:
+        store_file: (str) The results store of the real runs.
+        config_file: (str) The config file with the [Surrogate] section.
+        screening_file: (str) The file written by `screen_campaign`.
+        prediction_file: (str) The predictions written by `screen_campaign`.
+
+    Returns:
+        report: (dict) "forced" (the designs the surrogate was sure about)
+            and "uncertain" (the others), each as in `prediction_report`.
+    """
+    settings = read_surrogate_settings(config_file)
+    values, valid = read_results(store_file)
+    predicted, _ = read_results(prediction_file)
+    with np.load(screening_file) as screening:
+        design = screening["design"]
+        uncertainty = screening["uncertainty"]
+        forced = screening["forced"]
+        simulate = screening["simulate"]
+
+    done = (design < len(valid)) & simulate
+    done[done] = valid[design[done]]
+    report = {}
+    for name, selected in (("forced", done & forced), ("uncertain", done & ~forced)):
+        rows = design[selected]
+        report[name] = prediction_report(
+            predicted[rows],
+            uncertainty[selected],
+            values[rows],
+            settings["threshold"],
+            settings["tolerance"],
+        )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--designs", default="Rectangle_inputs.csv")
+    parser.add_argument(
+        "--store", default=os.path.join("marcmentat_files", "Example_output.npy")
+    )
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--screening", default="screening.npz")
+    parser.add_argument("--predictions", default="Surrogate_output.npy")
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Report the error on the screened designs that have been run.",
+    )
+    args = parser.parse_args()
+
+    if args.report:
+        report = screening_report(
+            args.store, args.config, args.screening, args.predictions
+        )
+        for name, row in report.items():
+            print(f"{name}: {row}")
+    else:
+        summary = screen_campaign(
+            args.designs, args.store, args.config, args.screening, args.predictions
+        )
+        print(f"cross validated on {summary['n_train']} runs: {summary['calibration']}")
+        print(
+            f"{summary['n_simulate']} of {summary['n_screened']} new designs to "
+            f"simulate ({summary['n_forced']} forced)"
+        )
@@ -0,0 +1,171 @@
+"""
+Keep what has been extracted from a .t16 file in a sidecar file next to it.
+
+`example_model_0.t16.npz` holds the undeformed node coordinates and the
+displacements of the selected increments of every node, plus the closest
+node to each target of every target set that has been asked for, and the
+final log strains of the elements once they have been summarised. A sidecar
+belongs to one version of its .t16 file, identified by the size and
+modification time of the file (or a hash of its contents). It is deleted as
+soon as the .t16 file changes.
+"""
+
+import glob
+import hashlib
+import os
+import numpy as np
+
+SIDECAR_SUFFIX = ".npz"
+
+# The arrays of the strains of an entry.
+_STRAIN_ARRAYS = ("tensors", "centroids", "element_ids")
+
+
+def sidecar_file_name(t16_file_name: str) -> str:
+    """The sidecar file name of a .t16 file."""
+    return t16_file_name + SIDECAR_SUFFIX
+
+
+def fingerprint(t16_file_name: str, content_hash: bool = False) -> str:
+    """
+    Identify the version of a .t16 file.
+
+    Args:
+        t16_file_name: (str) The .t16 file name with extension.
+        content_hash: (bool) Hash the contents of the file instead of using
+            its size and modification time. Slower, but survives copies.
+
+    Returns:
+        fingerprint: (str) The fingerprint.
+    """
+    if not content_hash:
+        stat = os.stat(t16_file_name)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    sha1 = hashlib.sha1()
+    with open(t16_file_name, "rb") as file:
+        for block in iter(lambda: file.read(2**20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def targets_key(node_targets) -> str:
+    """
+    Identify a set of node targets.
+
+    Args:
+        node_targets: The (T, 3) target positions.
+
+    Returns:
+        key: (str) A hash of the target positions.
+    """
+    targets = np.ascontiguousarray(node_targets, dtype=np.float64)
+    return hashlib.sha1(targets.tobytes()).hexdigest()[:16]
+
+
+def load_sidecar(t16_file_name: str, content_hash: bool = False) -> dict:
+    """
+    Load the sidecar of a .t16 file, if it is up to date.
+        A sidecar of an older version of the .t16 file is deleted.
+
+    Args:
+        t16_file_name: (str) The .t16 file name with extension.
+        content_hash: (bool) See `fingerprint`.
+
+    Returns:
+        entry: (dict) fingerprint, coordinates, displacements, increments
+            (the increments option they were read with, as a string) and
+            targets (a dict of node indices for each target set key) and
+            strains (a dict of the final log strain tensors, element
+            centroids and element_ids, or None if they were not read). None
+            if there is no up to date sidecar.
+    """
+    file_name = sidecar_file_name(t16_file_name)
+    if not os.path.isfile(file_name):
+        return None
+    with np.load(file_name) as data:
+        if str(data["fingerprint"]) != fingerprint(t16_file_name, content_hash):
+            entry = None
+        else:
+            entry = {
+                "fingerprint": str(data["fingerprint"]),
+                "coordinates": data["coordinates"],
+                "displacements": data["displacements"],
+                "increments": str(data["increments"]),
+                "targets": {
+                    str(key): data[f"targets_{key}"] for key in data["target_keys"]
+                },
+                "strains": None,
+            }
+            if "strain_tensors" in data:
+                entry["strains"] = {
+                    name: data[f"strain_{name}"] for name in _STRAIN_ARRAYS
+                }
+    if entry is None:
+        os.remove(file_name)
+    else:
+        # the modification time of a sidecar is when it was last used
+        os.utime(file_name)
+    return entry
+
+
+def save_sidecar(t16_file_name: str, entry: dict, max_target_sets: int = 8):
+    """
+    Write the sidecar of a .t16 file.
+
+    Args:
+        t16_file_name: (str) The .t16 file name with extension.
+        entry: (dict) As returned by `load_sidecar`, with the fingerprint
+            the .t16 file had before it was read. The target sets are kept
+            in the order they were added.
+        max_target_sets: (int) Only the most recently added target sets are
+            kept.
+    """
+    keys = list(entry["targets"])[-max_target_sets:]
+    arrays = {f"targets_{key}": entry["targets"][key] for key in keys}
+    if entry.get("strains") is not None:
+        for name in _STRAIN_ARRAYS:
+            arrays[f"strain_{name}"] = entry["strains"][name]
+
+    file_name = sidecar_file_name(t16_file_name)
+    temporary_file_name = f"{file_name}.{os.getpid()}.tmp"
+    with open(temporary_file_name, "wb") as file:
+        np.savez(
+            file,
+            fingerprint=entry["fingerprint"],
+            coordinates=entry["coordinates"],
+            displacements=entry["displacements"],
+            increments=entry["increments"],
+            target_keys=np.array(keys, dtype=str),
+            **arrays,
+        )
+    os.replace(temporary_file_name, file_name)
+
+
+def enforce_size_cap(directory: str, max_bytes: int) -> int:
+    """
+    Delete the least recently used sidecars in a directory until they take
+        up at most `max_bytes`.
+
+    Args:
+        directory: (str) The directory with the .t16 files.
+        max_bytes: (int) The size cap in bytes.
+
+    Returns:
+        n_removed: (int) The number of sidecars deleted.
+    """
+    files = []
+    for file_name in glob.glob(os.path.join(directory, f"*.t16{SIDECAR_SUFFIX}")):
+        stat = os.stat(file_name)
+        files.append((stat.st_mtime, stat.st_size, file_name))
+    files.sort()
+
+    total = sum(size for _, size, _ in files)
+    n_removed = 0
+    for _, size, file_name in files:
+        if total <= max_bytes:
+            break
+        os.remove(file_name)
+        total -= size
+        n_removed += 1
+    return n_removed
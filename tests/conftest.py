@@ -0,0 +1,89 @@
+"""
+Shared set up of the tests: the scripts of the repository are importable,
+the tests run from the repository (so config.ini and marcmentat_files are
+found), and fake_py_post stands in for py_post if Marc is not installed.
+"""
+
+import os
+import sys
+import pytest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from benchmarks import import_post_process
+
+
+@pytest.fixture(autouse=True)
+def in_repository(monkeypatch):
+    """Run every test from the repository directory."""
+    monkeypatch.chdir(REPOSITORY)
+
+
+@pytest.fixture
+def post():
+    """py_post_process, see `import_post_process`."""
+    return import_post_process()
+
+
+# Stand-ins for mentat and Marc: mentat writes the .dat file named in the
+# command line, Marc writes a few increments to the .sts file, a fake .t16
+# file and the exit number (13 for design 2).
+STUB_MENTAT = """
+import sys, time
+time.sleep(0.05)
+with open(sys.argv[1][: -len(".proc")] + ".dat", "w") as file:
+    file.write("fake deck\\n")
+"""
+
+STUB_MARC = """
+import os, sys, time
+sys.path.insert(0, sys.argv[2])
+import numpy as np
+import fake_py_post
+
+name = sys.argv[1][: -len(".dat")]
+design = int(name.rsplit("_", 1)[-1])
+with open(name + ".sts", "w") as file:
+    for increment in range(1, 4):
+        file.write(f"1 {increment} 2 0 0 {2 * increment} 0 0 0 0.1 {increment / 10} 0 1\\n")
+        file.flush()
+        time.sleep(0.05)
+    rng = np.random.default_rng(design)
+    coordinates = np.column_stack([25 * rng.random((300, 2)), np.zeros(300)])
+    fake_py_post.write_fake_t16(
+        name + ".t16", coordinates, 0.1 * rng.standard_normal((2, 300, 3))
+    )
+    exit_number = 13 if design == 2 else 3004
+    file.write(f" Job ends with exit number :    {exit_number}\\n")
+    file.write("            total wall time:        0.15\\n")
+    file.write("            total cpu  time:        0.12\\n")
+"""
+
+
+@pytest.fixture
+def stub_settings(tmp_path) -> dict:
+    """Pipeline settings that run the stub mentat and Marc scripts."""
+    import pipeline
+
+    directory = str(tmp_path)
+    stubs = {}
+    for name, source in (("mentat", STUB_MENTAT), ("marc", STUB_MARC)):
+        stubs[name] = os.path.join(directory, f"stub_{name}.py")
+        with open(stubs[name], "w") as file:
+            file.write(source)
+    settings = pipeline.read_pipeline_settings("config.ini")
+    settings.update(
+        mentat_command=f"{sys.executable} {stubs['mentat']} {{proc}}",
+        marc_command=f"{sys.executable} {stubs['marc']} {{dat}} {REPOSITORY}",
+        work_dir=os.path.join(directory, "jobs"),
+        timeout=60,
+        retries=0,
+        poll_interval=0.05,
+        proc_jobs=1,
+        mentat_jobs=2,
+        max_jobs=2,
+        post_jobs=2,
+        queue_size=1,
+    )
+    return settings
@@ -0,0 +1,87 @@
+import os
+import shutil
+import time
+import pandas as pd
+import fake_py_post
+from benchmarks import fake_post_file
+from campaign_index import open_index, pending, progress, refresh_index
+from create_model import DESIGN_COLUMNS, read_parameters, setup_proc_file_main
+
+
+def test_a_design_moves_through_every_stage(post, tmp_path):
+    directory = str(tmp_path)
+    design_file = os.path.join(directory, "designs.csv")
+    designs = [(12.5, 12.5, 1.5, 20.0, 60.0), (12.5, 12.5, 2.0, 0.0, 40.0)]
+    pd.DataFrame(designs, columns=DESIGN_COLUMNS).to_csv(
+        design_file, header=False, index=False
+    )
+    connection = open_index(os.path.join(directory, "campaign.sqlite"))
+
+    setup_proc_file_main(
+        design_file, "config.ini", proc_dir=directory, index=connection
+    )
+    assert pending(connection, "mentat") == [0, 1]
+
+    for design in (0, 1):
+        base_name = os.path.join(directory, f"example_model_{design}")
+        shutil.copy(f"{base_name}.proc", f"{base_name}.dat")
+    # the proc files may be cleaned up once mentat has run
+    os.remove(os.path.join(directory, "example_model_1.proc"))
+    refresh_index(connection, directory)
+    assert pending(connection, "mentat") == []
+    assert pending(connection, "marc") == [0, 1]
+
+    for design in (0, 1):
+        base_name = os.path.join(directory, f"example_model_{design}")
+        t_16_file = fake_post_file(300, 2, seed=design)
+        fake_py_post.write_fake_t16(
+            f"{base_name}.t16", t_16_file._coordinates, t_16_file._displacements[1:]
+        )
+        with open(f"{base_name}.sts", "w") as file:
+            file.write(" Job ends with exit number :    3004\n")
+    refresh_index(connection, directory)
+    assert pending(connection, "marc") == []
+    assert pending(connection, "post_process") == [0, 1]
+
+    post.post_process_parallel([0], directory, 1, index=connection)
+    assert pending(connection, "post_process") == [1]
+    post.do_the_post_processing(1, directory, "example_model_1.t16", index=connection)
+    refresh_index(connection, directory)
+    assert pending(connection, "post_process") == []
+    counts = progress(connection)
+    assert (
+        counts["proc_written"] == counts["succeeded"] == counts["post_processed"] == 2
+    )
+
+    # design 0 is solved again, its results have to be post processed again
+    sts_file_name = os.path.join(directory, "example_model_0.sts")
+    with open(sts_file_name, "a") as file:
+        file.write(" Job ends with exit number :    3004\n")
+    later = time.time() + 10
+    os.utime(sts_file_name, (later, later))
+    refresh_index(connection, directory)
+    assert pending(connection, "post_process") == [0]
+    assert progress(connection)["post_processed"] == 1
+    # but not when it was post processed after it was solved
+    os.utime(sts_file_name, (later - 20, later - 20))
+    post.do_the_post_processing(0, directory, "example_model_0.t16", index=connection)
+    refresh_index(connection, directory)
+    assert pending(connection, "post_process") == []
+    connection.close()
+
+
+def test_missing_and_failed_simulations_are_listed_once(post, tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, "example_model_1.sts"), "w") as file:
+        file.write(" Job ends with exit number :    13\n")
+    with open(os.path.join(directory, "example_model_1.t16"), "w") as file:
+        file.write("not a post file")
+    for _ in range(2):
+        post.post_process_parallel([0, 1], directory, 1)
+        post.do_the_post_processing(0, directory, "example_model_0.t16")
+    for list_file, expected in (
+        ("missing_files.txt", "example_model_0.t16"),
+        ("failed_sims.txt", "example_model_1.sts"),
+    ):
+        with open(os.path.join(directory, list_file)) as file:
+            assert file.read().split() == [os.path.join(directory, expected)]
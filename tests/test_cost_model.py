@@ -0,0 +1,41 @@
+import os
+import numpy as np
+from benchmarks import random_designs
+from campaign_index import open_index, refresh_index
+from cost_model import fit_from_index, longest_first, read_designs, simulate_makespan
+from create_model import create_rectangles, read_parameters
+
+
+def test_longest_predicted_first_shortens_the_makespan(tmp_path):
+    # the wall time of a design depends on its ligament and aspect ratio
+    designs = random_designs(400, seed=3)
+    vertices, valid = create_rectangles(designs)
+    designs, vertices = designs[valid], vertices[valid]
+    ligament = np.minimum(vertices, 25.0 - vertices).min(axis=(1, 2))
+    rng = np.random.default_rng(3)
+    wall_times = 200 * np.exp(3 / ligament + 0.5 * np.log(designs[:, 2]))
+    wall_times *= rng.lognormal(0, 0.1, len(designs))
+
+    directory = str(tmp_path)
+    design_file = os.path.join(directory, "designs.csv")
+    np.savetxt(design_file, designs, delimiter=",")
+    # the first half has finished
+    n_done = len(designs) // 2
+    for design in range(n_done):
+        with open(os.path.join(directory, f"example_model_{design}.sts"), "w") as f:
+            f.write(" Job ends with exit number :    3004\n")
+            f.write(f" total wall time:   {wall_times[design]:.2f}\n")
+    connection = open_index(os.path.join(directory, "campaign.sqlite"))
+    refresh_index(connection, directory)
+    model = fit_from_index(connection, design_file, "config.ini")
+    connection.close()
+    assert model.n_runs == n_done and model.weights is not None
+    assert model.errors["rank_correlation"] > 0.8, model.errors
+
+    remaining = read_designs(design_file, range(n_done, len(designs)))
+    predicted = model.predict(remaining, read_parameters("config.ini"))
+    actual = wall_times[n_done:]
+    in_order = simulate_makespan(actual, 8)
+    lpt = simulate_makespan(actual, 8, longest_first(predicted))
+    assert lpt <= in_order, (lpt, in_order)
+    assert lpt <= 1.05 * max(actual.sum() / 8, actual.max()), lpt
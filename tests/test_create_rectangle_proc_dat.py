@@ -0,0 +1,83 @@
+import os
+import numpy as np
+from benchmarks import random_designs
+from create_model import create_rectangles
+from create_rectangle_proc_dat import (
+    create_rectangle_proc_dat,
+    create_rectangle_proc_dat_old,
+    expand_parametric_proc,
+    write_parametric_procs,
+    write_rectangle_procs,
+)
+
+
+def write_old_procs(file_name, vertices, names):
+    """Write the proc commands of every design with the line by line writer."""
+    for i, name in enumerate(names):
+        args = (vertices[i, :, 0].tolist(), vertices[i, :, 1].tolist())
+        create_rectangle_proc_dat_old(*args, 0.5, 0.025, 0.001, 10.0, file_name, name)
+    with open(f"{file_name}.proc") as file:
+        return file.read()
+
+
+def test_template_matches_line_by_line_writer(tmp_path):
+    vertices, _ = create_rectangles(random_designs(1000))
+    names = [f"example_model_{i}" for i in range(len(vertices))]
+    expected = write_old_procs(str(tmp_path / "old"), vertices, names)
+
+    new_file = str(tmp_path / "new")
+    for i, name in enumerate(names):
+        args = (vertices[i, :, 0].tolist(), vertices[i, :, 1].tolist())
+        create_rectangle_proc_dat(*args, 0.5, 0.025, 0.001, 10.0, new_file, name)
+    batch_file = tmp_path / "batch.proc"
+    with open(batch_file, "w") as file:
+        write_rectangle_procs(
+            file, vertices[:, :, 0], vertices[:, :, 1], 0.5, 0.025, 0.001, names
+        )
+
+    for file_name in (f"{new_file}.proc", batch_file):
+        with open(file_name, "rb") as file:
+            assert file.read() == expected.encode(), file_name
+
+
+def test_int_vertices_render_like_line_by_line_writer(tmp_path):
+    vertices = np.array([[[5, 5], [20, 5], [20, 10], [5, 10]]])
+    expected = write_old_procs(str(tmp_path / "old"), vertices, ["example_model_0"])
+    batch_file = tmp_path / "batch.proc"
+    with open(batch_file, "w") as file:
+        write_rectangle_procs(
+            file,
+            vertices[:, :, 0],
+            vertices[:, :, 1],
+            0.5,
+            0.025,
+            0.001,
+            ["example_model_0"],
+        )
+    assert batch_file.read_text() == expected
+    assert "*add_nodes 5 5 0\n" in expected
+
+
+def test_parametric_driver_sets_every_body_variable(tmp_path):
+    # this only checks the driver and body against each other, not that
+    # Mentat accepts them
+    vertices, _ = create_rectangles(random_designs(50))
+    names = [f"example_model_{i}" for i in range(len(vertices))]
+    expected = write_old_procs(str(tmp_path / "old"), vertices, names)
+
+    body_file, driver_file = str(tmp_path / "body"), str(tmp_path / "driver")
+    write_parametric_procs(
+        body_file,
+        driver_file,
+        vertices[:, :, 0],
+        vertices[:, :, 1],
+        0.5,
+        0.025,
+        0.001,
+        names,
+    )
+    with open(f"{body_file}.proc") as file:
+        body = file.read()
+    with open(f"{driver_file}.proc") as file:
+        driver = file.read()
+    assert expand_parametric_proc(driver, body) == expected
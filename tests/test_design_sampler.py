@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import design_sampler
+from create_model import create_rectangles
+
+
+def test_sobol_points_are_stratified():
+    points = design_sampler.sobol_points(2**10, seed=4)
+    for d in range(5):
+        assert len(np.unique((points[:, d] * 2**10).astype(int))) == 2**10, d
+
+
+@pytest.mark.parametrize("method", design_sampler.METHODS)
+def test_designs_are_feasible(method):
+    designs, _ = design_sampler.sample_designs(600, method, seed=2, min_ligament=1.0)
+    assert create_rectangles(designs, 25.0, 1.0)[1].all()
+
+
+@pytest.mark.parametrize("method", ["sobol", "halton"])
+def test_extending_a_sample_gives_the_same_designs(method):
+    designs, next_index = design_sampler.sample_designs(
+        600, method, seed=2, min_ligament=1.0
+    )
+    first, index = design_sampler.sample_designs(250, method, seed=2, min_ligament=1.0)
+    rest, last = design_sampler.sample_designs(
+        350, method, seed=2, min_ligament=1.0, start_index=index
+    )
+    assert np.array_equal(designs, np.vstack([first, rest]))
+    assert last == next_index
+
+
+@pytest.mark.parametrize("method", ["sobol", "halton", "lhs"])
+def test_low_discrepancy_beats_random(method):
+    random, _ = design_sampler.sample_designs(512, "random", seed=2)
+    designs, _ = design_sampler.sample_designs(512, method, seed=2)
+    assert design_sampler.discrepancy(designs) < design_sampler.discrepancy(random)
+
+
+@pytest.mark.parametrize("start_index", [1, 2, 131072, 131072 + 5, 2**20 - 3])
+def test_offset_sobol_batch_matches_one_long_run(start_index):
+    points = design_sampler.sobol_points(start_index + 8, seed=1)
+    offset = design_sampler.sobol_points(8, start_index, seed=1)
+    assert np.array_equal(offset, points[start_index:])
+
+
+def test_single_sobol_point_past_the_first():
+    point = design_sampler.sobol_points(1, 2)
+    assert np.array_equal(point, design_sampler.sobol_points(3)[2:])
+    assert np.array_equal(point[0, :2], [0.25, 0.75])
@@ -0,0 +1,47 @@
+import os
+from job_runner import find_jobs, run_jobs
+
+
+def test_jobs_are_solved_and_failures_retried(tmp_path, stub_settings):
+    proc_dir = str(tmp_path / "procs")
+    results_dir = str(tmp_path / "results")
+    os.mkdir(proc_dir)
+    for design in range(4):
+        with open(os.path.join(proc_dir, f"example_model_{design}.proc"), "w") as file:
+            file.write("fake commands\n")
+    # design 3 has only a .dat file, mentat is skipped
+    os.rename(
+        os.path.join(proc_dir, "example_model_3.proc"),
+        os.path.join(proc_dir, "example_model_3.dat"),
+    )
+    stub_settings["retries"] = 1
+
+    names = find_jobs(proc_dir)
+    results = run_jobs(names, proc_dir, stub_settings, results_dir)
+    assert [result["name"] for result in results] == names
+    failed = results[2]
+    assert not failed["success"] and failed["attempts"] == 2, failed
+    assert failed["exit_number"] == 13 and failed["error"] == "exit number 13"
+    assert failed["solver_time"] is None
+    for result in results[:2] + results[3:]:
+        assert result["success"] and result["attempts"] == 1, result
+        assert result["exit_number"] == 3004 and result["error"] is None
+        # the Marc wall time from the .sts file, without mentat
+        assert result["solver_time"] == 0.15 < result["wall_time"], result
+    for name in names:
+        for extension in (".dat", ".sts", ".t16"):
+            assert os.path.isfile(os.path.join(results_dir, name + extension))
+    # only the job directory of the failed job is kept
+    assert os.listdir(stub_settings["work_dir"]) == ["example_model_2"]
+
+
+def test_stalled_jobs_are_not_retried(tmp_path, stub_settings):
+    with open(tmp_path / "example_model_0.proc", "w") as file:
+        file.write("fake commands\n")
+    # every increment of the stub runs at a time step of 0.1
+    stub_settings.update(
+        retries=2, min_fraction=1.0, stall_increments=2, poll_interval=0.01
+    )
+    (result,) = run_jobs(["example_model_0"], str(tmp_path), stub_settings)
+    assert result["attempts"] == 1 and not result["success"], result
+    assert result["error"].startswith("stopped early: time step"), result
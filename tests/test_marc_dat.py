@@ -0,0 +1,152 @@
+import os
+import numpy as np
+import pytest
+from benchmarks import random_designs
+from create_model import create_rectangles, read_parameters
+from marc_dat import (
+    format_marc_float,
+    parse_marc_float,
+    read_dat_mesh,
+    read_load_parameters,
+    write_marc_dat,
+)
+from quad_mesher import mesh_unit_cell
+
+# The cards mentat writes for the CAD body of the model, which
+# `write_marc_dat` leaves out.
+CAD_CARDS = ("cad bodies", "attach edge", "attach face")
+
+
+def deck_sections(dat_file_name: str) -> list:
+    """
+    Split a deck into its cards.
+
+    Args:
+        dat_file_name: (str) The .dat file name with extension.
+
+    Returns:
+        sections: (list) (card, lines) of every card, where a card is a line
+            that does not start with a blank or "$" and lines are the lines
+            up to the next card. The CAD body cards are left out.
+    """
+    with open(dat_file_name) as file:
+        lines = file.read().splitlines()
+    sections = []
+    for line in lines:
+        if line and line[0] not in " $":
+            sections.append((line[:20].rstrip(), [line]))
+        else:
+            sections[-1][1].append(line)
+
+    kept = []
+    in_cad_bodies = False
+    for card, lines in sections:
+        # the body name and parasolid file name follow the cad bodies card
+        in_cad_bodies = card == "cad bodies" or in_cad_bodies and card != "connectivity"
+        if not in_cad_bodies and card not in CAD_CARDS:
+            kept.append((card, lines))
+    return kept
+
+
+@pytest.mark.parametrize("design", [0, 1])
+def test_reader_matches_a_line_by_line_parse(design):
+    dat_file_name = os.path.join("marcmentat_files", f"example_model_{design}.dat")
+    mesh = read_dat_mesh(dat_file_name)
+    with open(dat_file_name, "rb") as file:
+        lines = file.read().splitlines()
+    first = lines.index(b"coordinates") + 2
+    rows = lines[first : first + len(mesh["node_ids"])]
+    expected = [
+        [parse_marc_float(row[k : k + 20]) for k in (10, 30, 50)] for row in rows
+    ]
+    assert np.array_equal(mesh["coordinates"], expected)
+    assert len(mesh["element_ids"]) == mesh["n_elements"]
+
+
+def test_written_meshes_read_back(tmp_path):
+    vertices, valid = create_rectangles(random_designs(20))
+    dat_file_name = str(tmp_path / "mesh.dat")
+    for i in np.flatnonzero(valid):
+        coordinates, connectivity, cavity = mesh_unit_cell(
+            vertices[i, :, 0], vertices[i, :, 1], 0.5
+        )
+        write_marc_dat(dat_file_name, coordinates, connectivity, cavity, 0.025, 1e-4)
+        mesh = read_dat_mesh(dat_file_name)
+        # the .dat keeps 16 significant digits
+        expected = [
+            [parse_marc_float(format_marc_float(v)) for v in row]
+            for row in coordinates.tolist()
+        ]
+        assert np.array_equal(mesh["coordinates"][:, :2], expected), i
+        assert np.array_equal(mesh["connectivity"][:, :4], connectivity), i
+
+
+@pytest.mark.parametrize("design", [0, 1])
+def test_written_deck_matches_mentat(design, tmp_path):
+    # write the mesh of the mentat deck again, numbering the nodes from 1
+    dat_file_name = os.path.join("marcmentat_files", f"example_model_{design}.dat")
+    mesh = read_dat_mesh(dat_file_name)
+    assert np.array_equal(mesh["element_ids"], np.arange(1, mesh["n_elements"] + 1))
+    node_numbers = np.zeros(mesh["node_ids"].max() + 1, dtype=int)
+    node_numbers[mesh["node_ids"]] = np.arange(1, len(mesh["node_ids"]) + 1)
+    expected = deck_sections(dat_file_name)
+    sets = {
+        lines[0].split()[-1]: lines[1:] for card, lines in expected if card == "define"
+    }
+    cavity = [
+        int(item.split(":")[0])
+        for line in sets["apply3_edges"]
+        for item in line.split()
+        if item != "c"
+    ]
+    params = read_load_parameters(dat_file_name)
+    written_file_name = str(tmp_path / "written.dat")
+    write_marc_dat(
+        written_file_name,
+        mesh["coordinates"][:, :2],
+        node_numbers[mesh["connectivity"][:, :4]],
+        cavity,
+        params["pressure"],
+        params["min_fraction"],
+        fixed_xy_node=node_numbers[int(sets["apply1_nodes"][0])],
+        fixed_x_node=node_numbers[int(sets["apply2_nodes"][0])],
+    )
+    written = deck_sections(written_file_name)
+
+    assert [card for card, _ in written] == [card for card, _ in expected]
+    # only the node numbers of the mesh cards differ
+    for (card, lines), (_, expected_lines) in zip(written, expected):
+        if card not in ("connectivity", "coordinates"):
+            assert lines == expected_lines, card
+
+
+@pytest.mark.parametrize("design", [0, 1])
+def test_meshed_deck_matches_mentat(design, tmp_path):
+    dat_file_name = os.path.join("marcmentat_files", f"example_model_{design}.dat")
+    designs = np.loadtxt("Rectangle_inputs.csv", delimiter=",", ndmin=2)
+    vertices, _ = create_rectangles(designs[design : design + 1])
+    element_size = read_parameters()["element_size"]
+    coordinates, connectivity, cavity = mesh_unit_cell(
+        vertices[0, :, 0], vertices[0, :, 1], element_size
+    )
+    # the examples were written with other load parameters than config.ini
+    params = read_load_parameters(dat_file_name)
+    written_file_name = str(tmp_path / "written.dat")
+    write_marc_dat(
+        written_file_name,
+        coordinates,
+        connectivity,
+        cavity,
+        params["pressure"],
+        params["min_fraction"],
+    )
+    expected = deck_sections(dat_file_name)
+    written = deck_sections(written_file_name)
+
+    assert [card for card, _ in written] == [card for card, _ in expected]
+    # the sizing, the mesh, the sets and the number of boundary edges of the
+    # contact body depend on the mesh
+    mesh_cards = ("sizing", "connectivity", "coordinates", "define", "contact")
+    for (card, lines), (_, expected_lines) in zip(written, expected):
+        if card not in mesh_cards:
+            assert lines == expected_lines, card
@@ -0,0 +1,54 @@
+import os
+import pytest
+from job_runner import read_runner_settings
+from marc_sts import StsMonitor
+
+
+def replay(sts_file_name: str, file_name: str, **kwargs):
+    """
+    Feed an .sts file line by line to a monitor, as Marc would write it.
+
+    Returns:
+        reason: (str) The first abort reason, None if the monitor never
+            asked to stop the job.
+        monitor: (StsMonitor) The monitor.
+    """
+    monitor = StsMonitor(file_name, **kwargs)
+    with open(sts_file_name, "rb") as source, open(file_name, "wb") as file:
+        for line in source:
+            file.write(line)
+            file.flush()
+            if monitor.poll():
+                reason = monitor.abort_reason()
+                if reason:
+                    return reason, monitor
+    monitor.poll()
+    return None, monitor
+
+
+@pytest.mark.parametrize("design", [0, 1])
+def test_successful_jobs_are_not_aborted(tmp_path, design):
+    settings = read_runner_settings("config.ini")
+    sts_file_name = os.path.join("marcmentat_files", f"example_model_{design}.sts")
+    reason, monitor = replay(
+        sts_file_name,
+        str(tmp_path / "job.sts"),
+        min_fraction=settings["min_fraction"],
+        stall_increments=settings["stall_increments"],
+        max_cycles=settings["max_cycles"],
+    )
+    assert reason is None
+    assert monitor.finished and monitor.exit_number == 3004
+
+
+def test_enabled_checks_abort(tmp_path):
+    sts_file_name = os.path.join("marcmentat_files", "example_model_1.sts")
+    reason, monitor = replay(
+        sts_file_name,
+        str(tmp_path / "stall.sts"),
+        min_fraction=0.001,
+        stall_increments=50,
+    )
+    assert "increments" in reason and monitor.stalled_increments == 50
+    reason, _ = replay(sts_file_name, str(tmp_path / "cycles.sts"), max_cycles=50)
+    assert "cycles per increment" in reason
@@ -0,0 +1,95 @@
+import os
+import sys
+import numpy as np
+import fake_py_post
+import pipeline
+from benchmarks import random_designs
+from create_model import create_rectangles, read_parameters
+from result_cache import ResultCache
+from results_store import ResultsStore, read_results
+
+
+def test_pipeline_overlaps_the_stages(post, tmp_path, monkeypatch, stub_settings):
+    designs = random_designs(8)
+    designs = designs[create_rectangles(designs)[1]][:8]
+    # design 3 does not fit in the unit
+    designs[3] = (1.0, 1.0, 1.0, 0.0, 40.0)
+    node_targets = post.set_up_node_targets()
+    directory = str(tmp_path)
+    if sys.modules["py_post"] is fake_py_post:
+        # the post processing workers are spawned and import py_post
+        with open(os.path.join(directory, "py_post.py"), "w") as file:
+            file.write("from fake_py_post import *\n")
+        monkeypatch.setattr(sys, "path", [directory, os.getcwd(), *sys.path])
+
+    settings = stub_settings
+    results_dir = os.path.join(directory, "results")
+    store = ResultsStore(
+        os.path.join(directory, "output.npy"), len(designs), 2 * len(node_targets)
+    )
+    cache = ResultCache(os.path.join(directory, "cache"))
+    jobs = pipeline.run_pipeline(
+        iter(designs.tolist()),
+        settings,
+        read_parameters("config.ini"),
+        os.path.join(directory, "procs"),
+        results_dir,
+        store,
+        cache=cache,
+    )
+    # a second run finds the designs in the store
+    rerun = pipeline.run_pipeline(
+        designs[:2].tolist(), settings, None, directory, store=store
+    )
+    # and a new store gets them from the cache
+    cached_store = ResultsStore(
+        os.path.join(directory, "cached.npy"), 2, 2 * len(node_targets)
+    )
+    cached = pipeline.run_pipeline(
+        designs[:2].tolist(), settings, None, directory, store=cached_store, cache=cache
+    )
+
+    assert [job["design"] for job in jobs] == list(range(len(designs)))
+    assert jobs[2]["stage"] == "marc" and jobs[2]["exit_number"] == 13, jobs[2]
+    assert jobs[3]["error"] == "not a valid cavity", jobs[3]
+    solved = [job for job in jobs if job["design"] not in (2, 3)]
+    assert all(job["success"] for job in solved), solved
+    assert [job["stage"] for job in rerun] == ["stored", "stored"], rerun
+    assert [job["stage"] for job in cached] == ["cached", "cached"], cached
+
+    values, valid = read_results(store.file_name)
+    assert np.flatnonzero(~valid).tolist() == [2, 3]
+    cached_values, cached_valid = read_results(cached_store.file_name)
+    assert cached_valid.all() and np.array_equal(cached_values, values[:2])
+    for job in solved:
+        file_name = os.path.join(results_dir, f"{job['name']}.t16")
+        positions = post.get_positions(file_name, node_targets)
+        expected = np.concatenate([positions[:, 0], positions[:, 1]])
+        assert np.array_equal(values[job["design"]], expected), job["name"]
+    # only the job directory of the failed job is kept
+    assert os.listdir(settings["work_dir"]) == ["example_model_2"]
+
+    first_post = min(job["times"]["post"][0] for job in solved)
+    last_marc = max(job["times"]["marc"][1] for job in solved)
+    assert first_post < last_marc, "the stages did not overlap"
+    last_proc = max(job["times"]["proc"][0] for job in jobs if "proc" in job["times"])
+    first_mentat = min(job["times"]["mentat"][0] for job in solved)
+    assert last_proc > first_mentat, "the proc files did not wait for mentat"
+
+
+def test_a_design_run_again_gets_a_new_proc_file(tmp_path):
+    params = read_parameters("config.ini")
+    vertices = create_rectangles(random_designs(1))[0][0]
+    proc_file_name = str(tmp_path / "example_model_0")
+    for _ in range(2):
+        pipeline.write_proc_file(proc_file_name, vertices, params, "example_model_0")
+    with open(f"{proc_file_name}.proc") as file:
+        proc = file.read()
+    assert proc == pipeline.render_rectangle_proc(
+        vertices[:, 0].tolist(),
+        vertices[:, 1].tolist(),
+        params["element_size"],
+        params["pressure"],
+        params["min_fraction"],
+        "example_model_0",
+    )
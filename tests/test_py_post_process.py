@@ -0,0 +1,225 @@
+import os
+import numpy as np
+import pytest
+import fake_py_post
+from benchmarks import (
+    STRAIN_DESIGN,
+    fake_mesh,
+    fake_post_file,
+    fake_strain_post_file,
+    write_fake_results,
+)
+from results_store import ResultsStore, read_results
+from strain_reductions import STRAIN_SUMMARY_FIELDS
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_closest_node_matches_old_implementations(post, seed):
+    # the meshes include targets that are equally close to several nodes
+    coordinates = fake_mesh(50 + 40 * seed, seed)
+    t_16_file = fake_py_post.PostFile(coordinates, np.zeros((1, *coordinates.shape)))
+    node_targets = post.set_up_node_targets(intervals=5 + seed)
+    expected = post.find_closest_node_old(t_16_file, node_targets)
+    assert np.array_equal(
+        post.find_closest_node_vectorised(t_16_file, node_targets), expected
+    )
+    assert np.array_equal(post.find_closest_node(t_16_file, node_targets), expected)
+
+
+def test_increment_selection(post):
+    t_16_file = fake_post_file(500, 37)
+    nodes = list(range(0, t_16_file.nodes(), 7))
+    positions, disps = post.get_node_position(t_16_file, nodes)
+    times = t_16_file._times[1:]
+
+    for increments, expected in (
+        ("last", [36]),
+        (5, list(range(36, -1, -5))[::-1]),
+        ([1, 4, -1], [0, 3, 36]),
+        ([times[10] + 1e-9, 0.0, 2.0], [10, 0, 36]),
+    ):
+        selected, selected_disps = post.get_node_position(t_16_file, nodes, increments)
+        assert np.array_equal(selected, positions[expected]), increments
+        assert np.array_equal(selected_disps, disps[expected]), increments
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_history_export(post, tmp_path, dtype):
+    t_16_file = fake_post_file(500, 23)
+    positions, _ = post.get_node_position(t_16_file)
+    file_name = str(tmp_path / "history.npy")
+    post.write_node_history(t_16_file, file_name, dtype=dtype)
+    times, history = post.read_node_history(file_name)
+    assert history.dtype == dtype
+    assert np.array_equal(history, positions.astype(dtype))
+    assert np.array_equal(times, t_16_file._times[1:])
+
+
+def test_parallel_post_processing_matches_serial(post, tmp_path):
+    n_sims = 12
+    directory = str(tmp_path / "results")
+    os.mkdir(directory)
+    node_targets = post.set_up_node_targets()
+    write_fake_results(directory, n_sims)
+    expected_file = os.path.join(directory, "expected.txt")
+    for iteration in [0] + list(range(4, n_sims)):
+        file_name = os.path.join(directory, f"example_model_{iteration}.t16")
+        positions = post.get_positions(file_name, node_targets)
+        post._write_positions_to_file(positions, expected_file)
+
+    status = post.post_process_parallel(range(n_sims), directory, processes=3)
+    assert status[1] == "missing" and status[2] == "failed", status
+    assert status[3].startswith(("ValueError", "OSError")), status
+    assert all(status[i] == "done" for i in [0] + list(range(4, n_sims)))
+
+    with open(expected_file) as file:
+        expected = file.read()
+    with open(os.path.join(directory, "Example_ouput_file.txt")) as file:
+        assert file.read() == expected
+
+    # the missing and failed simulations are listed in the directory itself
+    with open(os.path.join(directory, "missing_files.txt")) as file:
+        assert file.read().split() == [os.path.join(directory, "example_model_1.t16")]
+    with open(os.path.join(directory, "failed_sims.txt")) as file:
+        assert file.read().split() == [os.path.join(directory, "example_model_2.sts")]
+    assert os.listdir(tmp_path) == ["results"]
+
+
+def test_element_tensors_are_read_once_per_element(post):
+    t_16_file, _ = fake_strain_post_file(n_incs=3)
+    expected = t_16_file._tensors[1][1:]
+    tensors = post.get_element_tensors(t_16_file, "log_strain", increments=None)
+    assert np.array_equal(tensors, expected)
+    assert t_16_file.calls == 3 * t_16_file.elements()
+    assert np.array_equal(
+        post.get_element_tensors(t_16_file, "Total_Strain", [2, -1]), expected[[1, 2]]
+    )
+    with pytest.raises(ValueError):
+        post.get_element_tensors(t_16_file, "plastic strain")
+
+
+def test_element_centroids_are_undeformed(post):
+    t_16_file, _ = fake_strain_post_file(n_incs=2)
+    t_16_file._displacements[1:] += 1.0
+
+    class DeformedPostFile(type(t_16_file)):
+        # like py_post, the node coordinates follow the current increment
+        def node(self, index):
+            node = super().node(index)
+            x, y, z = self._displacements[self._increment, index]
+            return node._replace(x=node.x + x, y=node.y + y, z=node.z + z)
+
+    t_16_file.__class__ = DeformedPostFile
+    expected, _ = post.get_element_centroids(t_16_file)
+    post.get_element_tensors(t_16_file, "log_strain")
+    centroids, _ = post.get_element_centroids(t_16_file)
+    assert np.array_equal(centroids, expected)
+
+
+def test_strain_summaries_reach_the_store(post, tmp_path):
+    n_sims = 3
+    directory = str(tmp_path)
+    node_targets = post.set_up_node_targets()
+    corners = fake_strain_post_file()[1]
+    expected_rows = []
+    for iteration in range(n_sims):
+        base_name = os.path.join(directory, f"example_model_{iteration}")
+        t_16_file, _ = fake_strain_post_file(n_incs=2, seed=iteration)
+        fake_py_post.write_fake_t16(
+            f"{base_name}.t16",
+            t_16_file._coordinates,
+            t_16_file._displacements[1:],
+            connectivity=t_16_file._connectivity,
+            element_tensors={"Total Strain": t_16_file._tensors[1][1:]},
+        )
+        with open(f"{base_name}.sts", "w") as file:
+            file.write(" Job ends with exit number :    3004\n")
+        positions, strains = post.get_positions_and_strains(
+            f"{base_name}.t16", node_targets, corners
+        )
+        expected_rows.append(
+            np.concatenate([positions[:, 0], positions[:, 1], strains])
+        )
+
+    n_values = 2 * len(node_targets) + len(STRAIN_SUMMARY_FIELDS)
+    store = ResultsStore(os.path.join(directory, "output.npy"), n_sims, n_values)
+    designs = {i: STRAIN_DESIGN for i in range(n_sims)}
+    status = post.post_process_parallel(
+        range(n_sims), directory, 2, designs=designs, store=store, strain=True
+    )
+    assert all(value == "done" for value in status.values()), status
+    values, valid = read_results(store.file_name)
+    assert valid.all() and np.array_equal(values, expected_rows)
+
+
+def test_do_the_post_processing_finds_the_results(post, tmp_path):
+    directory = str(tmp_path)
+    write_fake_results(directory, 5)
+    expected_file = os.path.join(directory, "expected.txt")
+    # simulation 3 is corrupt, which only the parallel post processing catches
+    for iteration in (0, 1, 2, 4):
+        post.do_the_post_processing(
+            iteration, directory, f"example_model_{iteration}.t16"
+        )
+        if iteration in (0, 4):
+            file_name = os.path.join(directory, f"example_model_{iteration}.t16")
+            positions = post.get_positions(file_name, post.set_up_node_targets())
+            post._write_positions_to_file(positions, expected_file)
+    with open(expected_file) as file:
+        expected = file.read()
+    with open(os.path.join(directory, "Example_ouput_file.txt")) as file:
+        assert file.read() == expected
+
+
+def test_do_the_post_processing_writes_the_strains(post, tmp_path):
+    directory = str(tmp_path)
+    t_16_file, corners = fake_strain_post_file(n_incs=2)
+    fake_py_post.write_fake_t16(
+        os.path.join(directory, "example_model_0.t16"),
+        t_16_file._coordinates,
+        t_16_file._displacements[1:],
+        connectivity=t_16_file._connectivity,
+        element_tensors={"Total Strain": t_16_file._tensors[1][1:]},
+    )
+    with open(os.path.join(directory, "example_model_0.sts"), "w") as file:
+        file.write(" Job ends with exit number :    3004\n")
+    post.do_the_post_processing(
+        0, directory, "example_model_0.t16", design=STRAIN_DESIGN, strain=True
+    )
+
+    _, strains = post.get_positions_and_strains(
+        os.path.join(directory, "example_model_0.t16"),
+        post.set_up_node_targets(),
+        corners,
+    )
+    expected_file = os.path.join(directory, "expected.txt")
+    post._write_values_to_file(strains, expected_file)
+    with open(expected_file) as file:
+        expected = file.read()
+    with open(os.path.join(directory, "Example_strain_file.txt")) as file:
+        assert file.read() == expected
+    assert os.path.isfile(os.path.join(directory, "Example_ouput_file.txt"))
+
+
+def test_a_crash_only_reruns_the_files_in_flight(post, tmp_path, monkeypatch):
+    n_sims, processes = 16, 3
+    directory = str(tmp_path)
+    write_fake_results(directory, n_sims)
+    with open(os.path.join(directory, "example_model_5.t16"), "wb") as file:
+        file.write(fake_py_post.CRASH)
+
+    pools = []
+
+    class RecordingPool(post.ProcessPoolExecutor):
+        def __init__(self, max_workers, *args, **kwargs):
+            pools.append(max_workers)
+            super().__init__(max_workers, *args, **kwargs)
+
+    monkeypatch.setattr(post, "ProcessPoolExecutor", RecordingPool)
+    status = post.post_process_parallel(range(n_sims), directory, processes)
+
+    assert status[5] == "the post processing process crashed", status
+    assert all(status[i] == "done" for i in [0, 4] + list(range(6, n_sims)))
+    # the pool is rebuilt at full size, only the files in flight run alone
+    assert pools[:2] == [processes, processes], pools
+    assert 1 <= pools.count(1) <= processes, pools
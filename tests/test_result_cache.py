@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pandas as pd
+from create_model import DESIGN_COLUMNS, read_parameters, write_proc_files
+from result_cache import ResultCache
+from results_store import ResultsStore, read_results
+
+DESIGNS = pd.DataFrame(
+    [(12.5, 12.5, 1.5, 20.0, 60.0), (12.5, 12.5, 2.0, 0.0, 40.0)],
+    columns=DESIGN_COLUMNS,
+)
+
+
+def test_only_results_for_the_node_targets_skip_a_design(post, tmp_path):
+    params = read_parameters("config.ini")
+    node_targets = post.set_up_node_targets()
+    cache = ResultCache(str(tmp_path / "cache"))
+    positions = np.zeros((len(node_targets), 3))
+    cache.put(DESIGNS.loc[0], params, positions, post.set_up_node_targets(20))
+    cache.put(DESIGNS.loc[1], params, positions, node_targets)
+
+    written = write_proc_files(DESIGNS, params, str(tmp_path), cache, node_targets)
+    assert written == [0]
+    assert os.path.isfile(tmp_path / "example_model_0.proc")
+    assert not os.path.isfile(tmp_path / "example_model_1.proc")
+    # without the targets nothing is skipped
+    assert write_proc_files(DESIGNS, params, str(tmp_path), cache) == [0, 1]
+
+
+def test_eviction_removes_the_least_recently_used_entries(tmp_path):
+    params = read_parameters("config.ini")
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10**6)
+    keys = []
+    for i in range(2):
+        keys.append(cache.put(DESIGNS.loc[i], params, np.zeros((10, 3))))
+        os.utime(os.path.join(cache.directory, f"{keys[i]}.npz"), (i, i))
+    # a file an older cache left next to the first entry goes with it
+    with open(os.path.join(cache.directory, f"{keys[0]}.dat"), "w") as file:
+        file.write("x" * 1000)
+    os.utime(os.path.join(cache.directory, f"{keys[0]}.dat"), (0, 0))
+    # the first entry was used last
+    assert cache.get(DESIGNS.loc[0], params) is not None
+
+    sizes = [entry.stat().st_size for entry in os.scandir(cache.directory)]
+    cache.max_bytes = sum(sizes) - 1
+    cache.evict()
+    assert cache.evictions == 1
+    assert sorted(os.listdir(cache.directory)) == [f"{keys[0]}.dat", f"{keys[0]}.npz"]
+
+
+def test_cached_results_reach_the_output(post, tmp_path):
+    params = read_parameters("config.ini")
+    node_targets = post.set_up_node_targets()
+    cache = ResultCache(str(tmp_path / "cache"))
+    positions = np.random.default_rng(0).random((len(node_targets), 3))
+    cache.put(DESIGNS.loc[1], params, positions, node_targets)
+    directory = str(tmp_path / "results")
+    os.makedirs(directory)
+
+    # there are no result files, design 1 comes from the cache
+    for iteration in range(2):
+        post.do_the_post_processing(
+            iteration,
+            directory,
+            f"example_model_{iteration}.t16",
+            DESIGNS.loc[iteration],
+            params,
+            cache,
+        )
+    expected_file = str(tmp_path / "expected.txt")
+    post._write_positions_to_file(positions, expected_file)
+    with open(expected_file) as file:
+        expected = file.read()
+    with open(os.path.join(directory, "Example_ouput_file.txt")) as file:
+        assert file.read() == expected
+
+    store = ResultsStore(str(tmp_path / "output.npy"), 2, 2 * len(node_targets))
+    status = post.post_process_parallel(
+        range(2),
+        directory,
+        1,
+        designs=DESIGNS.loc,
+        params=params,
+        cache=cache,
+        store=store,
+    )
+    assert status == {0: "missing", 1: "cached"}
+    values, valid = read_results(store.file_name)
+    assert valid.tolist() == [False, True]
+    assert np.array_equal(values[1], np.concatenate([positions[:, 0], positions[:, 1]]))
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks import write_fake_results
+from results_store import ResultsStore, export_text, read_results
+
+
+def write_store_rows(args: tuple):
+    """Write rows to a results store from a separate process."""
+    file_name, iterations = args
+    store = ResultsStore(file_name)
+    for iteration in iterations:
+        store.write(iteration, np.full((200, 3), float(iteration)))
+    store.flush()
+
+
+def test_store_exports_the_text_output_and_resumes(post, tmp_path):
+    n_sims = 12
+    directory = str(tmp_path)
+    n_values = 2 * len(post.set_up_node_targets())
+    write_fake_results(directory, n_sims)
+    post.post_process_parallel(range(n_sims), directory, processes=2)
+
+    store_file = os.path.join(directory, "results.npy")
+    store = ResultsStore(store_file, n_sims, n_values)
+    post.post_process_parallel(range(n_sims // 2), directory, 2, store=store)
+    assert list(store.pending()) == list(range(n_sims // 2, n_sims))
+    del store
+    status = post.post_process_parallel(
+        range(n_sims), directory, 2, store=ResultsStore(store_file)
+    )
+    assert status[0] == "stored" and status[n_sims - 1] == "done", status
+
+    values, valid = read_results(store_file)
+    assert list(np.flatnonzero(~valid)) == [1, 2, 3]
+    text_file = os.path.join(directory, "exported.txt")
+    export_text(store_file, text_file)
+    with open(os.path.join(directory, "Example_ouput_file.txt")) as file:
+        expected = file.read()
+    with open(text_file) as file:
+        assert file.read() == expected
+
+
+def test_processes_share_a_store(tmp_path):
+    n_sims = 12
+    shared_file = str(tmp_path / "shared.npy")
+    ResultsStore(shared_file, n_sims, 400)
+    with ProcessPoolExecutor(3) as executor:
+        parts = [(shared_file, range(k, n_sims, 3)) for k in range(3)]
+        list(executor.map(write_store_rows, parts))
+    values, valid = read_results(shared_file)
+    assert valid.all()
+    assert np.array_equal(values[:, 0], np.arange(n_sims))
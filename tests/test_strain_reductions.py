@@ -0,0 +1,50 @@
+import numpy as np
+import strain_reductions
+from benchmarks import fake_strain_post_file
+
+
+def test_batched_reductions_match_a_loop(post):
+    t_16_file, _ = fake_strain_post_file(n_incs=3)
+    final = post.get_element_tensors(t_16_file, "log_strain")[-1]
+    principal = strain_reductions.principal_values(final)
+    equivalent = strain_reductions.equivalent_strain(final)
+    for e in range(0, len(final), 97):
+        for k in range(final.shape[1]):
+            matrix = strain_reductions.tensor_matrices(final[e, k])
+            assert np.allclose(principal[e, k], np.linalg.eigvalsh(matrix)[::-1])
+            deviatoric = matrix - np.trace(matrix) / 3 * np.eye(3)
+            von_mises = np.sqrt(2 / 3 * (deviatoric * deviatoric).sum())
+            assert np.isclose(equivalent[e, k], von_mises), (e, k)
+
+    brute = max(
+        (equivalent[e, k], e, k)
+        for e in range(len(final))
+        for k in range(final.shape[1])
+    )
+    assert strain_reductions.locate_max(equivalent) == brute
+
+
+def test_summary_finds_the_corner_peak(post):
+    t_16_file, corners = fake_strain_post_file(n_incs=3)
+    final = post.get_element_tensors(t_16_file, "log_strain")[-1]
+    centroids, element_ids = post.get_element_centroids(t_16_file)
+    summary = strain_reductions.summarise_strains(
+        final, centroids, element_ids, corners
+    )
+    location = [summary["max_equivalent_x"], summary["max_equivalent_y"]]
+    assert np.hypot(*(location - corners[0])) < 1.0, location
+    assert summary["corner_max_equivalent"] == summary["max_equivalent"]
+    _, element, _ = strain_reductions.locate_max(
+        strain_reductions.equivalent_strain(final)
+    )
+    assert summary["max_equivalent_element"] == element_ids[element]
+
+
+def test_missing_values_give_nan():
+    summary = strain_reductions.summarise_strains(
+        np.full((2, 4, 6), np.nan), np.zeros((2, 3))
+    )
+    assert np.isnan(summary["max_principal"]) and summary["max_principal_element"] == -1
+    assert len(strain_reductions.summary_vector(summary)) == len(
+        strain_reductions.STRAIN_SUMMARY_FIELDS
+    )
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import surrogate
+from benchmarks import fake_outputs, random_designs
+from create_model import create_rectangles
+from results_store import ResultsStore
+
+
+def test_screening_is_calibrated(tmp_path):
+    designs = random_designs(600, seed=5)
+    designs = designs[create_rectangles(designs)[1]][:300]
+    outputs = fake_outputs(designs)
+    # designs with far larger cavities than any that has been run
+    unlike = designs[:20].copy()
+    unlike[:, 4] = 80.0
+
+    directory = str(tmp_path)
+    design_file = os.path.join(directory, "designs.csv")
+    np.savetxt(design_file, np.vstack([designs, unlike]), delimiter=",")
+    config_file = os.path.join(directory, "config.ini")
+    with open(config_file, "w") as file:
+        file.write("[Surrogate]\nforced_rate=0.2\nthreshold=0.02\n")
+    store_file = os.path.join(directory, "Example_output.npy")
+    store = ResultsStore(store_file, len(designs) + len(unlike), outputs.shape[1])
+    # the first half has been run
+    n_run = len(designs) // 2
+    store.values[:n_run] = outputs[:n_run]
+    store.status[:n_run] = 1
+    store.flush()
+
+    prediction_file = os.path.join(directory, "Surrogate_output.npy")
+    screening_file = os.path.join(directory, "screening.npz")
+    summary = surrogate.screen_campaign(
+        design_file, store_file, config_file, screening_file, prediction_file
+    )
+    calibration = summary["calibration"]
+    assert calibration["coverage"] > 0.8, calibration
+    assert calibration["rmse"] < 0.02, calibration
+    with np.load(screening_file) as screening:
+        simulate = screening["simulate"]
+        forced = screening["forced"]
+    assert simulate[-len(unlike) :].all(), "unlike designs were not simulated"
+    confident = ~simulate | forced
+    assert confident.sum() > 0.5 * (len(designs) - n_run), summary
+    assert 0.1 < forced.sum() / confident.sum() < 0.3, summary
+
+    # run the screened designs and measure the predictions
+    store.values[n_run:] = np.vstack([outputs[n_run:], fake_outputs(unlike)])
+    store.status[n_run:] = 1
+    store.flush()
+    report = surrogate.screening_report(
+        store_file, config_file, screening_file, prediction_file
+    )
+    assert report["forced"]["max_error"] < 0.1, report
+    assert report["uncertain"]["n"] >= len(unlike), report
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import fake_py_post
+from benchmarks import (
+    fake_post_file,
+    fake_strain_post_file,
+    write_fake_results,
+)
+
+
+def count_post_open(post, monkeypatch) -> list:
+    """Record the file names py_post opens."""
+    post_open = post.py_post.post_open
+    opened = []
+
+    def counting_post_open(file_name):
+        opened.append(file_name)
+        return post_open(file_name)
+
+    monkeypatch.setattr(post.py_post, "post_open", counting_post_open)
+    return opened
+
+
+def test_sidecars_replace_py_post(post, tmp_path, monkeypatch):
+    opened = count_post_open(post, monkeypatch)
+    directory = str(tmp_path)
+    write_fake_results(directory, 6)
+    file_name = os.path.join(directory, "example_model_4.t16")
+    for intervals in (50, 50, 20):
+        node_targets = post.set_up_node_targets(intervals)
+        expected = post.get_positions(file_name, node_targets)
+        del opened[:]
+        positions = post.get_positions(file_name, node_targets, sidecar=True)
+        assert np.array_equal(positions, expected), intervals
+    assert opened == [], "the sidecar was not used"
+
+    # a new .t16 file replaces the sidecar
+    t_16_file = fake_post_file(300, 4, seed=9)
+    fake_py_post.write_fake_t16(
+        file_name, t_16_file._coordinates, t_16_file._displacements[1:]
+    )
+    expected = post.get_positions(file_name, node_targets)
+    del opened[:]
+    positions = post.get_positions(file_name, node_targets, sidecar=True)
+    assert np.array_equal(positions, expected) and opened == [file_name]
+
+
+def test_strains_come_from_the_sidecar(post, tmp_path, monkeypatch):
+    opened = count_post_open(post, monkeypatch)
+    file_name = str(tmp_path / "example_model_0.t16")
+    t_16_file, corners = fake_strain_post_file(n_incs=2)
+    fake_py_post.write_fake_t16(
+        file_name,
+        t_16_file._coordinates,
+        t_16_file._displacements[1:],
+        connectivity=t_16_file._connectivity,
+        element_tensors={"Total Strain": t_16_file._tensors[1][1:]},
+    )
+    node_targets = post.set_up_node_targets()
+    expected = post.get_positions_and_strains(file_name, node_targets, corners)
+
+    # a sidecar with only the positions gets the strains added
+    post.get_positions(file_name, node_targets, sidecar=True)
+    for n_opened in (1, 0, 0):
+        del opened[:]
+        positions, strains = post.get_positions_and_strains(
+            file_name, node_targets, corners, sidecar=True
+        )
+        assert len(opened) == n_opened
+        assert np.array_equal(positions, expected[0])
+        assert np.array_equal(strains, expected[1], equal_nan=True)
+
+    # the strains are read in the same pass as the positions
+    os.remove(file_name + ".npz")
+    del opened[:]
+    post.get_positions_and_strains(file_name, node_targets, corners, sidecar=True)
+    post.get_positions(file_name, post.set_up_node_targets(20), sidecar=True)
+    assert opened == [file_name]
+
+
+def test_size_cap_deletes_sidecars(post, tmp_path):
+    directory = str(tmp_path)
+    write_fake_results(directory, 6)
+    status = post.post_process_parallel(
+        range(6), directory, 2, sidecar=True, sidecar_max_bytes=0
+    )
+    assert status[0] == "done" and status[5] == "done", status
+    assert not any(name.endswith(".npz") for name in os.listdir(directory))